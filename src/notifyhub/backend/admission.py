@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Lets ``rate`` callers per second through on average and up to
+    ``burst`` at once; the rest wait their turn in arrival order. A rate of
+    0 lets everyone through at once."""
+
+    __slots__ = ("rate", "burst", "_tokens", "_updated", "waited")
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        # Callers that had to wait, since startup
+        self.waited = 0
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # Taking the token before sleeping reserves this caller's turn, so
+        # later callers queue up behind it
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return
+        self.waited += 1
+        try:
+            await asyncio.sleep(-self._tokens / self.rate)
+        except asyncio.CancelledError:
+            self._tokens += 1
+            raise
@@ -1,23 +1,54 @@
-from fastapi import FastAPI, Request
+from fastapi import Body, FastAPI, HTTPException, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
+from starlette.requests import ClientDisconnect, HTTPConnection
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 from sse_starlette.sse import EventSourceResponse
 from contextlib import asynccontextmanager
 from uvicorn import Config, Server
 import asyncio
+import base64
+import binascii
 import typing as tp
 import logging
 import json
 import os
+import random
 import textwrap
+import time
+from itertools import islice
 import traceback
 from datetime import datetime
 
 from confstack import confstackify
 
-from .models import NotificationStore, Notification
+from .admission import TokenBucket
+from .broadcast import Broadcaster, Select, SubscriberOverrun, Subscription
+from .events import (
+    WS_ENCODINGS,
+    Event,
+    SnapshotCache,
+    decode_message,
+    msgpack,
+    sse_frame,
+)
+from .compression import (
+    MIN_COMPRESS_SIZE,
+    compress,
+    compress_chunks,
+    compress_events,
+    negotiate,
+)
+from .models import (
+    NotificationFilter,
+    NotificationStore,
+    Notification,
+    normalize_tag,
+    to_epoch_us,
+)
+from .persistence import NotificationLog
+from .sqlite_store import SQLiteNotificationStore
 from ..config import NotifyHubConfig
 from ..macos_notify import send_macos_notification
 from ..telegram import get_telegram_token, async_send_telegram_message
@@ -28,55 +59,302 @@ from ..bark import (
 )
 
 
+SHUTDOWN = Event("shutdown", json.dumps({"message": "Server shutting down"}))
+SHUTDOWN_FRAME = SHUTDOWN.frame
+# Seconds an SSE stream gets to send the shutdown event once sse-starlette
+# sees the server exiting, before it cancels the stream
+SHUTDOWN_GRACE = 0.5
+
+
+def heartbeat_event() -> Event:
+    return Event("heartbeat", json.dumps({"timestamp": datetime.now().isoformat()}))
+
+
+def event_selector(
+    match: NotificationFilter, encoding: tp.Optional[str] = None
+) -> Select:
+    """Frame selection for one client: with a filter, events carrying
+    notifications reach it only with the ones ``match`` accepts, a batch it
+    wants part of being re-encoded with just that part (deletes, clears,
+    count updates and heartbeats only name IDs and pass through). With an
+    ``encoding`` the client gets WebSocket messages instead of SSE frames."""
+
+    def select(frame: bytes, event: tp.Optional[Event]) -> tp.Optional[bytes]:
+        if match and event is not None and event.records is not None:
+            records = event.records
+            wanted = [r for r in records if match.matches_record(r)]
+            if not wanted:
+                return None
+            if len(wanted) < len(records):
+                event = event.only(wanted)
+                frame = event.frame
+        if encoding is None or event is None:
+            return frame
+        return event.encode(encoding)
+
+    return select
+
+
+def merge_burst(events: tp.List[Event]) -> tp.List[Event]:
+    """A burst of store events, oldest first, with each run of
+    ``notification``/``batch`` events merged into one ``batch`` event
+    holding their notifications newest first, under the run's last event ID.
+    Other events keep their place between the runs."""
+    merged: tp.List[Event] = []
+    run: tp.List[Event] = []
+
+    def flush_run():
+        if len(run) == 1:
+            merged.append(run[0])
+        elif run:
+            # A notification stored again later in the burst replaced itself
+            newest_first, seen = [], set()
+            for event in reversed(run):
+                for record in event.records:
+                    if record.id not in seen:
+                        seen.add(record.id)
+                        newest_first.append(record)
+            merged.append(run[-1].only(newest_first))
+        run.clear()
+
+    for event in events:
+        if event.event in ("notification", "batch") and event.records:
+            run.append(event)
+            continue
+        flush_run()
+        merged.append(event)
+    flush_run()
+    return merged
+
+
+SLOW_CONSUMER_POLICIES = ("disconnect", "drop_oldest", "resync")
+
+
 class SSEManager:
-    def __init__(self, heartbeat_interval=30):
-        self.active_connections: tp.List[asyncio.Queue] = []
+    """Connected SSE clients, each a cursor into one shared ``Broadcaster``
+    ring of encoded frames. ``buffer_size`` frames are kept, so memory is
+    bounded however far a stalled client falls behind; what happens to a
+    client that falls further is the ``slow_consumer_policy``:
+
+    - ``disconnect``: end its stream; it reconnects with its last event ID
+      and catches up from the change log
+    - ``drop_oldest``: skip the frames that were overwritten and carry on
+    - ``resync``: collapse everything it missed into one fresh ``init``
+      snapshot
+
+    Clients that opt into batching read a second ring, ``batched``: an
+    event arriving with no burst under way goes out on it at once and opens
+    a ``batch_window`` second window, and everything arriving within the
+    window goes out at its end, merged by ``merge_burst``. Each merged
+    frame is encoded once for all batching clients.
+
+    When every client reconnects at once, as after a restart, snapshots
+    built for the current store version are shared through ``snapshots``,
+    and building new ones is spread out by ``init_admission`` to
+    ``init_rate`` per second. Clients are told to wait ``retry_ms`` plus a
+    random share of ``retry_jitter_ms`` before reconnecting, so the next
+    storm is spread out too.
+    """
+
+    def __init__(
+        self,
+        heartbeat_interval=30,
+        buffer_size=4096,
+        slow_consumer_policy="disconnect",
+        batch_window=0.02,
+        retry_ms=1000,
+        retry_jitter_ms=4000,
+        init_rate=20.0,
+        init_burst=10,
+    ):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.broadcaster = Broadcaster(buffer_size)
+        self.batched = Broadcaster(buffer_size)
+        self.batch_window = batch_window
+        # Events held for the batching clients while a window is open; None
+        # when no window is
+        self._burst: tp.Optional[tp.List[Event]] = None
         self.heartbeat_interval = heartbeat_interval
+        self.slow_consumer_policy = slow_consumer_policy
+        # Clients disconnected for falling behind, since startup
+        self.slow_disconnects = 0
+        self.closed = False
+        self.retry_ms = retry_ms
+        self.retry_jitter_ms = retry_jitter_ms
+        self.init_admission = TokenBucket(init_rate, init_burst)
+        self.snapshots = SnapshotCache()
+        # Snapshots a client is waiting to build, so others wanting the
+        # same one wait for it rather than for admission of their own
+        self.admitting: tp.Dict[tp.Hashable, asyncio.Event] = {}
+
+    @property
+    def active_connections(self) -> tp.Set[Subscription]:
+        return self.broadcaster.subscriptions | self.batched.subscriptions
+
+    async def connect(
+        self,
+        label: tp.Optional[str] = None,
+        select: tp.Optional[Select] = None,
+        batch: bool = False,
+    ) -> Subscription:
+        if batch:
+            # Events held in an open window are already in the store, and so
+            # in the new client's catch-up; they go out to the others now so
+            # the new subscription starts after them
+            self.release_burst()
+        return (self.batched if batch else self.broadcaster).subscribe(label, select)
+
+    def disconnect(self, subscription: Subscription):
+        subscription.close()
+
+    def retry_hint(self) -> int:
+        """Reconnection delay in milliseconds for one client"""
+        return self.retry_ms + random.randint(0, self.retry_jitter_ms)
+
+    def publish(self, event_data: dict):
+        """Publish an event to every connected client without yielding, so
+        events are delivered in exactly the order the store made them"""
+        event = Event(
+            event_data["event"],
+            event_data["data"],
+            event_data.get("id"),
+            event_data.get("records"),
+        )
+        self.broadcaster.publish(event.frame, event)
+        if not self.batched.subscriptions:
+            return
+        if self._burst is not None:
+            self._burst.append(event)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Published outside the event loop; there is no window to wait for
+            loop = None
+        self.batched.publish(event.frame, event)
+        if loop is not None and self.batch_window > 0:
+            self._burst = []
+            loop.call_later(self.batch_window, self._flush_burst)
+
+    def _flush_burst(self):
+        """Close the batching window; anything held in it goes out merged,
+        and a window that held events is followed by another while the
+        burst lasts"""
+        burst, self._burst = self._burst, None
+        if not burst:
+            return
+        for event in merge_burst(burst):
+            self.batched.publish(event.frame, event)
+        self._burst = []
+        asyncio.get_running_loop().call_later(self.batch_window, self._flush_burst)
 
-    async def connect(self) -> asyncio.Queue:
-        queue = asyncio.Queue()
-        self.active_connections.append(queue)
-        return queue
+    def release_burst(self):
+        """Send what the open window holds now, leaving the window open.
+        Called before a batching client is moved to the newest frame to be
+        sent a snapshot, which already has the held events."""
+        if self._burst:
+            for event in merge_burst(self._burst):
+                self.batched.publish(event.frame, event)
+            self._burst = []
 
-    def disconnect(self, queue: asyncio.Queue):
-        if queue in self.active_connections:
-            self.active_connections.remove(queue)
+    async def run_heartbeats(self):
+        """Publish one heartbeat to every connected client each
+        ``heartbeat_interval`` seconds, so client streams wait on the
+        broadcaster alone instead of each polling a timer"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if self.active_connections:
+                event = heartbeat_event()
+                self.broadcaster.publish(event.frame, event)
+                self.batched.publish(event.frame, event)
+
+    def shutdown(self):
+        """Tell every connected client's stream to end"""
+        if self.closed:
+            return
+        self.closed = True
+        self.release_burst()
+        self._burst = None
+        self.broadcaster.publish(SHUTDOWN.frame, SHUTDOWN)
+        self.batched.publish(SHUTDOWN.frame, SHUTDOWN)
+
+    def stats(self) -> dict:
+        """Per-client lag and drop counters, furthest behind first"""
+        clients = sorted(self.active_connections, key=lambda s: -s.lag)
+        return {
+            "policy": self.slow_consumer_policy,
+            "buffer_size": self.broadcaster.capacity,
+            "slow_disconnects": self.slow_disconnects,
+            "snapshots_built": self.snapshots.built,
+            "snapshots_reused": self.snapshots.reused,
+            "init_waits": self.init_admission.waited,
+            "clients": [
+                {
+                    "client": s.label,
+                    "batched": s.broadcaster is self.batched,
+                    "acked": s.acked,
+                    "lag": s.lag,
+                    "dropped": s.dropped,
+                    "overruns": s.overruns,
+                }
+                for s in clients
+            ],
+        }
 
     async def broadcast(self, event_data: dict):
         """Broadcast event to all connected clients"""
-        disconnected = []
-        for queue in self.active_connections:
-            try:
-                await queue.put(event_data)
-            except Exception as e:
-                logging.error(f"Failed to broadcast to client: {e}")
-                disconnected.append(queue)
-
-        # Clean up disconnected clients
-        for queue in disconnected:
-            self.disconnect(queue)
+        self.publish(event_data)
 
 
 class NotifyRequest(BaseModel):
     id: tp.Optional[str] = None
     data: dict
+    # Seconds until the notification is removed again
+    ttl: tp.Optional[float] = Field(None, gt=0)
+
+
+class DeleteFilter(BaseModel):
+    """Bulk delete filters sent as a JSON body, e.g. for ID lists too long
+    for a query string. Unknown keys are rejected rather than ignored, so a
+    misspelt filter can't turn into deleting everything; ``all`` has to be
+    given to clear the store with a body."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    ids: tp.Optional[tp.List[str]] = None
+    pwd: tp.Optional[str] = None
+    tag: tp.Optional[str] = None
+    start: tp.Optional[datetime] = None
+    end: tp.Optional[datetime] = None
+    all: bool = False
+
+
+# Most notifications a single sweep removes (and so one SSE event carries)
+EXPIRE_BATCH_SIZE = 10000
+
+
+async def sweep_expired(interval: float):
+    """Periodically remove notifications past their age limit or TTL. Each
+    batch goes out as one delete event; a full batch is followed straight
+    away by the next one."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            while len(store.expire(limit=EXPIRE_BATCH_SIZE)) >= EXPIRE_BATCH_SIZE:
+                await asyncio.sleep(0)
+        except Exception as e:
+            logging.error(f"Failed to expire notifications: {e}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(sweep_expired(_sweep_interval))
+    heartbeats = asyncio.create_task(sse_manager.run_heartbeats())
     yield
-    # Shutdown: notify all SSE connections to close
-    for queue in sse_manager.active_connections:
-        try:
-            queue.put_nowait(
-                {
-                    "event": "shutdown",
-                    "data": json.dumps({"message": "Server shutting down"}),
-                }
-            )
-        except:
-            pass
-    sse_manager.active_connections.clear()
+    sweeper.cancel()
+    heartbeats.cancel()
+    store.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -85,11 +363,14 @@ store = NotificationStore(sse_manager=sse_manager)
 _telegram_bot_token: tp.Optional[str] = None
 _telegram_chat_id: str = ""
 _telegram_group_chat_id: str = ""
-_telegram_notify_tags: tp.List[str] = []
+_telegram_notify_tags: tp.FrozenSet[str] = frozenset()
 _macos_notifications_enabled: bool = True
 _bark_device_key: str = ""
 _bark_aes_key: tp.Optional[str] = None
-_bark_notify_tags: tp.List[str] = []
+_bark_notify_tags: tp.FrozenSet[str] = frozenset()
+_sweep_interval: float = 1.0
+# zlib level for negotiated gzip/deflate responses; 0 disables compression
+_compression_level: int = 6
 
 # CORS middleware
 app.add_middleware(
@@ -97,6 +378,13 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag",
+        "X-Notifications-Version",
+        "X-Notifications-Count",
+        "X-Next-Cursor",
+        "X-Prev-Cursor",
+    ],
 )
 
 # Static files and templates setup
@@ -156,151 +444,931 @@ def load_and_transform_template():
         ).strip()
 
 
-@app.post("/api/notify")
-async def notify(request: NotifyRequest):
-    try:
-        data = Notification.model_validate(request.data)
-        custom_id = request.id
-        notification_id = store.add(data, custom_id)
+# Telegram rejects longer messages
+TELEGRAM_MAX_CHARS = 4096
+# Messages listed in a grouped macOS toast or Bark push
+GROUP_PREVIEW_COUNT = 3
+# Most items accepted by one POST /api/notify/batch
+MAX_BATCH_ITEMS = 10000
 
-        message_text = data.message
 
-        tag_match = not _telegram_notify_tags or any(t in message_text for t in _telegram_notify_tags)
+def _split_text(text: str, limit: int) -> tp.List[str]:
+    """Split at line breaks into chunks of at most ``limit`` characters"""
+    chunks: tp.List[str] = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
 
-        telegram_text = f"{data.pwd}\n{message_text}" if data.pwd else message_text
 
-        if tag_match and _telegram_bot_token and _telegram_chat_id:
-            asyncio.create_task(
-                async_send_telegram_message(
-                    token=_telegram_bot_token,
-                    chat_id=_telegram_chat_id,
-                    text=telegram_text,
-                )
-            )
+def _group_text(messages: tp.List[str]) -> str:
+    text = "\n".join(messages[:GROUP_PREVIEW_COUNT])
+    if len(messages) > GROUP_PREVIEW_COUNT:
+        text += f"\n(+{len(messages) - GROUP_PREVIEW_COUNT} more)"
+    return text
 
-        if tag_match and _telegram_bot_token and _telegram_group_chat_id:
-            asyncio.create_task(
-                async_send_telegram_message(
-                    token=_telegram_bot_token,
-                    chat_id=_telegram_group_chat_id,
-                    text=telegram_text,
-                )
-            )
 
-        if _macos_notifications_enabled:
-            send_macos_notification(
-                text=message_text,
-                pwd=data.pwd,
-            )
+def _routed(notification: Notification, tags: tp.FrozenSet[str]) -> bool:
+    """Whether a channel limited to ``tags`` (empty for all) gets ``notification``"""
+    return not tags or not tags.isdisjoint(notification.tags or ())
+
 
-        bark_tag_match = not _bark_notify_tags or any(t in message_text for t in _bark_notify_tags)
+def fan_out(notifications: tp.List[Notification]):
+    """Forward stored notifications to Telegram, macOS and Bark.
+
+    Several notifications are sent as a group: one Telegram message (split
+    at Telegram's length limit), one macOS toast and one Bark push per
+    project, instead of one of each per notification.
+    """
+    if not notifications:
+        return
+
+    telegram_texts = [
+        f"{n.pwd}\n{n.message}" if n.pwd else n.message
+        for n in notifications
+        if _routed(n, _telegram_notify_tags)
+    ]
+    if telegram_texts and _telegram_bot_token:
+        chunks = _split_text("\n\n".join(telegram_texts), TELEGRAM_MAX_CHARS)
+        for chat_id in (_telegram_chat_id, _telegram_group_chat_id):
+            if not chat_id:
+                continue
+            for chunk in chunks:
+                asyncio.create_task(
+                    async_send_telegram_message(
+                        token=_telegram_bot_token,
+                        chat_id=chat_id,
+                        text=chunk,
+                    )
+                )
 
-        if bark_tag_match and _bark_device_key and _bark_aes_key:
-            basename = os.path.basename(data.pwd or "")
+    if _macos_notifications_enabled:
+        pwds = {n.pwd for n in notifications}
+        send_macos_notification(
+            text=_group_text([n.message for n in notifications]),
+            pwd=pwds.pop() if len(pwds) == 1 else None,
+        )
+
+    if _bark_device_key and _bark_aes_key:
+        by_pwd: tp.Dict[tp.Optional[str], tp.List[str]] = {}
+        for n in notifications:
+            if _routed(n, _bark_notify_tags):
+                by_pwd.setdefault(n.pwd, []).append(n.message)
+        for pwd, messages in by_pwd.items():
+            basename = os.path.basename(pwd or "")
             seed = basename[:1].upper() if basename else ""
             icon_url = _get_dicebear_icon_url(seed) if seed else ""
             asyncio.create_task(
                 async_send_bark_notification(
                     device_key=_bark_device_key,
                     title=basename or "NotifyHub",
-                    body=message_text,
+                    body=_group_text(messages),
                     icon_url=icon_url,
                     aes_key=_bark_aes_key,
                 )
             )
 
+
+@app.post("/api/notify")
+async def notify(request: NotifyRequest):
+    try:
+        data = Notification.model_validate(request.data)
+        [(notification_id, is_new)] = store.ingest([(data, request.id, request.ttl)])
+        # Repeats folded in by the coalescing window aren't forwarded again
+        if is_new:
+            fan_out([data])
         return {"success": True, "id": notification_id}
     except Exception as e:
         return {"error": traceback.format_exc().split("\n")}
 
 
-@app.get("/api/notifications")
-async def get_notifications():
-    return [
-        {
-            "id": n.id,
-            "data": n.model_dump(exclude={"id", "timestamp"}),
-            "timestamp": n.timestamp,
+@app.post("/api/notify/batch")
+async def notify_batch(items: tp.List[tp.Any] = Body(...)):
+    """Ingest an array of ``/api/notify`` request bodies in one go.
+
+    Valid items are stored as a single change (one ``batch`` SSE event) and
+    forwarded as a group; invalid ones are skipped, and repeats folded in by
+    the coalescing window are not forwarded again. ``results`` lines up
+    with the request: ``{"success": true, "id": ...}`` or
+    ``{"success": false, "error": ...}`` per item.
+    """
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_BATCH_ITEMS} notifications per batch"
+        )
+    results: tp.List[dict] = []
+    entries = []
+    for item in items:
+        try:
+            request = NotifyRequest.model_validate(item)
+            data = Notification.model_validate(request.data)
+        except ValidationError as e:
+            results.append({"success": False, "error": _validation_message(e)})
+            continue
+        results.append({"success": True})
+        entries.append((data, request.id, request.ttl))
+
+    stored = store.ingest(entries)
+    ids = iter(stored)
+    for result in results:
+        if result["success"]:
+            result["id"] = next(ids)[0]
+    fan_out([data for (data, _, _), (_, is_new) in zip(entries, stored) if is_new])
+    return {
+        "success": len(entries) == len(items),
+        "accepted": len(entries),
+        "results": results,
+    }
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc']) or 'item'}: {e['msg']}"
+        for e in error.errors()
+    )
+
+
+# NDJSON ingest: longest accepted line, and how often progress is acked
+MAX_STREAM_LINE_BYTES = 1024 * 1024
+STREAM_ACK_INTERVAL = 0.5
+STREAM_ACK_LINES = 1000
+# Errors reported per ack; the rest are only counted
+STREAM_ACK_MAX_ERRORS = 100
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse for bodies that read the request as they go.
+
+    On ASGI servers older than spec 2.4 (uvicorn included) the stock class
+    also waits on ``receive()`` for a disconnect, which would swallow request
+    body chunks; here the request stream itself reports the disconnect.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+class _StreamIngest:
+    """Progress of one NDJSON ingest stream"""
+
+    def __init__(self):
+        self.lines = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.last_id: tp.Optional[str] = None
+        self.errors: tp.List[dict] = []
+        self.acked_lines = 0
+        self.acked_at = time.monotonic()
+
+    def reject(self, error: str):
+        self.rejected += 1
+        if len(self.errors) < STREAM_ACK_MAX_ERRORS:
+            self.errors.append({"line": self.lines, "error": error})
+
+    def ingest(self, lines: tp.List[bytes]):
+        """Parse complete lines and store the valid ones as one change"""
+        entries = []
+        for line in lines:
+            if not line.strip():
+                continue
+            self.lines += 1
+            try:
+                request = NotifyRequest.model_validate_json(line)
+                data = Notification.model_validate(request.data)
+            except ValidationError as e:
+                self.reject(_validation_message(e))
+                continue
+            entries.append((data, request.id, request.ttl))
+        if not entries:
+            return
+        stored = store.ingest(entries)
+        fan_out([data for (data, _, _), (_, is_new) in zip(entries, stored) if is_new])
+        self.accepted += len(stored)
+        self.last_id = stored[-1][0]
+
+    def ack_due(self) -> bool:
+        return (
+            self.lines - self.acked_lines >= STREAM_ACK_LINES
+            or time.monotonic() - self.acked_at >= STREAM_ACK_INTERVAL
+        )
+
+    def ack(self, done: bool = False) -> bytes:
+        ack = {
+            "ack": self.lines,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "last_id": self.last_id,
+            "errors": self.errors,
         }
-        for n in store.notifications
-    ]
+        if done:
+            ack["done"] = True
+        self.errors = []
+        self.acked_lines = self.lines
+        self.acked_at = time.monotonic()
+        return json.dumps(ack, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+async def _ingest_ndjson(request: Request) -> tp.AsyncIterator[bytes]:
+    progress = _StreamIngest()
+    buffer = b""
+    # Inside a line that was too long, dropping bytes until its newline
+    skipping = False
+    try:
+        async for chunk in request.stream():
+            lines = (buffer + chunk).split(b"\n")
+            buffer = lines.pop()
+            if skipping and lines:
+                lines.pop(0)
+                skipping = False
+            progress.ingest(lines)
+            if len(buffer) > MAX_STREAM_LINE_BYTES:
+                if not skipping:
+                    progress.lines += 1
+                    progress.reject(f"Line longer than {MAX_STREAM_LINE_BYTES} bytes")
+                    skipping = True
+                buffer = b""
+            if progress.ack_due():
+                yield progress.ack()
+            # Let SSE clients and other requests run between chunks; reading
+            # only as fast as we store keeps the producer throttled by TCP
+            await asyncio.sleep(0)
+    except ClientDisconnect:
+        logging.info(
+            f"NDJSON producer disconnected after {progress.lines} lines "
+            f"({progress.accepted} accepted)"
+        )
+        return
+    if not skipping:
+        progress.ingest([buffer])
+    yield progress.ack(done=True)
+
+
+@app.post("/api/notify/stream")
+async def notify_stream(request: Request):
+    """Ingest newline-delimited ``/api/notify`` bodies over one long-lived
+    request.
+
+    Lines are parsed as they arrive and go through the same store and
+    fan-out as ``/api/notify``; the lines that arrive together are stored as
+    one change. The response is NDJSON as well: progress acks
+    ``{"ack": lines, "accepted", "rejected", "last_id", "errors"}`` at most
+    every ``STREAM_ACK_INTERVAL`` seconds or ``STREAM_ACK_LINES`` lines, and
+    a final one with ``"done": true``.
+    """
+    return DuplexStreamingResponse(
+        _ingest_ndjson(request), media_type="application/x-ndjson"
+    )
+
+
+def _json_array(items: tp.Iterable[bytes]) -> bytes:
+    return b"[" + b",".join(items) + b"]"
+
+
+def _iter_json_array(items: tp.Iterator[bytes], chunk_size: int = 256) -> tp.Iterator[bytes]:
+    """Stream a JSON array from pre-encoded items, a chunk of items per write"""
+    yield b"["
+    first = True
+    while True:
+        chunk = b",".join(islice(items, chunk_size))
+        if not chunk:
+            break
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]"
+
+
+def _encoding_for(request: Request) -> tp.Optional[str]:
+    if not _compression_level:
+        return None
+    return negotiate(request.headers.get("accept-encoding"))
+
+
+def _body_response(request: Request, body: bytes, headers: dict) -> Response:
+    """A JSON response, compressed if the client accepts it and it is large
+    enough to be worth it"""
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    encoding = _encoding_for(request) if len(body) >= MIN_COMPRESS_SIZE else None
+    if encoding:
+        body = compress(body, encoding, _compression_level)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _encode_cursor(seq: int) -> str:
+    return base64.urlsafe_b64encode(str(seq).encode()).rstrip(b"=").decode()
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _etag_matches(if_none_match: tp.Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+@app.api_route("/api/notifications", methods=["GET", "HEAD"])
+async def get_notifications(
+    request: Request,
+    limit: tp.Optional[int] = None,
+    before: tp.Optional[str] = None,
+    after: tp.Optional[str] = None,
+    pwd: tp.Optional[str] = None,
+    tag: tp.Optional[str] = None,
+):
+    """List notifications newest first, optionally only project ``pwd``'s
+    and/or those tagged ``tag``.
+
+    With ``limit``/``before``/``after`` one page is returned; the
+    ``X-Next-Cursor`` (older) and ``X-Prev-Cursor`` (newer) headers carry
+    cursors for the neighbouring pages. Without them the whole store is
+    streamed.
+
+    Responses carry a weak ``ETag`` derived from the store version, as the
+    gzip, deflate and identity bodies of one version share it; a matching
+    ``If-None-Match`` gets a bodiless 304. ``HEAD`` returns only the
+    ``X-Notifications-Version`` / ``X-Notifications-Count`` headers.
+    """
+    etag = f'"{store.etag}"'
+    version_headers = {
+        "ETag": f"W/{etag}",
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache",
+        "X-Notifications-Version": store.etag,
+        "X-Notifications-Count": str(store.count(pwd, tag)),
+    }
+    if request.method == "HEAD":
+        return Response(headers=version_headers)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=version_headers)
+
+    if limit is None and before is None and after is None:
+        # Streamed straight from the store so large histories are never held
+        # in memory as one response
+        body = _iter_json_array(store.iter_items_json(pwd, tag))
+        headers = dict(version_headers)
+        encoding = _encoding_for(request)
+        if encoding:
+            body = compress_chunks(body, encoding, _compression_level)
+            headers["Content-Encoding"] = encoding
+        return StreamingResponse(body, media_type="application/json", headers=headers)
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    page = store.page(
+        limit=limit if limit is not None else store.count(pwd, tag),
+        before=_decode_cursor(before) if before is not None else None,
+        after=_decode_cursor(after) if after is not None else None,
+        pwd=pwd,
+        tag=tag,
+    )
+    headers = dict(version_headers)
+    if page.older is not None:
+        headers["X-Next-Cursor"] = _encode_cursor(page.older)
+    if page.newer is not None:
+        headers["X-Prev-Cursor"] = _encode_cursor(page.newer)
+    return _body_response(request, _json_array(page.items), headers)
+
+
+@app.get("/api/projects")
+async def get_projects():
+    """Projects with stored notifications, most recently active first"""
+    return [project._asdict() for project in store.projects()]
+
+
+@app.get("/api/search")
+async def search_notifications(
+    q: str,
+    pwd: tp.Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+):
+    """Ranked full-text search over messages; every query word matches as a
+    prefix. Returns ``{"total": n, "results": [...]}``."""
+    if limit < 1 or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid limit or offset")
+    total, results = store.search(q, pwd=pwd, limit=limit, offset=offset)
+    return Response(
+        content=b'{"total": %d, "results": %s}' % (total, _json_array(results)),
+        media_type="application/json",
+    )
+
+
+def _epoch_us(timestamp: tp.Optional[datetime]) -> tp.Optional[int]:
+    return to_epoch_us(timestamp.isoformat()) if timestamp is not None else None
 
 
 @app.delete("/api/notifications")
-async def delete_notifications(id: tp.Optional[str] = None):
-    """Delete notifications - all if no id provided, specific if id given"""
+async def delete_notifications(
+    id: tp.Optional[str] = None,
+    pwd: tp.Optional[str] = None,
+    tag: tp.Optional[str] = None,
+    start: tp.Optional[datetime] = None,
+    end: tp.Optional[datetime] = None,
+    filters: tp.Optional[DeleteFilter] = Body(None),
+):
+    """Delete notifications - all if nothing is given (or a body of
+    ``{"all": true}``), one if only an id is.
+
+    Otherwise every notification matching all of ``pwd``, ``tag``, the
+    ``start`` (inclusive) to ``end`` timestamp range and an ``ids`` list
+    is deleted in one go and broadcast as a single delete event. Filters
+    can also come as a JSON body; query parameters take precedence. A body
+    with neither a filter nor ``all`` is rejected.
+    """
+    body = filters or DeleteFilter()
+    ids = body.ids
+    if id:
+        ids = [id, *(ids or [])]
+    pwd = pwd if pwd is not None else body.pwd
+    tag = tag if tag is not None else body.tag
+    start = start if start is not None else body.start
+    end = end if end is not None else body.end
+    if body.ids is not None or any(f is not None for f in (pwd, tag, start, end)):
+        deleted = store.delete_where(
+            ids=ids, pwd=pwd, tag=tag, start_us=_epoch_us(start), end_us=_epoch_us(end)
+        )
+        return {
+            "success": True,
+            "ids": deleted,
+            "message": f"{len(deleted)} notifications deleted",
+        }
     if id:
         # Delete specific notification
+        # The store broadcasts the delete/clear event itself
         if store.delete_by_id(id):
-            # Broadcast delete event with ID
-            await sse_manager.broadcast(
-                {
-                    "event": "delete",
-                    "data": json.dumps(
-                        {"id": id, "message": f"Notification {id} deleted"}
-                    ),
-                }
-            )
             return {"success": True, "message": f"Notification {id} deleted"}
         else:
             # Notification not found
-            from fastapi import HTTPException
-
             raise HTTPException(status_code=404, detail="Notification not found")
     else:
+        if filters is not None and not filters.all:
+            raise HTTPException(
+                status_code=400,
+                detail='No filter given; send {"all": true} to delete everything',
+            )
         # Clear all notifications (existing behavior)
         store.clear_all()
-        await sse_manager.broadcast(
-            {
-                "event": "clear",
-                "data": json.dumps({"message": "All notifications cleared"}),
-            }
-        )
         return {"success": True, "message": "All notifications cleared"}
 
 
+def _parse_since(change_id: tp.Optional[str]) -> tp.Optional[int]:
+    """Version to resume from, or None when a full snapshot is needed"""
+    if not change_id:
+        return None
+    try:
+        return store.parse_change_id(change_id)
+    except ValueError:
+        return None
+
+
+@app.get("/api/notifications/changes")
+async def get_changes(request: Request, since: str):
+    """Changes after the ``since`` version (an SSE event ID or a previous
+    ``version``), or the full list with ``reset: true`` when the change log
+    no longer reaches back that far"""
+    try:
+        version = store.parse_change_id(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since")
+    changes = store.changes_since(version) if version is not None else None
+
+    head = b'{"version": ' + json.dumps(store.etag).encode("utf-8")
+    if changes is None:
+        body = (
+            head
+            + b', "reset": true, "notifications": '
+            + _json_array(store.iter_items_json())
+            + b"}"
+        )
+    else:
+        body = (
+            head
+            + b', "reset": false, "changes": '
+            + _json_array(
+                b'{"id": "%s", "event": "%s", "data": %s}'
+                % (
+                    store.change_id(change.version).encode("utf-8"),
+                    change.event.encode("utf-8"),
+                    change.data,
+                )
+                for change in changes
+            )
+            + b"}"
+        )
+    return _body_response(request, body, {})
+
+
+def _init_event(match: tp.Optional[NotificationFilter] = None) -> Event:
+    """The full snapshot, or the part ``match`` accepts, assembled from the
+    cached per-notification JSON"""
+    items = store.iter_items_json_where(match) if match else store.iter_items_json()
+    return Event("init", _json_array(items), store.etag)
+
+
+class InitRequest(tp.NamedTuple):
+    """How a client wants its snapshot: only the newest ``limit``
+    notifications and/or those newer than sequence number ``after``, in
+    ``init_chunk`` events of ``page`` notifications instead of one ``init``"""
+
+    limit: tp.Optional[int] = None
+    after: tp.Optional[int] = None
+    page: tp.Optional[int] = None
+
+
+def _init_request(connection: HTTPConnection) -> InitRequest:
+    params = connection.query_params
+    try:
+        limit, page = (
+            int(params[name]) if params.get(name) else None
+            for name in ("init_limit", "init_page")
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid init_limit or init_page")
+    if (limit is not None and limit < 1) or (page is not None and page < 1):
+        raise HTTPException(status_code=400, detail="init_limit and init_page must be positive")
+    after = params.get("init_after")
+    return InitRequest(limit, _decode_cursor(after) if after else None, page)
+
+
+def _init_events(match: NotificationFilter, init: InitRequest) -> tp.Iterator[Event]:
+    """The snapshot a client starts from, as ``init`` or as ``init_chunk``
+    events followed by ``init_done``. Which notifications it holds is
+    fixed here; chunks are serialized one at a time as they are sent."""
+    if init == InitRequest():
+        return iter([_init_event(match)])
+    etag = store.etag
+    limit = init.limit
+    # One more than the limit tells whether older notifications are left
+    items = store.snapshot(match or None, None if limit is None else limit + 1, init.after)
+    if init.page is None:
+        picked = islice(items, limit)
+        return iter([Event("init", _json_array(item for _, item in picked), etag)])
+    return _init_chunks(items, init, etag)
+
+
+def _init_chunks(
+    items: tp.Iterator[tp.Tuple[int, bytes]], init: InitRequest, etag: str
+) -> tp.Iterator[Event]:
+    """``init_chunk`` events of up to ``init.page`` notifications, newest
+    first, then ``init_done`` with the event ID to resume from, the number
+    sent and ``/api/notifications`` cursors: ``older`` when ``init.limit``
+    left notifications out, ``newer`` (the newest sent) for a later
+    ``?init_after=``"""
+    sent, newest, oldest = 0, None, None
+    while init.limit is None or sent < init.limit:
+        size = init.page if init.limit is None else min(init.page, init.limit - sent)
+        chunk = list(islice(items, size))
+        if not chunk:
+            break
+        if newest is None:
+            newest = chunk[0][0]
+        oldest = chunk[-1][0]
+        sent += len(chunk)
+        yield Event("init_chunk", _json_array(item for _, item in chunk))
+    if newest is None:
+        newest = init.after
+    more = next(items, None) is not None
+    done = {
+        "count": sent,
+        "older": _encode_cursor(oldest) if more and oldest is not None else None,
+        "newer": _encode_cursor(newest) if newest is not None else None,
+    }
+    yield Event("init_done", json.dumps(done), etag)
+
+
+def _snapshot_key(match: NotificationFilter, init: InitRequest) -> tp.Hashable:
+    return match.pwd_prefix, match.tags, match.min_priority, init
+
+
+async def _admit(since: tp.Optional[int], match: NotificationFilter, init: InitRequest):
+    """Wait for ``sse_manager.init_admission`` if this client needs a
+    snapshot nobody has built for the current store version yet. Clients
+    resuming from the change log or served a shared snapshot go ahead, and
+    those wanting one another client is waiting to build wait for that."""
+    if since is not None and store.changes_since(since) is not None:
+        return
+    while True:
+        snapshot = (store.etag, _snapshot_key(match, init))
+        if snapshot in sse_manager.snapshots:
+            return
+        building = sse_manager.admitting.get(snapshot)
+        if building is None:
+            break
+        await building.wait()
+    building = sse_manager.admitting[snapshot] = asyncio.Event()
+    try:
+        await sse_manager.init_admission.acquire()
+    finally:
+        # Waiters run after this client has built the snapshot, as nothing
+        # in between awaits
+        del sse_manager.admitting[snapshot]
+        building.set()
+
+
+def _catch_up(
+    since: tp.Optional[int], match: NotificationFilter, init: InitRequest = InitRequest()
+) -> tp.Iterable[Event]:
+    """What a client subscribing now has missed: the changes after version
+    ``since``, or the snapshot without one or when the change log no
+    longer reaches back that far. Must be called right after subscribing,
+    with no await in between, so every later change is read from the ring
+    and every earlier one is in what this returns."""
+    missed = store.changes_since(since) if since is not None else None
+    if missed is None:
+        return sse_manager.snapshots.get(
+            store.etag, _snapshot_key(match, init), lambda: _init_events(match, init)
+        )
+    return [
+        Event(change.event, change.data, store.change_id(change.version), change.records)
+        for change in missed
+    ]
+
+
+def _recover(
+    subscription: Subscription, error: SubscriberOverrun, resync: tp.Callable[[], bytes]
+) -> tp.Optional[tp.List[bytes]]:
+    """Apply the slow-consumer policy to a subscription that overran: what
+    to send in place of the frames it lost, or None to disconnect it (it
+    then resumes from the change log with its last event ID)"""
+    policy = sse_manager.slow_consumer_policy
+    logging.warning(f"Client {subscription.label} fell behind ({error}): {policy}")
+    if policy == "disconnect" or sse_manager.closed:
+        sse_manager.slow_disconnects += 1
+        return None
+    if policy == "drop_oldest":
+        subscription.skip(subscription.broadcaster.oldest)
+        return subscription.pending()
+    # Taken with no await after skipping, like on connect
+    if subscription.broadcaster is sse_manager.batched:
+        sse_manager.release_burst()
+    subscription.skip(subscription.broadcaster.head)
+    return [resync()]
+
+
+def _flag(connection: HTTPConnection, name: str) -> bool:
+    return connection.query_params.get(name, "").lower() in ("1", "true", "yes")
+
+
+def _client_label(connection: HTTPConnection) -> tp.Optional[str]:
+    client = connection.client
+    return f"{client.host}:{client.port}" if client else None
+
+
+def _event_filter(request: HTTPConnection) -> NotificationFilter:
+    params = request.query_params
+    min_priority = params.get("min_priority")
+    try:
+        min_priority = float(min_priority) if min_priority else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid min_priority")
+    return NotificationFilter(
+        params.get("pwd"), map(normalize_tag, params.getlist("tag")), min_priority
+    )
+
+
+@app.get("/api/sse/clients")
+async def get_sse_clients():
+    """Connected SSE clients with how far behind each is and what it lost"""
+    return sse_manager.stats()
+
+
 @app.get("/events")
-async def events():
-    """SSE endpoint for real-time notifications"""
-    queue = await sse_manager.connect()
+async def events(request: Request, last_event_id: tp.Optional[str] = None):
+    """SSE endpoint for real-time notifications.
+
+    Clients resuming with ``Last-Event-ID`` (or ``?last_event_id=``) only get
+    the changes they missed; the full ``init`` snapshot is the fallback.
+
+    ``?pwd=`` (a project path prefix; the project and those below it),
+    ``?tag=`` (repeatable; any of them) and ``?min_priority=`` limit the stream, snapshot included, to matching
+    notifications. The filter runs on the server, before anything is
+    written to the client.
+
+    ``?batch=1`` merges bursts of notifications into single ``batch``
+    events (see ``SSEManager``); a lone event is still sent at once.
+
+    ``?init_limit=N`` cuts the snapshot to the newest N notifications and
+    ``?init_after=`` (a cursor from ``/api/notifications`` or ``init_done``)
+    to those newer than it. ``?init_page=N`` streams it as ``init_chunk``
+    events of N notifications, serialized one at a time, ended by
+    ``init_done`` (see ``_init_chunks``); a resync after overrunning still
+    sends one ``init``.
+
+    The first heartbeat and the ``shutdown`` event carry a jittered
+    ``retry:`` delay, and snapshots are shared and rate limited (see
+    ``SSEManager``) so a restart's reconnects don't all build one at once.
+
+    With ``Accept-Encoding: gzip`` or ``deflate`` the stream goes through
+    one compression context per connection, flushed after every event.
+    """
+    match = _event_filter(request)
+    init = _init_request(request)
+    select = event_selector(match) if match else None
+    since = _parse_since(request.headers.get("last-event-id") or last_event_id)
+    await _admit(since, match, init)
+    subscription = await sse_manager.connect(
+        _client_label(request), select, _flag(request, "batch")
+    )
+    missed = _catch_up(since, match, init)
 
     async def event_generator():
         try:
-            # Send current notifications on connect
-            current_notifications = [
-                {
-                    "id": n.id,
-                    "data": n.model_dump(exclude={"id", "timestamp"}),
-                    "timestamp": n.timestamp,
-                }
-                for n in store.notifications
-            ]
-            yield {"event": "init", "data": json.dumps(current_notifications)}
+            for event in missed:
+                frame = event.frame if select is None else select(event.frame, event)
+                if frame is not None:
+                    yield frame
 
-            heartbeat_count = 0
+            # Later heartbeats come through the broadcaster with the events;
+            # this one also sets the client's reconnection delay
+            heartbeat = heartbeat_event()
+            yield sse_frame(heartbeat.event, heartbeat.data, retry=sse_manager.retry_hint())
             while True:
-                # Send heartbeat every heartbeat_interval seconds
-                if heartbeat_count % sse_manager.heartbeat_interval == 0:
-                    yield {
-                        "event": "heartbeat",
-                        "data": json.dumps({"timestamp": datetime.now().isoformat()}),
-                    }
-
-                # Wait for new events or timeout for heartbeat
                 try:
-                    event_data = await asyncio.wait_for(queue.get(), timeout=1.0)
-                    if event_data.get("event") == "shutdown":
-                        break
-                    yield event_data
-                except asyncio.TimeoutError:
-                    heartbeat_count += 1
-                    continue
+                    frames = await subscription.next()
+                except SubscriberOverrun as e:
+                    frames = _recover(subscription, e, lambda: _init_event(match).frame)
+                    if frames is None:
+                        return
+                for frame in frames:
+                    if frame is SHUTDOWN_FRAME:
+                        # With a fresh delay, so the restart's reconnects
+                        # spread out
+                        yield sse_frame(
+                            SHUTDOWN.event, SHUTDOWN.data, retry=sse_manager.retry_hint()
+                        )
+                        return
+                    yield frame
+
+        finally:
+            sse_manager.disconnect(subscription)
 
-        except asyncio.CancelledError:
-            sse_manager.disconnect(queue)
-            raise
+    encoding = _encoding_for(request)
+    if encoding is None:
+        return EventSourceResponse(event_generator(), shutdown_grace_period=SHUTDOWN_GRACE)
+    # The library's own pings would bypass the compressor; the heartbeats
+    # keep the connection alive instead
+    return EventSourceResponse(
+        compress_events(event_generator(), encoding, _compression_level),
+        headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        ping=0,
+        shutdown_grace_period=SHUTDOWN_GRACE,
+    )
 
-    return EventSourceResponse(event_generator())
+
+@app.websocket("/ws")
+async def websocket_events(websocket: WebSocket):
+    """The ``/events`` stream over a WebSocket, read from the same
+    broadcaster, in a compact encoding: ``?encoding=msgpack`` (binary
+    frames; the default when msgpack is installed) or ``json`` (text
+    frames). Every message is ``{"event", "id", "data"}`` with the same
+    events and data as SSE; ``?pwd=``, ``?tag=``, ``?min_priority=``,
+    ``?batch=1``, ``?init_*=`` and ``?last_event_id=`` work as they do
+    there.
+
+    Clients send commands in the same encoding, each with an optional
+    ``ref`` echoed in the ``reply`` event that answers it:
+
+    - ``{"op": "delete", "id": ...}`` or ``{"op": "delete", "ids": [...]}``
+    - ``{"op": "ack", "id": event_id}`` records how far the client has
+      processed, as shown by ``/api/sse/clients``
+    - ``{"op": "subscribe", "pwd", "tags", "min_priority"}`` replaces the
+      filter and sends a fresh ``init`` for it
+    """
+    params = websocket.query_params
+    encoding = params.get("encoding") or ("msgpack" if msgpack else "json")
+    if encoding not in WS_ENCODINGS or (encoding == "msgpack" and msgpack is None):
+        await websocket.close(code=1008, reason=f"Unsupported encoding: {encoding}")
+        return
+    try:
+        match = _event_filter(websocket)
+        init = _init_request(websocket)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    await websocket.accept()
+
+    since = _parse_since(params.get("last_event_id"))
+    await _admit(since, match, init)
+    subscription = await sse_manager.connect(
+        _client_label(websocket), event_selector(match, encoding), _flag(websocket, "batch")
+    )
+    missed = _catch_up(since, match, init)
+    shutdown = SHUTDOWN.encode(encoding)
+    # Replies and deliveries are sent under one lock so a new filter's
+    # init never interleaves with events selected by the old one
+    lock = asyncio.Lock()
+
+    async def send(message: bytes):
+        if encoding == "msgpack":
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_text(message.decode("utf-8"))
+
+    async def deliver():
+        async with lock:
+            for event in missed:
+                message = subscription.select(event.frame, event)
+                if message is not None:
+                    await send(message)
+            await send(heartbeat_event().encode(encoding))
+        while True:
+            await subscription.broadcaster.wait(subscription.cursor)
+            async with lock:
+                try:
+                    messages = subscription.pending()
+                except SubscriberOverrun as e:
+                    messages = _recover(
+                        subscription, e, lambda: _init_event(match).encode(encoding)
+                    )
+                    if messages is None:
+                        await websocket.close(code=1013)
+                        return
+                for message in messages:
+                    if message is shutdown:
+                        # With a reconnection delay, as SSE clients get in
+                        # their retry: field
+                        data = {**json.loads(SHUTDOWN.data), "retry": sse_manager.retry_hint()}
+                        await send(Event(SHUTDOWN.event, json.dumps(data)).encode(encoding))
+                        await websocket.close(code=1012)
+                        return
+                    await send(message)
+
+    async def receive():
+        nonlocal match
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            raw = message.get("bytes")
+            reply: tp.Dict[str, tp.Any] = {}
+            try:
+                command = decode_message(raw if raw is not None else message["text"], encoding)
+                reply["ref"] = command.get("ref")
+                op = command.get("op")
+                if op == "delete":
+                    if "ids" in command:
+                        reply["deleted"] = store.delete_where(ids=map(str, command["ids"]))
+                    else:
+                        notification_id = str(command["id"])
+                        deleted = store.delete_by_id(notification_id)
+                        reply["deleted"] = [notification_id] if deleted else []
+                elif op == "ack":
+                    subscription.acked = command.get("id")
+                elif op == "subscribe":
+                    min_priority = command.get("min_priority")
+                    new_match = NotificationFilter(
+                        command.get("pwd"),
+                        map(normalize_tag, command.get("tags") or ()),
+                        float(min_priority) if min_priority is not None else None,
+                    )
+                    async with lock:
+                        match = new_match
+                        subscription.select = event_selector(match, encoding)
+                        # The snapshot covers everything published until now,
+                        # including any burst still held for batching clients
+                        if subscription.broadcaster is sse_manager.batched:
+                            sse_manager.release_burst()
+                        subscription.cursor = subscription.broadcaster.head
+                        await send(_init_event(match).encode(encoding))
+                else:
+                    raise ValueError(f"Unknown op: {op!r}")
+                reply["ok"] = True
+            except Exception as e:
+                reply.update(ok=False, error=str(e))
+            async with lock:
+                await send(Event("reply", json.dumps(reply)).encode(encoding))
+
+    tasks = [asyncio.create_task(deliver()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        sse_manager.disconnect(subscription)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -309,17 +1377,88 @@ async def root():
     return HTMLResponse(html_content)
 
 
+class NotifyHubServer(Server):
+    """uvicorn server that sends the ``shutdown`` event as soon as it is
+    told to exit. uvicorn drains connections before the lifespan shutdown
+    runs, and sse-starlette cancels streams when it sees the exit, so the
+    event has to go out from the signal handler."""
+
+    async def serve(self, sockets=None):
+        self._loop = asyncio.get_running_loop()
+        await super().serve(sockets)
+
+    def handle_exit(self, sig, frame):
+        loop = getattr(self, "_loop", None)
+        if loop is not None:
+            loop.call_soon_threadsafe(sse_manager.shutdown)
+        super().handle_exit(sig, frame)
+
+
 def main():
     config: NotifyHubConfig = confstackify(NotifyHubConfig, "notifyhub")
 
-    global sse_manager, store, _telegram_bot_token, _telegram_chat_id, _telegram_group_chat_id, _telegram_notify_tags, _macos_notifications_enabled, _bark_device_key, _bark_aes_key, _bark_notify_tags
-    sse_manager = SSEManager(heartbeat_interval=config.backend.sse_heartbeat_interval)
-    store = NotificationStore(
-        sse_manager=sse_manager, max_count=config.backend.notifications_max_count
+    global sse_manager, store, _telegram_bot_token, _telegram_chat_id, _telegram_group_chat_id, _telegram_notify_tags, _macos_notifications_enabled, _bark_device_key, _bark_aes_key, _bark_notify_tags, _sweep_interval, _compression_level
+    sse_manager = SSEManager(
+        heartbeat_interval=config.backend.sse_heartbeat_interval,
+        buffer_size=config.backend.sse_buffer_size,
+        slow_consumer_policy=config.backend.sse_slow_consumer_policy,
+        batch_window=config.backend.sse_batch_window_ms / 1000,
+        retry_ms=config.backend.sse_retry_ms,
+        retry_jitter_ms=config.backend.sse_retry_jitter_ms,
+        init_rate=config.backend.sse_init_rate,
+        init_burst=config.backend.sse_init_burst,
+    )
+    change_log_size = config.backend.sse_change_log_size
+    store_options = dict(
+        max_bytes=config.backend.notifications_max_bytes,
+        max_age=config.backend.notifications_max_age,
+        coalesce_window=config.backend.notifications_coalesce_window,
+        project_max_count=config.backend.notifications_project_max_count,
+        project_max_bytes=config.backend.notifications_project_max_bytes,
     )
+    _sweep_interval = config.backend.notifications_sweep_interval
+    _compression_level = config.backend.compression_level
+    if config.backend.notifications_storage == "sqlite":
+        store = SQLiteNotificationStore(
+            path=config.backend.notifications_db_path,
+            sse_manager=sse_manager,
+            max_count=config.backend.notifications_max_count,
+            change_log_size=change_log_size,
+            **store_options,
+        )
+        logging.info(
+            f"Using SQLite notification storage at {config.backend.notifications_db_path} "
+            f"({len(store)} notifications)"
+        )
+    else:
+        log = None
+        if config.backend.notifications_log_dir:
+            log = NotificationLog(
+                directory=config.backend.notifications_log_dir,
+                fsync_interval_ms=config.backend.notifications_log_fsync_ms,
+                segment_max_bytes=config.backend.notifications_log_segment_bytes,
+                compact_after_segments=config.backend.notifications_log_compact_segments,
+            )
+        store = NotificationStore(
+            sse_manager=sse_manager,
+            max_count=config.backend.notifications_max_count,
+            log=log,
+            change_log_size=change_log_size,
+            **store_options,
+        )
+        if log:
+            t0 = time.monotonic()
+            store.restore(log.replay())
+            log.open()
+            logging.info(
+                f"Restored {len(store)} notifications from {log.directory} "
+                f"in {(time.monotonic() - t0)*1000:.0f}ms"
+            )
     _telegram_chat_id = config.backend.telegram_chat_id
     _telegram_group_chat_id = config.backend.telegram_group_chat_id
-    _telegram_notify_tags = config.backend.telegram_notify_tags
+    _telegram_notify_tags = frozenset(
+        map(normalize_tag, config.backend.telegram_notify_tags)
+    )
     _macos_notifications_enabled = config.backend.macos_notifications_enabled
     if _macos_notifications_enabled:
         logging.info("macOS notifications enabled")
@@ -343,7 +1482,9 @@ def main():
             )
 
     _bark_device_key = config.backend.bark_device_key
-    _bark_notify_tags = config.backend.bark_notify_tags
+    _bark_notify_tags = frozenset(
+        map(normalize_tag, config.backend.bark_notify_tags)
+    )
     if _bark_device_key:
         _bark_aes_key = get_bark_aes_key()
         if _bark_aes_key:
@@ -360,7 +1501,7 @@ def main():
         port=config.backend.port,
         timeout_graceful_shutdown=1,
     )
-    server = Server(uvicorn_config)
+    server = NotifyHubServer(uvicorn_config)
     server.run()
 
 
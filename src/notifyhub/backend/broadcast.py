@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import typing as tp
+
+
+class SubscriberOverrun(Exception):
+    """A subscriber fell more than the ring's capacity behind and lost frames"""
+
+
+class Broadcaster:
+    """Fans pre-encoded frames out through one shared ring buffer.
+
+    Frames are numbered in publish order and frame ``n`` lives in slot
+    ``n % capacity``. A subscriber is only a read cursor (the number of the
+    next frame it wants), so publishing writes one slot and sets one shared
+    event no matter how many subscribers are attached, and nothing is copied
+    or queued per subscriber. A subscriber more than ``capacity`` frames
+    behind has lost frames and gets ``SubscriberOverrun`` on its next read.
+
+    Each frame can be published with a ``subject`` describing what it is
+    about; subscriptions with a ``select`` function see it and can drop or
+    rewrite the frame before it is returned to them.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._ring: tp.List[tp.Optional[bytes]] = [None] * capacity
+        self._subjects: tp.List[tp.Any] = [None] * capacity
+        # Number of the next frame to be published
+        self.head = 0
+        # Created by the first subscriber to wait after a publish and set by
+        # the next publish, so an idle broadcaster allocates nothing
+        self._wakeup: tp.Optional[asyncio.Event] = None
+        self.subscriptions: tp.Set[Subscription] = set()
+
+    def publish(self, frame: bytes, subject: tp.Any = None):
+        slot = self.head % self.capacity
+        self._ring[slot] = frame
+        self._subjects[slot] = subject
+        self.head += 1
+        wakeup = self._wakeup
+        if wakeup is not None:
+            self._wakeup = None
+            wakeup.set()
+
+    @property
+    def oldest(self) -> int:
+        """Number of the oldest frame still in the ring"""
+        return max(0, self.head - self.capacity)
+
+    def subscribe(
+        self,
+        label: tp.Optional[str] = None,
+        select: tp.Optional[Select] = None,
+    ) -> Subscription:
+        """A subscription that receives every frame published from now on,
+        or what ``select`` makes of each"""
+        subscription = Subscription(self, self.head, label, select)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def read(self, cursor: int) -> tp.List[bytes]:
+        """Frames numbered ``cursor`` up to the head, oldest first"""
+        return self._slice(self._ring, cursor)
+
+    def read_subjects(self, cursor: int) -> tp.List[tp.Any]:
+        """The subjects of ``read(cursor)``'s frames"""
+        return self._slice(self._subjects, cursor)
+
+    def _slice(self, ring: tp.List, cursor: int) -> tp.List:
+        head = self.head
+        if head - cursor > self.capacity:
+            raise SubscriberOverrun(
+                f"{head - cursor - self.capacity} frames were overwritten"
+            )
+        if cursor == head:
+            return []
+        start, end = cursor % self.capacity, head % self.capacity
+        if start < end:
+            return ring[start:end]
+        return ring[start:] + ring[:end]
+
+    async def wait(self, cursor: int):
+        """Return once frame number ``cursor`` has been published"""
+        while self.head <= cursor:
+            if self._wakeup is None:
+                self._wakeup = asyncio.Event()
+            await self._wakeup.wait()
+
+
+# The frame to deliver for a published frame and its subject, or None to skip
+Select = tp.Callable[[bytes, tp.Any], tp.Optional[bytes]]
+
+
+class Subscription:
+    """One subscriber's read cursor into a ``Broadcaster``, with counters of
+    how far behind it is and how many frames it has lost"""
+
+    __slots__ = (
+        "_broadcaster",
+        "cursor",
+        "label",
+        "select",
+        "dropped",
+        "overruns",
+        "acked",
+    )
+
+    def __init__(
+        self,
+        broadcaster: Broadcaster,
+        cursor: int,
+        label: tp.Optional[str] = None,
+        select: tp.Optional[Select] = None,
+    ):
+        self._broadcaster = broadcaster
+        self.cursor = cursor
+        self.label = label
+        self.select = select
+        # Frames skipped over after overruns, and how many overruns there were
+        self.dropped = 0
+        self.overruns = 0
+        # Last event ID the client confirmed processing, if it acks at all
+        self.acked: tp.Optional[str] = None
+
+    @property
+    def broadcaster(self) -> Broadcaster:
+        return self._broadcaster
+
+    @property
+    def lag(self) -> int:
+        """Frames published but not yet read"""
+        return self._broadcaster.head - self.cursor
+
+    def skip(self, cursor: int):
+        """Recover from an overrun by moving on to frame ``cursor``, counting
+        the frames passed over as dropped"""
+        self.dropped += cursor - self.cursor
+        self.overruns += 1
+        self.cursor = cursor
+
+    def pending(self) -> tp.List[bytes]:
+        """Frames published since the last read, without waiting"""
+        frames = self._broadcaster.read(self.cursor)
+        if self.select is not None and frames:
+            subjects = self._broadcaster.read_subjects(self.cursor)
+            self.cursor += len(frames)
+            selected = map(self.select, frames, subjects)
+            return [frame for frame in selected if frame is not None]
+        self.cursor += len(frames)
+        return frames
+
+    async def next(self) -> tp.List[bytes]:
+        """Wait for and return the next frames"""
+        await self._broadcaster.wait(self.cursor)
+        return self.pending()
+
+    def close(self):
+        self._broadcaster.subscriptions.discard(self)
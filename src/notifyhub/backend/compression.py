@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import typing as tp
+import zlib
+
+# Content-Encoding -> zlib wbits, in order of preference
+ENCODINGS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+# Bodies smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 1024
+
+
+def negotiate(accept_encoding: tp.Optional[str]) -> tp.Optional[str]:
+    """The encoding from ``ENCODINGS`` the client ranks highest in its
+    ``Accept-Encoding`` header, or None to send the body uncompressed"""
+    if not accept_encoding:
+        return None
+    ranked = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if coding == "*":
+            for name in ENCODINGS:
+                ranked.setdefault(name, quality)
+        elif coding in ENCODINGS:
+            ranked[coding] = quality
+    accepted = [name for name in ENCODINGS if ranked.get(name, 0) > 0]
+    return max(accepted, key=lambda name: ranked[name], default=None)
+
+
+def compress(body: bytes, encoding: str, level: int = 6) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(body) + compressor.flush()
+
+
+class StreamCompressor:
+    """One connection's compression context. ``flush`` chunks are sync
+    flushed so the client can decode each as soon as it arrives, while the
+    window carried over from earlier chunks keeps small repetitive ones
+    (SSE events) down to a few bytes."""
+
+    __slots__ = ("_compressor",)
+
+    def __init__(self, encoding: str, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+
+    def compress(self, chunk: bytes, flush: bool = False) -> bytes:
+        out = self._compressor.compress(chunk)
+        if flush:
+            out += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+async def compress_events(
+    chunks: tp.AsyncIterator[bytes], encoding: str, level: int = 6
+) -> tp.AsyncIterator[bytes]:
+    """Compress an event stream through one context, flushing every event"""
+    compressor = StreamCompressor(encoding, level)
+    try:
+        async for chunk in chunks:
+            yield compressor.compress(chunk, flush=True)
+        yield compressor.finish()
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def compress_chunks(
+    chunks: tp.Iterable[bytes], encoding: str, level: int = 6
+) -> tp.Iterator[bytes]:
+    """Compress a streamed body, writing compressed output as it fills up"""
+    compressor = StreamCompressor(encoding, level)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.finish()
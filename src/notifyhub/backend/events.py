@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import json
+import time
+import typing as tp
+
+try:
+    import msgpack
+except ImportError:  # Optional: only the WebSocket transport's binary encoding
+    msgpack = None
+
+if tp.TYPE_CHECKING:
+    from .models import StoredNotification
+
+# WebSocket message encodings; msgpack needs the optional package
+WS_ENCODINGS = ("msgpack", "json")
+
+
+def sse_frame(
+    event: str,
+    data: tp.Union[str, bytes],
+    event_id: tp.Optional[str] = None,
+    retry: tp.Optional[int] = None,
+) -> bytes:
+    """Encode one SSE event to wire bytes, so it is serialized once no matter
+    how many clients receive it. ``retry`` sets the client's reconnection
+    delay in milliseconds."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if b"\n" in data or b"\r" in data:
+        data_lines = b"\r\n".join(b"data: " + line for line in data.splitlines())
+    else:
+        data_lines = b"data: " + data
+    id_line = b"id: " + event_id.encode("utf-8") + b"\r\n" if event_id else b""
+    retry_line = b"retry: %d\r\n" % retry if retry is not None else b""
+    return (
+        id_line
+        + retry_line
+        + b"event: "
+        + event.encode("utf-8")
+        + b"\r\n"
+        + data_lines
+        + b"\r\n\r\n"
+    )
+
+
+class Event:
+    """One published event. The SSE ``frame`` is encoded up front; the
+    WebSocket encodings on first use, then shared by every client reading
+    the event. ``records`` are the notifications a ``notification`` or
+    ``batch`` event carries, for filtered clients."""
+
+    __slots__ = ("event", "data", "id", "records", "frame", "_encoded")
+
+    def __init__(
+        self,
+        event: str,
+        data: tp.Union[str, bytes],
+        event_id: tp.Optional[str] = None,
+        records: tp.Optional[tp.Sequence[StoredNotification]] = None,
+    ):
+        self.event = event
+        self.data = data.encode("utf-8") if isinstance(data, str) else data
+        self.id = event_id
+        self.records = tuple(records) if records else None
+        self.frame = sse_frame(event, self.data, event_id)
+        self._encoded: tp.Optional[tp.Dict[str, bytes]] = None
+
+    def only(self, records: tp.Sequence[StoredNotification]) -> Event:
+        """This event cut down to ``records`` (newest first), as a batch"""
+        data = b"[" + b",".join(r.item_json() for r in records) + b"]"
+        return Event("batch", data, self.id, records)
+
+    def encode(self, encoding: str) -> bytes:
+        """The event as a WebSocket message, ``{"event", "id", "data"}`` in
+        JSON or msgpack"""
+        if self._encoded is None:
+            self._encoded = {}
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            if encoding == "json":
+                encoded = (
+                    b'{"event": '
+                    + json.dumps(self.event).encode("utf-8")
+                    + b', "id": '
+                    + json.dumps(self.id).encode("utf-8")
+                    + b', "data": '
+                    + self.data
+                    + b"}"
+                )
+            else:
+                encoded = msgpack.packb(
+                    {"event": self.event, "id": self.id, "data": json.loads(self.data)}
+                )
+            self._encoded[encoding] = encoded
+        return encoded
+
+
+def decode_message(message: tp.Union[str, bytes], encoding: str) -> tp.Any:
+    """A message a WebSocket client sent, in the connection's encoding"""
+    if encoding == "json":
+        return json.loads(message)
+    return msgpack.unpackb(message)
+
+
+class SnapshotCache:
+    """Snapshots shared by the clients connecting at one store version, under
+    keys naming what each holds. The first client to want one builds it,
+    lazily as it sends it; the rest replay the events built so far and
+    continue from the same source when they get ahead. Entries go when the
+    store changes or after ``ttl`` seconds; ``max_entries`` of 0 disables
+    sharing."""
+
+    def __init__(self, max_entries: int = 8, ttl: float = 30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._version: tp.Optional[str] = None
+        self._expires = 0.0
+        self._entries: tp.Dict[tp.Hashable, _Replay] = {}
+        # Snapshots built and reused, since startup
+        self.built = 0
+        self.reused = 0
+
+    def _current(self, version: str) -> tp.Dict[tp.Hashable, _Replay]:
+        now = time.monotonic()
+        if version != self._version or now >= self._expires:
+            self._version = version
+            self._expires = now + self.ttl
+            self._entries = {}
+        return self._entries
+
+    def __contains__(self, entry: tp.Tuple[str, tp.Hashable]) -> bool:
+        version, key = entry
+        return key in self._current(version)
+
+    def get(
+        self, version: str, key: tp.Hashable, build: tp.Callable[[], tp.Iterator[Event]]
+    ) -> tp.Iterable[Event]:
+        entries = self._current(version)
+        replay = entries.get(key)
+        if replay is not None:
+            self.reused += 1
+            return iter(replay)
+        self.built += 1
+        if not self.max_entries:
+            return build()
+        if len(entries) >= self.max_entries:
+            del entries[next(iter(entries))]
+        replay = entries[key] = _Replay(build())
+        return iter(replay)
+
+
+class _Replay:
+    """An event iterator that can be iterated any number of times, pulling
+    from its source only once"""
+
+    __slots__ = ("_source", "_events", "_done")
+
+    def __init__(self, source: tp.Iterator[Event]):
+        self._source = source
+        self._events: tp.List[Event] = []
+        self._done = False
+
+    def __iter__(self) -> tp.Iterator[Event]:
+        events = self._events
+        i = 0
+        while True:
+            if i == len(events):
+                if self._done:
+                    return
+                event = next(self._source, None)
+                if event is None:
+                    self._done = True
+                    return
+                events.append(event)
+            yield events[i]
+            i += 1
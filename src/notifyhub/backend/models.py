@@ -1,9 +1,33 @@
-from datetime import datetime, timezone
-from typing import List, Optional
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from heapq import heapify, heappop, heappush, heapreplace, merge
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+from itertools import islice, takewhile
+from operator import itemgetter
+from typing import (
+    TYPE_CHECKING,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+import gc
+import re
+import sys
+import time
 import uuid
-import asyncio
 import json
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, model_validator
+
+from .search import SearchIndex
+
+if TYPE_CHECKING:
+    from .persistence import NotificationLog
 
 
 def get_timeslug() -> str:
@@ -16,6 +40,83 @@ def get_time_uid() -> str:
     return f"{get_timeslug()}-{str(uuid.uuid4())[:8]}"
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def now_us() -> int:
+    """Current time in microseconds since the epoch"""
+    return time.time_ns() // 1000
+
+
+def to_epoch_us(timestamp: Optional[str]) -> int:
+    """Microseconds since the epoch for an ISO timestamp (naive ones are
+    UTC); missing or invalid timestamps mean now"""
+    if timestamp:
+        try:
+            parsed = datetime.fromisoformat(timestamp)
+        except ValueError:
+            pass
+        else:
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return (parsed - EPOCH) // MICROSECOND
+    return now_us()
+
+
+def from_epoch_us(timestamp_us: int) -> str:
+    """Timezone-aware UTC ISO timestamp"""
+    return (EPOCH + timestamp_us * MICROSECOND).isoformat()
+
+
+# Log records keep the posted fields under FIELDS_KEY and the store's own
+# state (size, expiry, repeat count) beside it, out of reach of user fields.
+# Records written before the split carried the state as top-level extras
+# under the LEGACY_* keys.
+FIELDS_KEY = "fields"
+LEGACY_EXPIRES_KEY = "_expires_us"
+LEGACY_REPEATS_KEY = "_repeats"
+# Log records decoded per json.loads call when restoring
+RESTORE_CHUNK = 10000
+# Shared, as json.dumps builds a new encoder per call for non-default options
+ITEM_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+# Inline tag markup: [#opencode.question] or [#tag:@USER], but not the
+# clients' [#truncated:...] marker
+TAG_PATTERN = re.compile(r"\[#(?!truncated:)(?:tag:)?([^\]]+)\]")
+
+
+def parse_tags(message: str, listed: Optional[Iterable] = None) -> List[str]:
+    """Tags in ``message``'s markup followed by ``listed`` ones, without
+    duplicates. ``listed`` only counts if it is a list; older records may
+    hold some other ``tags`` value as a plain extra field."""
+    tags = TAG_PATTERN.findall(message) if "[#" in message else []
+    if isinstance(listed, (list, tuple)):
+        tags.extend(map(str, listed))
+    return list(dict.fromkeys(tags))
+
+
+def normalize_tag(tag: str) -> str:
+    """Tag name for a tag written bare, as ``#name`` or as markup"""
+    match = TAG_PATTERN.fullmatch(tag)
+    return match.group(1) if match else tag.removeprefix("#")
+
+
+def priority_of(value) -> float:
+    """A notification's optional ``priority`` field as a number; missing or
+    non-numeric priorities count as 0"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return 0
+
+
+def _state_int(value) -> Optional[int]:
+    """Positive integer state read back from the log, or None if malformed"""
+    if type(value) is int and value > 0:
+        return value
+    return None
+
+
 class Notification(BaseModel):
 
     model_config = ConfigDict(extra="allow")
@@ -24,65 +125,1175 @@ class Notification(BaseModel):
     message: str
     pwd: Optional[str] = None
     timestamp: Optional[str] = None
+    # Parsed from the message at ingest, plus any given explicitly
+    tags: Optional[List[str]] = None
+
+    @model_validator(mode="after")
+    def _parse_tags(self) -> "Notification":
+        self.tags = parse_tags(self.message, self.tags) or None
+        return self
+
+
+class StoredNotification:
+    """Compact form a notification is kept in once stored.
+
+    The timestamp is held as integer microseconds since the epoch, ``pwd``
+    is interned so notifications from one project share the string, and
+    extra fields are only kept when there are any. The API shapes are built
+    at the edges: ``item_json()`` is encoded on first use and then reused
+    by list responses, init snapshots and SSE broadcasts.
+
+    ``size`` is the payload size counted against the store's byte limit,
+    ``expires_us`` when the notification's age limit or TTL runs out and
+    ``count`` how many repeats the coalescing window folded into it.
+    ``seq`` is the store's insertion sequence number. ``tags`` are parsed
+    once at ingest, and interned like ``pwd``.
+    """
+
+    __slots__ = (
+        "id",
+        "message",
+        "pwd",
+        "timestamp_us",
+        "tags",
+        "extra",
+        "size",
+        "expires_us",
+        "count",
+        "seq",
+        "_item_json",
+    )
+
+    def __init__(
+        self,
+        notification_id: str,
+        message: str,
+        pwd: Optional[str],
+        timestamp_us: int,
+        extra: Optional[dict] = None,
+        tags: Iterable[str] = (),
+    ):
+        self.id = notification_id
+        self.message = message
+        self.pwd = sys.intern(pwd) if pwd is not None else None
+        self.timestamp_us = timestamp_us
+        self.tags = tuple(map(sys.intern, tags))
+        self.extra = extra or None
+        self.size = 0
+        self.expires_us: Optional[int] = None
+        self.count = 1
+        self.seq = 0
+        self._item_json: Optional[bytes] = None
+
+    @classmethod
+    def from_notification(
+        cls, data: Notification, custom_id: Optional[str] = None
+    ) -> "StoredNotification":
+        """Assign the ID and timestamp if missing and compact ``data``"""
+        return cls(
+            custom_id or data.id or get_time_uid(),
+            data.message,
+            data.pwd,
+            to_epoch_us(data.timestamp),
+            data.model_extra,
+            data.tags or (),
+        )
+
+    @classmethod
+    def from_dict(cls, record: dict) -> "StoredNotification":
+        """Inverse of ``to_log_dict()``, for replaying the log"""
+        return cls._from_record(dict(record))
+
+    @classmethod
+    def _from_record(cls, record: dict) -> "StoredNotification":
+        # Takes the fields it knows out of the posted ones; the rest are extras
+        if "message" in record:
+            return cls._from_flat_record(record)
+        fields = record[FIELDS_KEY]
+        # Parsed before the record was written; anything else is an extra
+        tags = fields.pop("tags") if isinstance(fields.get("tags"), list) else ()
+        stored = cls(
+            record["id"],
+            fields.pop("message"),
+            fields.pop("pwd", None),
+            _state_int(record.get("timestamp_us")) or now_us(),
+            fields,
+            tags,
+        )
+        if "expires_us" in record:
+            stored.expires_us = _state_int(record["expires_us"])
+        if "repeats" in record:
+            stored.count = _state_int(record["repeats"]) or 1
+        # Counted as on ingest; the item JSON is only encoded when first read
+        stored.size = _state_int(record.get("size")) or len(stored.item_json())
+        return stored
+
+    @classmethod
+    def _from_flat_record(cls, record: dict) -> "StoredNotification":
+        # As from ``to_dict()`` or a log written before fields and state
+        # were split, with the state as extras under the legacy keys
+        state = {
+            key: record.pop(legacy)
+            for key, legacy in (
+                ("expires_us", LEGACY_EXPIRES_KEY),
+                ("repeats", LEGACY_REPEATS_KEY),
+            )
+            if _state_int(record.get(legacy)) is not None
+        }
+        message = record.pop("message")
+        listed = record.get("tags")
+        if isinstance(listed, (list, tuple)):
+            del record["tags"]
+        stored = cls(
+            record.pop("id"),
+            message,
+            record.pop("pwd", None),
+            to_epoch_us(record.pop("timestamp", None)),
+            record,
+            # Records written before tags were parsed only have the markup
+            parse_tags(message, listed),
+        )
+        stored.expires_us = state.get("expires_us")
+        stored.count = state.get("repeats", 1)
+        stored.size = len(stored.item_json())
+        return stored
+
+    @property
+    def timestamp(self) -> str:
+        return from_epoch_us(self.timestamp_us)
+
+    @property
+    def priority(self) -> float:
+        return priority_of(self.extra.get("priority")) if self.extra else 0
+
+    def fields(self) -> dict:
+        """Fields as posted, without the repeat count"""
+        data = {"message": self.message, "pwd": self.pwd}
+        if self.extra:
+            data.update(self.extra)
+        if self.tags:
+            data["tags"] = list(self.tags)
+        return data
+
+    def data(self) -> dict:
+        """Fields other than ID and timestamp, as sent in the API's ``data``"""
+        data = self.fields()
+        if self.count > 1:
+            data["count"] = self.count
+        return data
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, **self.data(), "timestamp": self.timestamp}
+
+    def to_log_dict(self) -> dict:
+        """The posted fields in an object of their own beside the store's
+        state, so no user field can be read back as state. The state
+        includes the size, so replaying needn't encode items to count it."""
+        record = {"id": self.id, "timestamp_us": self.timestamp_us, "size": self.size}
+        if self.count > 1:
+            record["repeats"] = self.count
+        if self.expires_us is not None:
+            record["expires_us"] = self.expires_us
+        record[FIELDS_KEY] = self.fields()
+        return record
+
+    def to_notification(self) -> Notification:
+        return Notification(**self.to_dict())
+
+    def to_item(self) -> dict:
+        """API shape used by /api/notifications and SSE events"""
+        return {"id": self.id, "data": self.data(), "timestamp": self.timestamp}
+
+    def coalesce_key(self) -> Tuple:
+        """Notifications with the same key are repeats of each other"""
+        return (self.message, self.pwd, tuple(sorted(self.tags)))
+
+    def item_json(self) -> bytes:
+        """``to_item()`` as UTF-8 JSON, encoded once"""
+        if self._item_json is None:
+            self._item_json = ITEM_ENCODER.encode(self.to_item()).encode("utf-8")
+        return self._item_json
+
+
+class SeqIndex:
+    """Notifications keyed by insertion sequence number, oldest first.
+
+    ``_seqs`` is append-only and therefore sorted, so range seeks are a
+    bisect. Deletes only drop the entry from ``_items`` and leave a
+    tombstone that is compacted away once tombstones outnumber live entries,
+    keeping append, delete and pop-oldest amortised O(1).
+    """
+
+    def __init__(self):
+        self._items: Dict[int, StoredNotification] = {}
+        self._seqs: List[int] = []
+        self._head = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, seq: int) -> bool:
+        return seq in self._items
+
+    def get(self, seq: int) -> Optional[StoredNotification]:
+        return self._items.get(seq)
+
+    def oldest_seq(self) -> Optional[int]:
+        seqs, items = self._seqs, self._items
+        while self._head < len(seqs):
+            if seqs[self._head] in items:
+                return seqs[self._head]
+            self._head += 1
+        return None
+
+    def append(self, seq: int, notification: StoredNotification):
+        self._seqs.append(seq)
+        self._items[seq] = notification
+
+    def remove(self, seq: int) -> Optional[StoredNotification]:
+        notification = self._items.pop(seq, None)
+        if notification is not None:
+            self._maybe_compact()
+        return notification
+
+    def pop_oldest(self) -> Tuple[int, StoredNotification]:
+        while True:
+            seq = self._seqs[self._head]
+            self._head += 1
+            notification = self._items.pop(seq, None)
+            if notification is not None:
+                self._maybe_compact()
+                return seq, notification
+
+    def clear(self):
+        self._items = {}
+        self._seqs = []
+        self._head = 0
+
+    def _maybe_compact(self):
+        if len(self._seqs) > 2 * len(self._items) + 64:
+            items = self._items
+            # A new list, so in-flight iterators keep walking the old one
+            self._seqs = [s for s in self._seqs[self._head :] if s in items]
+            self._head = 0
+
+    def iter_newest(
+        self, before: Optional[int] = None
+    ) -> Iterator[Tuple[int, StoredNotification]]:
+        """(seq, notification) newest first, optionally only seq < before"""
+        seqs, items, head = self._seqs, self._items, self._head
+        end = len(seqs) if before is None else bisect_left(seqs, before, head)
+        for i in range(end - 1, head - 1, -1):
+            notification = items.get(seqs[i])
+            if notification is not None:
+                yield seqs[i], notification
+
+    def iter_oldest(
+        self, after: Optional[int] = None
+    ) -> Iterator[Tuple[int, StoredNotification]]:
+        """(seq, notification) oldest first, optionally only seq > after"""
+        seqs, items, head = self._seqs, self._items, self._head
+        start = head if after is None else bisect_right(seqs, after, head)
+        for i in range(start, len(seqs)):
+            notification = items.get(seqs[i])
+            if notification is not None:
+                yield seqs[i], notification
+
+
+class Partition(SeqIndex):
+    """One project's notifications, keyed by ``pwd``, and their payload bytes"""
+
+    def __init__(self, pwd: Optional[str]):
+        super().__init__()
+        self.pwd = pwd
+        self.total_bytes = 0
+
+
+class PartitionedIndex:
+    """Notifications split into one ``Partition`` per project.
+
+    Sequence numbers are global, so the store-wide order is a k-way heap
+    merge of the partitions' own orders and no second index over every
+    notification is needed. Per-project reads touch only their partition.
+    Empty partitions are dropped.
+    """
+
+    def __init__(self):
+        self.partitions: Dict[Optional[str], Partition] = {}
+        self._size = 0
+        # (oldest seq, pwd) min-heap for store-wide eviction. Entries go
+        # stale as partitions lose their oldest and are repaired when they
+        # reach the top.
+        self._heads: List[Tuple[int, Optional[str]]] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get(self, pwd: Optional[str], seq: int) -> Optional[StoredNotification]:
+        partition = self.partitions.get(pwd)
+        return partition.get(seq) if partition is not None else None
+
+    def append(self, seq: int, notification: StoredNotification):
+        partition = self.partitions.get(notification.pwd)
+        if partition is None:
+            partition = self.partitions[notification.pwd] = Partition(notification.pwd)
+            heappush(self._heads, (seq, notification.pwd))
+        partition.append(seq, notification)
+        partition.total_bytes += notification.size
+        self._size += 1
+
+    def remove(self, notification: StoredNotification) -> bool:
+        partition = self.partitions.get(notification.pwd)
+        if partition is None or partition.remove(notification.seq) is None:
+            return False
+        self._removed(partition, notification)
+        return True
+
+    def pop_oldest(self, partition: Optional[Partition] = None) -> StoredNotification:
+        """Remove the oldest notification of ``partition``, or of the whole
+        index"""
+        if partition is None:
+            partition = self._oldest_partition()
+        _, notification = partition.pop_oldest()
+        self._removed(partition, notification)
+        return notification
+
+    def _oldest_partition(self) -> Partition:
+        heads, partitions = self._heads, self.partitions
+        if len(heads) > 2 * len(partitions) + 64:
+            # Recreated partitions leave duplicate entries behind
+            heads[:] = [(p.oldest_seq(), pwd) for pwd, p in partitions.items()]
+            heapify(heads)
+        while True:
+            seq, pwd = heads[0]
+            partition = partitions.get(pwd)
+            if partition is None:
+                heappop(heads)
+                continue
+            oldest = partition.oldest_seq()
+            if oldest == seq:
+                return partition
+            heapreplace(heads, (oldest, pwd))
+
+    def resized(self, notification: StoredNotification, delta: int):
+        self.partitions[notification.pwd].total_bytes += delta
+
+    def _removed(self, partition: Partition, notification: StoredNotification):
+        partition.total_bytes -= notification.size
+        self._size -= 1
+        if not partition and self.partitions.get(partition.pwd) is partition:
+            del self.partitions[partition.pwd]
+
+    def clear(self):
+        self.partitions = {}
+        self._size = 0
+        self._heads = []
+
+    def iter_newest(
+        self, before: Optional[int] = None
+    ) -> Iterator[Tuple[int, StoredNotification]]:
+        parts = list(self.partitions.values())
+        if len(parts) == 1:
+            return parts[0].iter_newest(before)
+        return merge(
+            *(p.iter_newest(before) for p in parts), key=itemgetter(0), reverse=True
+        )
+
+    def iter_oldest(
+        self, after: Optional[int] = None
+    ) -> Iterator[Tuple[int, StoredNotification]]:
+        parts = list(self.partitions.values())
+        if len(parts) == 1:
+            return parts[0].iter_oldest(after)
+        return merge(*(p.iter_oldest(after) for p in parts), key=itemgetter(0))
+
+
+class ProjectFilter:
+    """An index's notifications from one project, for reads that select by
+    tag and project at once. Counting walks the index."""
+
+    def __init__(self, index: SeqIndex, pwd: str):
+        self._index = index
+        self._pwd = pwd
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.iter_newest())
+
+    def iter_newest(
+        self, before: Optional[int] = None
+    ) -> Iterator[Tuple[int, StoredNotification]]:
+        pwd = self._pwd
+        return (e for e in self._index.iter_newest(before) if e[1].pwd == pwd)
+
+    def iter_oldest(
+        self, after: Optional[int] = None
+    ) -> Iterator[Tuple[int, StoredNotification]]:
+        pwd = self._pwd
+        return (e for e in self._index.iter_oldest(after) if e[1].pwd == pwd)
+
+
+class NotificationsView(Sequence):
+    """Read-only, newest-first view over the store's sequence index.
+
+    Indexing near either end is cheap; the endpoints only ever iterate it.
+    Stored records are converted back to ``Notification`` on the way out.
+    """
+
+    def __init__(self, index: PartitionedIndex):
+        self._index = index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[Notification]:
+        return (n.to_notification() for _, n in self._index.iter_newest())
+
+    def __reversed__(self) -> Iterator[Notification]:
+        return (n.to_notification() for _, n in self._index.iter_oldest())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        size = len(self._index)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("notification index out of range")
+        # Walk from whichever end is closer
+        if index < size // 2:
+            return next(islice(iter(self), index, None))
+        return next(islice(reversed(self), size - 1 - index, None))
+
+
+class Page(NamedTuple):
+    """One page of item JSON, newest first, with the sequence numbers to
+    continue from (None when there is nothing further that way)."""
+
+    items: List[bytes]
+    older: Optional[int]
+    newer: Optional[int]
+
+
+class Project(NamedTuple):
+    """A project's notification count and latest notification timestamp"""
+
+    pwd: Optional[str]
+    count: int
+    latest: str
+
+
+class Change(NamedTuple):
+    """One client-visible store mutation, as broadcast over SSE. ``records``
+    are the notifications a ``notification`` or ``batch`` event carries, in
+    the order of its data, so filtered clients can pick theirs."""
+
+    version: int
+    event: str
+    data: bytes
+    records: Optional[Tuple[StoredNotification, ...]] = None
+
+
+class NotificationFilter:
+    """Which notifications a client wants: from projects under
+    ``pwd_prefix`` (the path itself or below it, so ``/repo`` doesn't take
+    in ``/repository``), with any of ``tags`` and at least
+    ``min_priority``. Compiled once; ``matches`` is called per
+    notification."""
+
+    def __init__(
+        self,
+        pwd_prefix: Optional[str] = None,
+        tags: Iterable[str] = (),
+        min_priority: Optional[float] = None,
+    ):
+        self.pwd_prefix = pwd_prefix or None
+        self._subdir_prefix = pwd_prefix.rstrip("/") + "/" if pwd_prefix else None
+        self.tags = frozenset(tags)
+        self.min_priority = min_priority
+
+    def __bool__(self) -> bool:
+        """Whether anything is filtered out at all"""
+        return bool(self.pwd_prefix or self.tags or self.min_priority is not None)
+
+    def covers(self, pwd: Optional[str]) -> bool:
+        """Whether project ``pwd`` is under ``pwd_prefix``"""
+        if self.pwd_prefix is None:
+            return True
+        return pwd is not None and (
+            pwd == self.pwd_prefix or pwd.startswith(self._subdir_prefix)
+        )
+
+    def matches(
+        self, pwd: Optional[str], tags: Iterable[str], priority: float = 0
+    ) -> bool:
+        if not self.covers(pwd):
+            return False
+        if self.tags and self.tags.isdisjoint(tags):
+            return False
+        return self.min_priority is None or priority >= self.min_priority
+
+    def matches_record(self, record: StoredNotification) -> bool:
+        return self.matches(record.pwd, record.tags, record.priority)
 
 
 class NotificationStore:
 
-    def __init__(self, sse_manager=None, max_count=None):
-        self.notifications: List[Notification] = []
+    def __init__(
+        self,
+        sse_manager=None,
+        max_count=None,
+        log: Optional["NotificationLog"] = None,
+        change_log_size: int = 10000,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        coalesce_window: float = 0,
+        project_max_count: Optional[int] = None,
+        project_max_bytes: Optional[int] = None,
+    ):
+        # Partitioned by project and ordered by sequence number, plus an
+        # id -> record index; add, lookup and delete-by-id are O(1), cursor
+        # seeks O(log n) per project
+        self._index = PartitionedIndex()
+        self._by_id: Dict[str, StoredNotification] = {}
+        self._last_seq = 0
+        # Built on the first search after a restore (None until then)
+        self._search: Optional[SearchIndex] = SearchIndex()
+        # tag -> its notifications, for tag reads and bulk deletes; None
+        # while a restore defers building it
+        self._tags: Optional[Dict[str, SeqIndex]] = {}
+        # Bumped on every mutation; the epoch tells apart versions from
+        # different server runs
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        # Recent changes for resuming clients; anything at or below the
+        # floor has been dropped and needs a full snapshot instead
+        self.change_log_size = change_log_size
+        self._changes: Deque[Change] = deque()
+        self._changes_floor = 0
         self.max_notifications = max_count if max_count is not None else 1000
+        # Retention by total payload bytes and by age in seconds (None for
+        # unlimited); per-notification TTLs come with each add
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # The same limits per project, so one noisy project only evicts its
+        # own notifications
+        self.project_max_count = project_max_count
+        self.project_max_bytes = project_max_bytes
+        self.total_bytes = 0
+        # (expires_us, seq, record) min-heap; removed records are skipped
+        self._expiry: List[Tuple[int, int, StoredNotification]] = []
+        # Repeats of a notification within this many seconds of the previous
+        # one bump its count instead of being stored (0 disables)
+        self.coalesce_window = coalesce_window
+        # coalesce key -> [notification ID, last sighting in epoch us]
+        self._recent: "OrderedDict[Tuple, list]" = OrderedDict()
         self.sse_manager = sse_manager
+        self.log = log
 
-    def add(self, data: Notification, custom_id: Optional[str] = None) -> str:
+    @property
+    def etag(self) -> str:
+        """Opaque token that changes whenever the stored notifications do"""
+        return self.change_id(self.version)
 
-        if custom_id:
-            data.id = custom_id
-        elif not data.id:
-            data.id = get_time_uid()
-        if not data.timestamp:
-            data.timestamp = datetime.now(timezone.utc).isoformat()
-        else:
-            try:
-                parsed = datetime.fromisoformat(data.timestamp)
-                if parsed.tzinfo is None:
-                    parsed = parsed.replace(tzinfo=timezone.utc)
-                data.timestamp = parsed.isoformat()
-            except ValueError:
-                data.timestamp = datetime.now(timezone.utc).isoformat()
+    def change_id(self, version: int) -> str:
+        """Opaque ID for a store version, used as SSE event ID and cursor"""
+        return f"{self.epoch}-{version}"
 
-        self.notifications.insert(0, data)  # Newest first
+    def parse_change_id(self, change_id: str) -> Optional[int]:
+        """Version of a change ID from this run, or None if it comes from
+        another run. Raises ValueError if malformed."""
+        epoch, _, version = change_id.rpartition("-")
+        if not epoch:
+            raise ValueError(f"Invalid change ID: {change_id!r}")
+        return int(version) if epoch == self.epoch else None
 
-        # Broadcast to SSE clients
-        if self.sse_manager:
-            event_data = {
-                "event": "notification",
-                "data": json.dumps(
-                    {
-                        "id": data.id,
-                        "data": data.model_dump(exclude={"id", "timestamp"}),
-                        "timestamp": data.timestamp,
-                    }
-                ),
-            }
-            # Schedule broadcast (don't block notification creation)
-            asyncio.create_task(self.sse_manager.broadcast(event_data))
+    def changes_since(self, version: int) -> Optional[List[Change]]:
+        """Changes after ``version``, oldest first, or None if the change
+        log no longer reaches back that far"""
+        if version < self._changes_floor or version > self.version:
+            return None
+        missed = []
+        for change in reversed(self._changes):
+            if change.version <= version:
+                break
+            missed.append(change)
+        missed.reverse()
+        return missed
+
+    @property
+    def notifications(self) -> NotificationsView:
+        """Stored notifications, newest first"""
+        return NotificationsView(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def count(self, pwd: Optional[str] = None, tag: Optional[str] = None) -> int:
+        """Number of notifications from project ``pwd`` and/or with ``tag``,
+        or in total"""
+        return len(self._scope(pwd, tag))
+
+    def projects(self) -> List[Project]:
+        """Projects with stored notifications, most recently active first"""
+        latest = []
+        for pwd, partition in self._index.partitions.items():
+            seq, newest = next(partition.iter_newest())
+            latest.append((seq, Project(pwd, len(partition), newest.timestamp)))
+        latest.sort(key=itemgetter(0), reverse=True)
+        return [project for _, project in latest]
+
+    def get(self, notification_id: str) -> Optional[Notification]:
+        """Look up a notification by ID"""
+        record = self._get_record(notification_id)
+        return record.to_notification() if record is not None else None
+
+    def _get_record(self, notification_id: str) -> Optional[StoredNotification]:
+        return self._by_id.get(notification_id)
+
+    def add(
+        self,
+        data: Notification,
+        custom_id: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> str:
+        """Store a notification and broadcast it. It expires after ``ttl``
+        seconds, or earlier if the store's age limit says so. A repeat
+        inside the coalescing window returns the ID it was folded into."""
+        return self.ingest([(data, custom_id, ttl)])[0][0]
+
+    def add_many(
+        self,
+        entries: Iterable[Tuple[Notification, Optional[str], Optional[float]]],
+    ) -> List[str]:
+        """Store ``(notification, custom_id, ttl)`` entries as one change;
+        see ``ingest``. Returns the IDs in entry order."""
+        return [notification_id for notification_id, _ in self.ingest(entries)]
+
+    def ingest(
+        self,
+        entries: Iterable[Tuple[Notification, Optional[str], Optional[float]]],
+    ) -> List[Tuple[str, bool]]:
+        """Store ``(notification, custom_id, ttl)`` entries as one change.
+
+        A single new notification is broadcast as a ``notification`` event,
+        several as one ``batch`` event whose data is the stored items newest
+        first. Entries without a custom ID that repeat a notification stored
+        less than ``coalesce_window`` seconds after its previous repeat only
+        bump its ``count``, announced by one small ``update`` event per
+        notification. Returns ``(id, is_new)`` per entry.
+        """
+        results: List[Tuple[str, bool]] = []
+        records: List[StoredNotification] = []
+        # New in this call, by ID, so later repeats can fold into them
+        pending: Dict[str, StoredNotification] = {}
+        # Repeats of notifications stored before this call, by ID
+        repeats: Dict[str, int] = {}
+        now = now_us()
+        for data, custom_id, ttl in entries:
+            record = self._prepare(data, custom_id, ttl)
+            repeat_of = (
+                self._repeat_of(record, now, pending) if custom_id is None else None
+            )
+            if repeat_of is None:
+                records.append(record)
+                pending[record.id] = record
+                results.append((record.id, True))
+            elif repeat_of in pending:
+                pending[repeat_of].count += 1
+                results.append((repeat_of, False))
+            else:
+                repeats[repeat_of] = repeats.get(repeat_of, 0) + 1
+                results.append((repeat_of, False))
+
+        if records:
+            for record in records:
+                record.size = len(record.item_json())
+                self._insert(record)
+            # Evictions ride on the same version bump; they aren't sent to clients
+            self._evict({record.pwd for record in records})
+            if len(records) == 1:
+                self._record_change(
+                    "notification", records[0].item_json(), (records[0],)
+                )
+            else:
+                newest_first = self._batch_records(records)
+                self._record_change(
+                    "batch",
+                    b"[" + b",".join(r.item_json() for r in newest_first) + b"]",
+                    tuple(newest_first),
+                )
+        for notification_id, by in repeats.items():
+            count = self._bump_count(notification_id, by)
+            if count is not None:
+                self._record_change(
+                    "update",
+                    json.dumps(
+                        {"id": notification_id, "count": count}, ensure_ascii=False
+                    ).encode("utf-8"),
+                )
+        return results
 
-        if (
-            self.max_notifications is not None
-            and len(self.notifications) > self.max_notifications
-        ):
-            self.notifications.pop()
+    def _repeat_of(
+        self,
+        record: StoredNotification,
+        now: int,
+        pending: Dict[str, StoredNotification],
+    ) -> Optional[str]:
+        """ID of the notification ``record`` repeats within the coalescing
+        window, or None after making ``record`` the one later repeats fold
+        into"""
+        if not self.coalesce_window:
+            return None
+        window_us = int(self.coalesce_window * 1_000_000)
+        recent = self._recent
+        # Ordered by last sighting, so everything expired is at the front
+        while recent:
+            oldest = next(iter(recent.values()))
+            if now - oldest[1] < window_us:
+                break
+            recent.popitem(last=False)
+        key = record.coalesce_key()
+        seen = recent.get(key)
+        if seen is not None and (seen[0] in pending or self._contains(seen[0])):
+            seen[1] = now
+            recent.move_to_end(key)
+            return seen[0]
+        recent[key] = [record.id, now]
+        recent.move_to_end(key)
+        return None
 
-        return data.id
+    def _batch_records(
+        self, records: List[StoredNotification]
+    ) -> List[StoredNotification]:
+        # A repeated ID replaced its earlier copies, and evictions may have
+        # dropped any of them, not just the oldest: per-project limits
+        # remove each project's oldest entries
+        newest_first, seen = [], set()
+        for record in reversed(records):
+            if record.id not in seen:
+                seen.add(record.id)
+                if self._contains(record.id):
+                    newest_first.append(record)
+        return newest_first
 
     def delete_by_id(self, notification_id: str) -> bool:
         """Delete a notification by ID. Returns True if found and deleted, False otherwise."""
-        for i, notification in enumerate(self.notifications):
-            if notification.id == notification_id:
-                self.notifications.pop(i)
-                return True
-        return False
+        if not self._delete(notification_id):
+            return False
+        self._record_change(
+            "delete",
+            json.dumps(
+                {"id": notification_id, "message": f"Notification {notification_id} deleted"}
+            ).encode("utf-8"),
+        )
+        return True
+
+    def delete_where(
+        self,
+        ids: Optional[Iterable[str]] = None,
+        pwd: Optional[str] = None,
+        tag: Optional[str] = None,
+        start_us: Optional[int] = None,
+        end_us: Optional[int] = None,
+    ) -> List[str]:
+        """Delete the notifications matching every given filter: one of
+        ``ids``, project ``pwd``, ``tag`` and a timestamp range in epoch
+        microseconds (``start_us`` inclusive, ``end_us`` exclusive). They
+        are broadcast as a single delete event carrying their ``ids``.
+        Returns the IDs."""
+        ids = self._delete_matching(ids, pwd, tag, start_us, end_us)
+        self._record_deletes(ids, "deleted")
+        return ids
 
     def clear_all(self):
         """Clear all notifications"""
-        self.notifications.clear()
+        self._clear()
+        self._recent.clear()
+        self._record_change("clear", b'{"message": "All notifications cleared"}')
+
+    def expire(self, now: Optional[int] = None, limit: int = 10000) -> List[str]:
+        """Remove up to ``limit`` notifications whose age limit or TTL has
+        run out by ``now`` (epoch microseconds) and broadcast them as a
+        single delete event carrying their ``ids``. Returns the IDs."""
+        ids = self._expire_due(now_us() if now is None else now, limit)
+        self._record_deletes(ids, "expired")
+        return ids
+
+    def _record_deletes(self, ids: List[str], reason: str):
+        if ids:
+            self._record_change(
+                "delete",
+                json.dumps(
+                    {"ids": ids, "message": f"{len(ids)} notifications {reason}"},
+                    ensure_ascii=False,
+                ).encode("utf-8"),
+            )
+
+    def _prepare(
+        self,
+        data: Notification,
+        custom_id: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> StoredNotification:
+        record = StoredNotification.from_notification(data, custom_id)
+        if ttl is not None:
+            record.expires_us = now_us() + int(ttl * 1_000_000)
+        self._apply_max_age(record)
+        return record
+
+    def _apply_max_age(self, record: StoredNotification):
+        if self.max_age is not None:
+            age_limit = record.timestamp_us + int(self.max_age * 1_000_000)
+            if record.expires_us is None or age_limit < record.expires_us:
+                record.expires_us = age_limit
+
+    def _record_change(
+        self,
+        event: str,
+        data: bytes,
+        records: Optional[Tuple[StoredNotification, ...]] = None,
+    ):
+        """Bump the version, keep the change for resuming clients and
+        broadcast it"""
+        self.version += 1
+        self._changes.append(Change(self.version, event, data, records))
+        while len(self._changes) > self.change_log_size:
+            self._changes_floor = self._changes.popleft().version
+        if self.sse_manager:
+            self.sse_manager.publish(
+                {
+                    "event": event,
+                    "data": data,
+                    "id": self.change_id(self.version),
+                    "records": records,
+                }
+            )
+
+    def _put(self, data: StoredNotification):
+        # Re-adding an existing ID replaces it and moves it to the front
+        old = self._by_id.get(data.id)
+        if old is not None:
+            self._remove(old)
+        self._last_seq += 1
+        data.seq = self._last_seq
+        self._by_id[data.id] = data
+        self._index.append(data.seq, data)
+        if self._search is not None:
+            self._search.add(data.seq, data.message, data.pwd)
+        if self._tags is not None:
+            self._tag(data)
+        self.total_bytes += data.size
+        if data.expires_us is not None:
+            heappush(self._expiry, (data.expires_us, data.seq, data))
+
+    def _tag(self, data: StoredNotification):
+        for tag in data.tags:
+            tagged = self._tags.get(tag)
+            if tagged is None:
+                tagged = self._tags[tag] = SeqIndex()
+            tagged.append(data.seq, data)
+
+    def _remove(self, notification: StoredNotification):
+        self._index.remove(notification)
+        self._forget(notification)
+
+    def _forget(self, notification: StoredNotification):
+        del self._by_id[notification.id]
+        if self._search is not None:
+            self._search.remove(notification.seq)
+        if self._tags is not None:
+            for tag in notification.tags:
+                tagged = self._tags[tag]
+                tagged.remove(notification.seq)
+                if not tagged:
+                    del self._tags[tag]
+        self.total_bytes -= notification.size
+
+    def _pop_oldest(self, partition: Optional[Partition] = None) -> StoredNotification:
+        notification = self._index.pop_oldest(partition)
+        self._forget(notification)
+        return notification
+
+    @staticmethod
+    def _exceeds(
+        count: int,
+        total_bytes: int,
+        max_count: Optional[int],
+        max_bytes: Optional[int],
+    ) -> bool:
+        if max_count is not None and count > max_count:
+            return True
+        # The newest notification is kept even if it alone is over the limit
+        return max_bytes is not None and total_bytes > max_bytes and count > 1
+
+    def _over_limits(self) -> bool:
+        return self._exceeds(
+            len(self), self.total_bytes, self.max_notifications, self.max_bytes
+        )
+
+    def _project_over_limits(self, partition: Partition) -> bool:
+        return self._exceeds(
+            len(partition),
+            partition.total_bytes,
+            self.project_max_count,
+            self.project_max_bytes,
+        )
+
+    @staticmethod
+    def _log_json(data: StoredNotification) -> str:
+        return ITEM_ENCODER.encode(data.to_log_dict())
+
+    def _insert(self, data: StoredNotification):
+        self._put(data)
+        if self.log:
+            self.log.append_add(data.id, self._log_json(data))
+
+    def _contains(self, notification_id: str) -> bool:
+        return notification_id in self._by_id
+
+    def _bump_count(self, notification_id: str, by: int) -> Optional[int]:
+        """Add ``by`` repeats to a stored notification; its new count, or
+        None if it is gone"""
+        record = self._get_record(notification_id)
+        if record is None:
+            return None
+        record.count += by
+        record._item_json = None
+        size = len(record.item_json())
+        self.total_bytes += size - record.size
+        self._index.resized(record, size - record.size)
+        record.size = size
+        if self.log:
+            self.log.append_update(notification_id, self._log_json(record))
+        return record.count
+
+    def _evict(self, pwds: Iterable[Optional[str]] = ()):
+        """Enforce the limits of the projects in ``pwds``, then the store's"""
+        evicted = []
+        if self.project_max_count is not None or self.project_max_bytes is not None:
+            for pwd in pwds:
+                partition = self._index.partitions.get(pwd)
+                while partition and self._project_over_limits(partition):
+                    evicted.append(self._pop_oldest(partition))
+        while self._over_limits():
+            evicted.append(self._pop_oldest())
+        if self.log:
+            for notification in evicted:
+                self.log.append_delete(notification.id)
+
+    def _delete(self, notification_id: str) -> bool:
+        notification = self._by_id.get(notification_id)
+        if notification is None:
+            return False
+        self._remove(notification)
+        if self.log:
+            self.log.append_delete(notification_id)
+        return True
+
+    def _delete_matching(
+        self,
+        ids: Optional[Iterable[str]],
+        pwd: Optional[str],
+        tag: Optional[str],
+        start_us: Optional[int],
+        end_us: Optional[int],
+    ) -> List[str]:
+        # Candidates come from the narrowest index available; the remaining
+        # filters are checked per record
+        if ids is not None:
+            by_id = self._by_id
+            candidates: Iterable[StoredNotification] = [
+                by_id[i] for i in dict.fromkeys(ids) if i in by_id
+            ]
+        else:
+            candidates = (n for _, n in self._scope(pwd, tag).iter_oldest())
+        matched = [
+            n
+            for n in candidates
+            if (pwd is None or n.pwd == pwd)
+            and (start_us is None or n.timestamp_us >= start_us)
+            and (end_us is None or n.timestamp_us < end_us)
+            and (tag is None or tag in n.tags)
+        ]
+        for notification in matched:
+            self._remove(notification)
+            if self.log:
+                self.log.append_delete(notification.id)
+        return [n.id for n in matched]
+
+    def _expire_due(self, now: int, limit: int) -> List[str]:
+        heap, by_id, expired = self._expiry, self._by_id, []
+        while heap and heap[0][0] <= now and len(expired) < limit:
+            notification = heappop(heap)[2]
+            if by_id.get(notification.id) is not notification:
+                continue
+            self._remove(notification)
+            expired.append(notification.id)
+            if self.log:
+                self.log.append_delete(notification.id)
+        if len(heap) > 2 * len(self._index) + 64:
+            # Drop entries for notifications that were deleted or evicted
+            self._expiry = [e for e in heap if by_id.get(e[2].id) is e[2]]
+            heapify(self._expiry)
+        return expired
+
+    def _clear(self):
+        self._index.clear()
+        self._by_id.clear()
+        self._search = SearchIndex()
+        self._tags = {}
+        self.total_bytes = 0
+        self._expiry = []
+        if self.log:
+            self.log.append_clear()
+
+    def restore(self, records: Iterable[bytes]):
+        """Load notification JSON (oldest first) without broadcasting or
+        logging it again, e.g. when replaying the log. Notifications over
+        the limits are evicted and their deletes logged.
+
+        Records are decoded a chunk at a time with the collector paused, as
+        the objects built here all live on. The tag indexes are built once
+        the limits are enforced, and the search index on the first search."""
+        from_record = StoredNotification._from_record
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        self._search = None
+        self._tags = None
+        try:
+            records = iter(records)
+            while chunk := list(islice(records, RESTORE_CHUNK)):
+                decoded = json.loads(b"[" + b",".join(chunk) + b"]")
+                for fields in decoded:
+                    notification = from_record(fields)
+                    self._apply_max_age(notification)
+                    self._put(notification)
+            # Evictions are logged so they stay gone if the limits are raised
+            self._evict(list(self._index.partitions))
+        finally:
+            self._tags = {}
+            for notification in self._by_id.values():
+                if notification.tags:
+                    self._tag(notification)
+            if gc_enabled:
+                gc.enable()
+        # Restored notifications aren't in the change log
+        self.version += 1
+        self._changes_floor = self.version
+
+    def _scope(self, pwd: Optional[str] = None, tag: Optional[str] = None):
+        """The index to read: the whole store, project ``pwd``'s partition
+        or the notifications with ``tag`` (from ``pwd`` if both are given)"""
+        if tag is not None:
+            tagged = self._tags.get(tag) or SeqIndex()
+            return tagged if pwd is None else ProjectFilter(tagged, pwd)
+        if pwd is None:
+            return self._index
+        return self._index.partitions.get(pwd) or Partition(pwd)
+
+    def iter_items_json(
+        self, pwd: Optional[str] = None, tag: Optional[str] = None
+    ) -> Iterator[bytes]:
+        """Cached JSON of each notification's API item, newest first,
+        optionally only project ``pwd``'s and/or those with ``tag``"""
+        for _, n in self._scope(pwd, tag).iter_newest():
+            yield n.item_json()
+
+    def iter_items_json_where(self, match: NotificationFilter) -> Iterator[bytes]:
+        """Cached JSON of each notification ``match`` accepts, newest first.
+        Only the partitions of projects under its ``pwd_prefix`` are read."""
+        for _, n in self._iter_newest_where(match):
+            yield n.item_json()
+
+    def snapshot(
+        self,
+        match: Optional[NotificationFilter] = None,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Iterator[Tuple[int, bytes]]:
+        """(seq, cached item JSON) of the notifications ``match`` accepts (all
+        without one) newer than sequence number ``after``, newest first and
+        at most ``limit`` of them. The notifications are picked when this is
+        called, so writes made while it is read don't show up in it; their
+        JSON is only fetched as it is read."""
+        if match:
+            newest = (n for _, n in self._iter_newest_where(match))
+        else:
+            # The id index is kept in sequence order, and walking it is much
+            # cheaper than merging every project's partition
+            newest = reversed(self._by_id.values())
+        if after is not None:
+            newest = takewhile(lambda n: n.seq > after, newest)
+        # Only references to the records, so large snapshots stay cheap
+        picked = list(islice(newest, limit))
+        return ((n.seq, n.item_json()) for n in picked)
+
+    def _iter_newest_where(
+        self, match: NotificationFilter
+    ) -> Iterator[Tuple[int, StoredNotification]]:
+        if match.pwd_prefix is None:
+            newest = self._index.iter_newest()
+        else:
+            newest = merge(
+                *(
+                    partition.iter_newest()
+                    for pwd, partition in self._index.partitions.items()
+                    if match.covers(pwd)
+                ),
+                key=itemgetter(0),
+                reverse=True,
+            )
+        for entry in newest:
+            if match.matches_record(entry[1]):
+                yield entry
+
+    def page(
+        self,
+        limit: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        pwd: Optional[str] = None,
+        tag: Optional[str] = None,
+    ) -> Page:
+        """Up to ``limit`` notifications older than ``before`` or newer than
+        ``after`` (sequence numbers), newest first, optionally only project
+        ``pwd``'s and/or those with ``tag``. O(log n + limit) per project
+        merged."""
+        index = self._scope(pwd, tag)
+        if after is not None:
+            picked = list(islice(index.iter_oldest(after), limit))
+            picked.reverse()
+        else:
+            picked = list(islice(index.iter_newest(before), limit))
+        if not picked:
+            return Page([], None, None)
+        oldest_seq, newest_seq = picked[-1][0], picked[0][0]
+        has_older = next(index.iter_newest(oldest_seq), None) is not None
+        has_newer = next(index.iter_oldest(newest_seq), None) is not None
+        return Page(
+            [n.item_json() for _, n in picked],
+            oldest_seq if has_older else None,
+            newest_seq if has_newer else None,
+        )
+
+    def search(
+        self,
+        query: str,
+        pwd: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[int, List[bytes]]:
+        """Total matches and one ranked page of item JSON for a message
+        search with prefix matching; see ``SearchIndex``"""
+        search, index = self._search, self._index
+        if search is None:
+            search = self._search = SearchIndex()
+            for notification in self._by_id.values():
+                search.add(notification.seq, notification.message, notification.pwd)
+        total, seqs = search.search(query, pwd=pwd, limit=limit, offset=offset)
+        return total, [index.get(search.pwd_of(seq), seq).item_json() for seq in seqs]
+
+    def close(self):
+        """Flush and release any storage resources"""
+        if self.log:
+            self.log.close()
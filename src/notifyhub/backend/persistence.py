@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import typing as tp
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{8})\.log$")
+
+# One record per line:
+#   +<json id>\t<notification json>   add (or replace, moving it to the end)
+#   =<json id>\t<notification json>   update in place, if still present
+#   -<json id>                        delete
+#   !                                 clear
+# IDs are JSON-encoded so they never contain a tab or newline, which lets
+# replay fold the log by ID without parsing any notification bodies.
+OP_ADD = b"+"
+OP_UPDATE = b"="
+OP_DELETE = b"-"
+OP_CLEAR = b"!"
+
+
+def _segment_name(index: int) -> str:
+    return f"segment-{index:08d}.log"
+
+
+class NotificationLog:
+    """Segmented append-only log of store mutations.
+
+    Records are add / update / delete / clear lines (see ``OP_*``). Appends are queued
+    and written by a single writer thread that fsyncs once per batch (group
+    commit), so ingest never waits on the disk. Sealed segments are folded
+    into one compacted segment in the background once enough pile up.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        fsync_interval_ms: int = 20,
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        compact_after_segments: int = 4,
+    ):
+        self.directory = directory
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_after_segments = compact_after_segments
+
+        self._cond = threading.Condition()
+        self._pending: tp.List[bytes] = []
+        self._closing = False
+        self._writer: tp.Optional[threading.Thread] = None
+        self._compactor: tp.Optional[threading.Thread] = None
+        self._file: tp.Optional[tp.BinaryIO] = None
+        self._active_index = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    # -----------------------------------
+    #              Segments
+    # -----------------------------------
+
+    def segments(self) -> tp.List[int]:
+        """Indexes of all segment files on disk, oldest first"""
+        indexes = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                indexes.append(int(match.group(1)))
+        return sorted(indexes)
+
+    def _path(self, index: int) -> str:
+        return os.path.join(self.directory, _segment_name(index))
+
+    # -----------------------------------
+    #              Replay
+    # -----------------------------------
+
+    def replay(self) -> tp.List[bytes]:
+        """Rebuild the live notifications (oldest first) from all segments.
+
+        Returns each notification's JSON; parsing is left to the caller.
+        """
+        return list(self._fold(self.segments()).values())
+
+    def _fold(self, indexes: tp.List[int]) -> tp.Dict[bytes, bytes]:
+        live: tp.Dict[bytes, bytes] = {}
+        for index in indexes:
+            with open(self._path(index), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn write from a crash; only ever the last line
+                        logging.warning(
+                            f"Skipping truncated record in {_segment_name(index)}"
+                        )
+                        continue
+                    op = line[:1]
+                    if op == OP_ADD:
+                        tab = line.index(b"\t")
+                        key = line[1:tab]
+                        live.pop(key, None)
+                        live[key] = line[tab + 1 : -1]
+                    elif op == OP_UPDATE:
+                        tab = line.index(b"\t")
+                        key = line[1:tab]
+                        if key in live:
+                            live[key] = line[tab + 1 : -1]
+                    elif op == OP_DELETE:
+                        live.pop(line[1:-1], None)
+                    elif op == OP_CLEAR:
+                        live.clear()
+        return live
+
+    # -----------------------------------
+    #              Appending
+    # -----------------------------------
+
+    def open(self):
+        """Start a fresh segment and the background writer"""
+        existing = self.segments()
+        self._active_index = (existing[-1] + 1) if existing else 1
+        self._file = open(self._path(self._active_index), "ab")
+        self._closing = False
+        self._writer = threading.Thread(
+            target=self._run_writer, name="notifyhub-log-writer", daemon=True
+        )
+        self._writer.start()
+
+    def append_add(self, notification_id: str, notification_json: str):
+        key = json.dumps(notification_id)
+        self._append(f"+{key}\t{notification_json}\n".encode("utf-8"))
+
+    def append_update(self, notification_id: str, notification_json: str):
+        key = json.dumps(notification_id)
+        self._append(f"={key}\t{notification_json}\n".encode("utf-8"))
+
+    def append_delete(self, notification_id: str):
+        self._append(f"-{json.dumps(notification_id)}\n".encode("utf-8"))
+
+    def append_clear(self):
+        self._append(OP_CLEAR + b"\n")
+
+    def _append(self, line: bytes):
+        with self._cond:
+            self._pending.append(line)
+            self._cond.notify()
+
+    def close(self):
+        """Flush everything pending and stop the writer"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._writer:
+            self._writer.join()
+            self._writer = None
+        if self._compactor:
+            self._compactor.join()
+            self._compactor = None
+
+    def _run_writer(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                batch, self._pending = self._pending, []
+                closing = self._closing
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logging.error(f"Failed to write notification log: {e}")
+
+            if closing:
+                with self._cond:
+                    if self._pending:
+                        continue
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                return
+
+            # Let the next batch accumulate; bounds the fsync rate
+            time.sleep(self.fsync_interval)
+
+    def _write_batch(self, batch: tp.List[bytes]):
+        assert self._file is not None
+        self._file.write(b"".join(batch))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        if self._file.tell() >= self.segment_max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        assert self._file is not None
+        self._file.close()
+        self._active_index += 1
+        self._file = open(self._path(self._active_index), "ab")
+
+        sealed = [i for i in self.segments() if i < self._active_index]
+        compacting = self._compactor is not None and self._compactor.is_alive()
+        if len(sealed) >= self.compact_after_segments and not compacting:
+            self._compactor = threading.Thread(
+                target=self.compact,
+                args=(sealed,),
+                name="notifyhub-log-compactor",
+                daemon=True,
+            )
+            self._compactor.start()
+
+    # -----------------------------------
+    #             Compaction
+    # -----------------------------------
+
+    def compact(self, sealed: tp.List[int]):
+        """Fold sealed segments into one holding only live notifications.
+
+        The result replaces the newest sealed segment and starts with a
+        ``clear`` record, so a crash part-way through removing the older
+        segments still replays to the same state.
+        """
+        if not sealed:
+            return
+        live = self._fold(sealed)
+
+        target = self._path(sealed[-1])
+        tmp_path = target + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(OP_CLEAR + b"\n")
+            for key, notification_json in live.items():
+                f.write(OP_ADD + key + b"\t" + notification_json + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, target)
+
+        for index in sealed[:-1]:
+            os.remove(self._path(index))
+        logging.info(
+            f"Compacted {len(sealed)} log segments into {_segment_name(sealed[-1])} "
+            f"({len(live)} live notifications)"
+        )
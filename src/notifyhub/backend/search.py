@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import heapq
+import re
+import typing as tp
+from bisect import bisect_left
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> tp.List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def query_terms(query: str) -> tp.List[str]:
+    """Unique query tokens, in order"""
+    return list(dict.fromkeys(tokenize(query)))
+
+
+class SearchIndex:
+    """Incremental inverted index over notification messages.
+
+    Documents are keyed by the store's sequence number. Every query term
+    matches the indexed tokens it is a prefix of (the vocabulary is sorted
+    lazily on the next query, so expansion is a bisect) and all terms must
+    match. Documents
+    where every term is a whole token rank first; ties go to the newest.
+    """
+
+    def __init__(self):
+        self._postings: tp.Dict[str, tp.Set[int]] = {}
+        # Sorted; tokens whose postings emptied stay until pruned
+        self._vocab: tp.List[str] = []
+        # New tokens not yet merged into _vocab
+        self._pending: tp.List[str] = []
+        self._docs: tp.Dict[int, tp.Tuple[tp.Tuple[str, ...], tp.Optional[str]]] = {}
+        self._by_pwd: tp.Dict[tp.Optional[str], tp.Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, seq: int, message: str, pwd: tp.Optional[str] = None):
+        tokens = tuple(dict.fromkeys(tokenize(message)))
+        self._docs[seq] = (tokens, pwd)
+        self._by_pwd.setdefault(pwd, set()).add(seq)
+        postings = self._postings
+        for token in tokens:
+            docs = postings.get(token)
+            if docs is None:
+                postings[token] = {seq}
+                self._pending.append(token)
+            else:
+                docs.add(seq)
+
+    def remove(self, seq: int):
+        doc = self._docs.pop(seq, None)
+        if doc is None:
+            return
+        tokens, pwd = doc
+        same_pwd = self._by_pwd[pwd]
+        same_pwd.discard(seq)
+        if not same_pwd:
+            del self._by_pwd[pwd]
+        postings = self._postings
+        for token in tokens:
+            docs = postings[token]
+            docs.discard(seq)
+            if not docs:
+                del postings[token]
+        if len(self._vocab) > 2 * len(postings) + 1024:
+            self._vocab = [t for t in self._vocab if t in postings]
+            self._pending = [t for t in self._pending if t in postings]
+
+    def pwd_of(self, seq: int) -> tp.Optional[str]:
+        return self._docs[seq][1]
+
+    def clear(self):
+        self._postings = {}
+        self._vocab = []
+        self._pending = []
+        self._docs = {}
+        self._by_pwd = {}
+
+    def _expand(self, term: str) -> tp.List[tp.Set[int]]:
+        """Postings of every token starting with ``term``"""
+        if self._pending:
+            # Timsort merges the two sorted runs in linear time
+            self._pending.sort()
+            self._vocab += self._pending
+            self._vocab.sort()
+            self._pending = []
+        vocab, postings = self._vocab, self._postings
+        expanded = []
+        previous = None
+        for i in range(bisect_left(vocab, term), len(vocab)):
+            token = vocab[i]
+            if not token.startswith(term):
+                break
+            # A token dropped and re-added before pruning appears twice
+            if token == previous:
+                continue
+            previous = token
+            docs = postings.get(token)
+            if docs:
+                expanded.append(docs)
+        return expanded
+
+    def search(
+        self,
+        query: str,
+        pwd: tp.Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> tp.Tuple[int, tp.List[int]]:
+        """Total match count and one page of ranked sequence numbers"""
+        terms = query_terms(query)
+        if not terms:
+            return 0, []
+
+        expansions = [(term, self._expand(term)) for term in terms]
+        # Most selective term first so the candidate set starts small
+        expansions.sort(key=lambda e: sum(len(docs) for docs in e[1]))
+
+        candidates: tp.Optional[tp.Set[int]] = None
+        if pwd is not None:
+            candidates = self._by_pwd.get(pwd, set())
+        for term, expanded in expansions:
+            if not expanded:
+                return 0, []
+            # Never updated in place: candidates may be an index set
+            if candidates is None:
+                candidates = expanded[0] if len(expanded) == 1 else set().union(*expanded)
+            elif len(expanded) == 1:
+                # Set intersection walks the smaller side
+                candidates = candidates & expanded[0]
+            elif sum(len(docs) for docs in expanded) < len(candidates):
+                candidates = candidates & set().union(*expanded)
+            else:
+                # Cheaper to check the remaining candidates' own tokens
+                docs = self._docs
+                candidates = {
+                    seq
+                    for seq in candidates
+                    if any(t.startswith(term) for t in docs[seq][0])
+                }
+            if not candidates:
+                return 0, []
+        assert candidates is not None
+
+        # Whole-token matches on every term rank above prefix-only matches
+        exact = candidates
+        for term in terms:
+            docs = self._postings.get(term, set())
+            if docs is not exact:
+                exact = exact & docs
+        wanted = offset + limit
+        ranked = heapq.nlargest(wanted, exact)
+        if len(ranked) < wanted and len(exact) < len(candidates):
+            ranked += heapq.nlargest(wanted - len(ranked), candidates - exact)
+        return len(candidates), ranked[offset:]
@@ -0,0 +1,618 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import typing as tp
+from collections.abc import Sequence
+from itertools import islice, takewhile
+
+from .models import (
+    Notification,
+    NotificationFilter,
+    NotificationStore,
+    Page,
+    Project,
+    StoredNotification,
+    parse_tags,
+    priority_of,
+    to_epoch_us,
+)
+from .search import query_terms
+
+# Rows fetched per round-trip when streaming the store newest-first
+PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    pwd TEXT,
+    data TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    expires_us INTEGER,
+    repeats INTEGER NOT NULL DEFAULT 1,
+    timestamp_us INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_id ON notifications(id);
+CREATE INDEX IF NOT EXISTS idx_notifications_timestamp ON notifications(timestamp);
+CREATE INDEX IF NOT EXISTS idx_notifications_pwd ON notifications(pwd, seq);
+"""
+
+# Columns added after the first release, for databases created before them
+MIGRATIONS = {
+    "size": (
+        "ALTER TABLE notifications ADD COLUMN size INTEGER NOT NULL DEFAULT 0",
+        # Approximates the length of the API item JSON
+        "UPDATE notifications SET size = length(data) + length(id) + length(timestamp) + 36",
+    ),
+    "expires_us": ("ALTER TABLE notifications ADD COLUMN expires_us INTEGER",),
+    "repeats": (
+        "ALTER TABLE notifications ADD COLUMN repeats INTEGER NOT NULL DEFAULT 1",
+        # Repeat counts used to be written into data.count
+        "UPDATE notifications SET repeats = json_extract(data, '$.count'),"
+        " data = json_remove(data, '$.count')"
+        " WHERE json_type(data, '$.count') = 'integer'",
+    ),
+    # Filled in by _backfill_timestamps
+    "timestamp_us": ("ALTER TABLE notifications ADD COLUMN timestamp_us INTEGER",),
+}
+EXPIRY_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_notifications_expires"
+    " ON notifications(expires_us) WHERE expires_us IS NOT NULL"
+)
+# The timestamp in epoch microseconds, for exact range filters;
+# julianday() only keeps milliseconds
+TIMESTAMP_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_notifications_timestamp_us"
+    " ON notifications(timestamp_us)"
+)
+# Applies the age limit to rows stored before it was configured (or while
+# it was longer)
+SQL_APPLY_MAX_AGE = (
+    "UPDATE notifications SET expires_us = :limit_us + timestamp_us"
+    " WHERE expires_us IS NULL OR expires_us > :limit_us + timestamp_us"
+)
+
+# Contentless FTS5 index over messages, kept in sync by triggers so
+# evictions and clears are covered too
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS notifications_fts USING fts5(message, content='');
+CREATE TRIGGER IF NOT EXISTS notifications_fts_insert AFTER INSERT ON notifications BEGIN
+    INSERT INTO notifications_fts(rowid, message)
+    VALUES (new.seq, json_extract(new.data, '$.message'));
+END;
+CREATE TRIGGER IF NOT EXISTS notifications_fts_delete AFTER DELETE ON notifications BEGIN
+    INSERT INTO notifications_fts(notifications_fts, rowid, message)
+    VALUES ('delete', old.seq, json_extract(old.data, '$.message'));
+END;
+"""
+# tag -> seq index; the tags are the ones parsed at ingest into data.tags
+TAGS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification_tags (
+    tag TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (tag, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_notification_tags_seq ON notification_tags(seq);
+CREATE TRIGGER IF NOT EXISTS notification_tags_insert AFTER INSERT ON notifications BEGIN
+    INSERT OR IGNORE INTO notification_tags(tag, seq)
+    SELECT value, new.seq FROM json_each(new.data, '$.tags');
+END;
+CREATE TRIGGER IF NOT EXISTS notification_tags_delete AFTER DELETE ON notifications BEGIN
+    DELETE FROM notification_tags WHERE seq = old.seq;
+END;
+"""
+SQL_INSERT_TAG = "INSERT OR IGNORE INTO notification_tags(tag, seq) VALUES (?, ?)"
+
+SQL_FTS_BACKFILL = (
+    "INSERT INTO notifications_fts(rowid, message)"
+    " SELECT seq, json_extract(data, '$.message') FROM notifications"
+)
+
+# data holds the fields as posted; the repeat count has its own column and
+# is only merged into the API's data.count when reading
+DATA = "CASE WHEN repeats > 1 THEN json_set(data, '$.count', repeats) ELSE data END"
+
+# Kept as constants so sqlite3's statement cache reuses the prepared statements
+SQL_INSERT = (
+    "INSERT INTO notifications"
+    " (id, timestamp, pwd, data, size, expires_us, repeats, timestamp_us)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_DELETE_ID = "DELETE FROM notifications WHERE id = ? RETURNING size"
+SQL_SELECT_ID = f"SELECT id, timestamp, {DATA} FROM notifications WHERE id = ?"
+SQL_EXISTS_ID = "SELECT 1 FROM notifications WHERE id = ?"
+SQL_SELECT_REPEATS = f"SELECT {DATA}, size, repeats FROM notifications WHERE id = ?"
+SQL_UPDATE_REPEATS = "UPDATE notifications SET repeats = ?, size = ? WHERE id = ?"
+# {filters} narrows to one project and/or tag, served by the (pwd, seq)
+# and (tag, seq) indexes
+SQL_PAGE = (
+    f"SELECT seq, id, timestamp, {DATA} FROM notifications"
+    " WHERE seq < ?{filters} ORDER BY seq DESC LIMIT ?"
+)
+SQL_PAGE_AFTER = (
+    f"SELECT seq, id, timestamp, {DATA} FROM notifications"
+    " WHERE seq > ?{filters} ORDER BY seq ASC LIMIT ?"
+)
+SQL_MAX_SEQ = "SELECT COALESCE(MAX(seq), 0) FROM notifications"
+SQL_HAS_BEFORE = "SELECT 1 FROM notifications WHERE seq < ?{filters} LIMIT 1"
+SQL_HAS_AFTER = "SELECT 1 FROM notifications WHERE seq > ?{filters} LIMIT 1"
+SQL_COUNT = "SELECT COUNT(*) FROM notifications WHERE 1{filters}"
+SQL_TAGGED = " AND {seq} IN (SELECT seq FROM notification_tags WHERE tag = ?)"
+SQL_PROJECTS = (
+    "SELECT p.pwd, p.count, n.timestamp FROM"
+    " (SELECT pwd, COUNT(*) AS count, MAX(seq) AS last FROM notifications GROUP BY pwd) p"
+    " JOIN notifications n ON n.seq = p.last ORDER BY p.last DESC"
+)
+SQL_PROJECT_TOTALS = (
+    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM notifications WHERE pwd IS ?"
+)
+SQL_OFFSET = (
+    f"SELECT id, timestamp, {DATA} FROM notifications"
+    " ORDER BY seq DESC LIMIT 1 OFFSET ?"
+)
+SQL_SEARCH = (
+    "SELECT n.id, n.timestamp,"
+    " CASE WHEN n.repeats > 1 THEN json_set(n.data, '$.count', n.repeats) ELSE n.data END"
+    " FROM notifications_fts"
+    " JOIN notifications n ON n.seq = notifications_fts.rowid"
+    " WHERE notifications_fts MATCH ?{filters}"
+    " ORDER BY notifications_fts.rank, n.seq DESC LIMIT ? OFFSET ?"
+)
+SQL_SEARCH_COUNT = (
+    "SELECT COUNT(*) FROM notifications_fts"
+    " JOIN notifications n ON n.seq = notifications_fts.rowid"
+    " WHERE notifications_fts MATCH ?{filters}"
+)
+SQL_EVICT = (
+    "DELETE FROM notifications WHERE seq IN"
+    " (SELECT seq FROM notifications ORDER BY seq ASC LIMIT ?) RETURNING size"
+)
+SQL_EVICT_PWD = (
+    "DELETE FROM notifications WHERE seq IN"
+    " (SELECT seq FROM notifications WHERE pwd IS ? ORDER BY seq ASC LIMIT ?)"
+    " RETURNING size"
+)
+SQL_DELETE_WHERE = "DELETE FROM notifications WHERE 1{filters} RETURNING id, size"
+# Bound parameters per "id IN (...)" chunk, well under SQLite's limit
+DELETE_IDS_CHUNK = 500
+SQL_EXPIRE = (
+    "DELETE FROM notifications WHERE seq IN"
+    " (SELECT seq FROM notifications WHERE expires_us <= ?"
+    " ORDER BY expires_us LIMIT ?) RETURNING id, size"
+)
+
+MAX_SEQ = 2**63 - 1
+
+
+def _filters(
+    pwd: tp.Optional[str], tag: tp.Optional[str] = None, prefix: str = ""
+) -> tp.Tuple[str, tp.List[str]]:
+    """SQL conditions (each starting with AND) and their parameters"""
+    sql, params = "", []
+    if pwd is not None:
+        sql += f" AND {prefix}pwd = ?"
+        params.append(pwd)
+    if tag is not None:
+        sql += SQL_TAGGED.format(seq=f"{prefix}seq")
+        params.append(tag)
+    return sql, params
+
+
+def _row_to_notification(notification_id: str, timestamp: str, data: str) -> Notification:
+    return Notification(id=notification_id, timestamp=timestamp, **json.loads(data))
+
+
+def _row_to_item_json(notification_id: str, timestamp: str, data: str) -> bytes:
+    # Assembled from the stored JSON so rows never round-trip through objects
+    return (
+        f'{{"id": {json.dumps(notification_id, ensure_ascii=False)}, "data": {data}, '
+        f'"timestamp": {json.dumps(timestamp)}}}'
+    ).encode("utf-8")
+
+
+class SQLiteNotificationsView(Sequence):
+    """Newest-first view backed by queries instead of an in-memory list"""
+
+    def __init__(self, store: "SQLiteNotificationStore"):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __iter__(self) -> tp.Iterator[Notification]:
+        for _, notification_id, timestamp, data in self._store._iter_rows():
+            yield _row_to_notification(notification_id, timestamp, data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("notification index out of range")
+        row = self._store._conn.execute(SQL_OFFSET, (index,)).fetchone()
+        return _row_to_notification(*row)
+
+
+class SQLiteNotificationStore(NotificationStore):
+    """NotificationStore that keeps history in a local SQLite database.
+
+    The database runs in WAL mode. Writes share one open transaction that is
+    committed after ``batch_size`` inserts or ``commit_interval_ms``,
+    whichever comes first; reads go through the same connection and so
+    always see uncommitted writes. ``max_count=None`` keeps everything.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sse_manager=None,
+        max_count=None,
+        batch_size: int = 256,
+        commit_interval_ms: int = 50,
+        change_log_size: int = 10000,
+        max_bytes: tp.Optional[int] = None,
+        max_age: tp.Optional[float] = None,
+        coalesce_window: float = 0,
+        project_max_count: tp.Optional[int] = None,
+        project_max_bytes: tp.Optional[int] = None,
+    ):
+        super().__init__(
+            sse_manager=sse_manager,
+            change_log_size=change_log_size,
+            max_bytes=max_bytes,
+            max_age=max_age,
+            coalesce_window=coalesce_window,
+            project_max_count=project_max_count,
+            project_max_bytes=project_max_bytes,
+        )
+        self.max_notifications = max_count
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval_ms / 1000
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        has_fts = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'notifications_fts'"
+        ).fetchone()
+        self._conn.executescript(FTS_SCHEMA)
+        if not has_fts:
+            self._conn.execute(SQL_FTS_BACKFILL)
+            self._conn.commit()
+        has_tags = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'notification_tags'"
+        ).fetchone()
+        self._conn.executescript(TAGS_SCHEMA)
+        if not has_tags:
+            self._backfill_tags()
+        self._count, self.total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM notifications"
+        ).fetchone()
+        self._uncommitted = 0
+        self._commit_handle: tp.Optional[asyncio.TimerHandle] = None
+
+    def _migrate(self):
+        conn = self._conn
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(notifications)")}
+        for column, statements in MIGRATIONS.items():
+            if column not in columns:
+                for statement in statements:
+                    conn.execute(statement)
+        if "timestamp_us" not in columns:
+            self._backfill_timestamps()
+        conn.execute(EXPIRY_INDEX)
+        conn.execute(TIMESTAMP_INDEX)
+        if self.max_age is not None:
+            conn.execute(SQL_APPLY_MAX_AGE, {"limit_us": int(self.max_age * 1_000_000)})
+        conn.commit()
+
+    def _backfill_timestamps(self):
+        rows = self._conn.execute("SELECT seq, timestamp FROM notifications").fetchall()
+        self._conn.executemany(
+            "UPDATE notifications SET timestamp_us = ? WHERE seq = ?",
+            [(to_epoch_us(timestamp), seq) for seq, timestamp in rows],
+        )
+
+    def _backfill_tags(self):
+        # Rows stored before tags were parsed only have the message markup
+        tagged = []
+        for seq, data in self._conn.execute("SELECT seq, data FROM notifications"):
+            record = json.loads(data)
+            for tag in parse_tags(record.get("message", ""), record.get("tags")):
+                tagged.append((tag, seq))
+        self._conn.executemany(SQL_INSERT_TAG, tagged)
+        self._conn.commit()
+
+    # -----------------------------------
+    #              Reading
+    # -----------------------------------
+
+    @property
+    def notifications(self) -> SQLiteNotificationsView:
+        """Stored notifications, newest first"""
+        return SQLiteNotificationsView(self)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def count(self, pwd: tp.Optional[str] = None, tag: tp.Optional[str] = None) -> int:
+        if pwd is None and tag is None:
+            return self._count
+        filters, params = _filters(pwd, tag)
+        return self._conn.execute(SQL_COUNT.format(filters=filters), params).fetchone()[0]
+
+    def projects(self) -> tp.List[Project]:
+        return [Project(*row) for row in self._conn.execute(SQL_PROJECTS)]
+
+    def get(self, notification_id: str) -> tp.Optional[Notification]:
+        row = self._conn.execute(SQL_SELECT_ID, (notification_id,)).fetchone()
+        return _row_to_notification(*row) if row else None
+
+    def _iter_rows(
+        self,
+        pwd: tp.Optional[str] = None,
+        tag: tp.Optional[str] = None,
+        before: int = MAX_SEQ,
+    ) -> tp.Iterator[tp.Tuple[int, str, str, str]]:
+        # Keyset pagination keeps each query short and tolerates writes
+        # landing between pages
+        filters, params = _filters(pwd, tag)
+        sql = SQL_PAGE.format(filters=filters)
+        while True:
+            rows = self._conn.execute(sql, [before, *params, PAGE_SIZE]).fetchall()
+            yield from rows
+            if len(rows) < PAGE_SIZE:
+                return
+            before = rows[-1][0]
+
+    def iter_items_json(
+        self, pwd: tp.Optional[str] = None, tag: tp.Optional[str] = None
+    ) -> tp.Iterator[bytes]:
+        for _, notification_id, timestamp, data in self._iter_rows(pwd, tag):
+            yield _row_to_item_json(notification_id, timestamp, data)
+
+    def iter_items_json_where(self, match: NotificationFilter) -> tp.Iterator[bytes]:
+        for _, notification_id, timestamp, data in self._iter_rows_where(match):
+            yield _row_to_item_json(notification_id, timestamp, data)
+
+    def snapshot(self, match=None, limit=None, after=None):
+        # Rows are read page by page below the current newest, so rows
+        # written while the snapshot is read stay out of it
+        head = self._conn.execute(SQL_MAX_SEQ).fetchone()[0]
+        if match:
+            rows = self._iter_rows_where(match, before=head + 1)
+        else:
+            rows = self._iter_rows(before=head + 1)
+        if after is not None:
+            rows = takewhile(lambda row: row[0] > after, rows)
+        return ((row[0], _row_to_item_json(*row[1:])) for row in islice(rows, limit))
+
+    def _iter_rows_where(
+        self, match: NotificationFilter, before: int = MAX_SEQ
+    ) -> tp.Iterator[tp.Tuple[int, str, str, str]]:
+        # A single wanted tag narrows the scan through the tag index
+        tag = next(iter(match.tags)) if len(match.tags) == 1 else None
+        for row in self._iter_rows(tag=tag, before=before):
+            fields = json.loads(row[3])
+            tags = fields.get("tags")
+            if match.matches(
+                fields.get("pwd"),
+                tags if isinstance(tags, list) else (),
+                priority_of(fields.get("priority")),
+            ):
+                yield row
+
+    def page(self, limit: int, before=None, after=None, pwd=None, tag=None) -> Page:
+        conn = self._conn
+        filters, params = _filters(pwd, tag)
+        if after is not None:
+            rows = conn.execute(
+                SQL_PAGE_AFTER.format(filters=filters), [after, *params, limit]
+            ).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(
+                SQL_PAGE.format(filters=filters),
+                [MAX_SEQ if before is None else before, *params, limit],
+            ).fetchall()
+        if not rows:
+            return Page([], None, None)
+        oldest_seq, newest_seq = rows[-1][0], rows[0][0]
+        has_older = conn.execute(
+            SQL_HAS_BEFORE.format(filters=filters), [oldest_seq, *params]
+        ).fetchone()
+        has_newer = conn.execute(
+            SQL_HAS_AFTER.format(filters=filters), [newest_seq, *params]
+        ).fetchone()
+        return Page(
+            [_row_to_item_json(*row[1:]) for row in rows],
+            oldest_seq if has_older else None,
+            newest_seq if has_newer else None,
+        )
+
+    def search(self, query: str, pwd=None, limit: int = 20, offset: int = 0):
+        terms = query_terms(query)
+        if not terms:
+            return 0, []
+        # Same tokens as the in-memory index, each as a prefix query
+        match = " ".join(f'"{term}"*' for term in terms)
+        filters, filter_params = _filters(pwd, prefix="n.")
+        params: tp.List[tp.Any] = [match, *filter_params]
+        total = self._conn.execute(
+            SQL_SEARCH_COUNT.format(filters=filters), params
+        ).fetchone()[0]
+        rows = self._conn.execute(
+            SQL_SEARCH.format(filters=filters), params + [limit, offset]
+        ).fetchall()
+        return total, [_row_to_item_json(*row) for row in rows]
+
+    # -----------------------------------
+    #              Writing
+    # -----------------------------------
+
+    def _removed(self, sizes: tp.Iterable[int]):
+        for size in sizes:
+            self._count -= 1
+            self.total_bytes -= size
+
+    def _insert(self, data: StoredNotification):
+        conn = self._conn
+        self._removed(row[0] for row in conn.execute(SQL_DELETE_ID, (data.id,)).fetchall())
+        conn.execute(
+            SQL_INSERT,
+            (
+                data.id,
+                data.timestamp,
+                data.pwd,
+                json.dumps(data.fields(), ensure_ascii=False, separators=(",", ":")),
+                data.size,
+                data.expires_us,
+                data.count,
+                data.timestamp_us,
+            ),
+        )
+        self._count += 1
+        self.total_bytes += data.size
+        self._written()
+
+    def _contains(self, notification_id: str) -> bool:
+        return self._conn.execute(SQL_EXISTS_ID, (notification_id,)).fetchone() is not None
+
+    def _bump_count(self, notification_id: str, by: int) -> tp.Optional[int]:
+        row = self._conn.execute(SQL_SELECT_REPEATS, (notification_id,)).fetchone()
+        if row is None:
+            return None
+        rendered, old_size, repeats = row
+        repeats += by
+        data = json.loads(rendered)
+        data["count"] = repeats
+        updated = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        size = old_size + len(updated) - len(rendered)
+        self._conn.execute(SQL_UPDATE_REPEATS, (repeats, size, notification_id))
+        self.total_bytes += size - old_size
+        self._written()
+        return repeats
+
+    def _evict(self, pwds=()):
+        if self.project_max_count is not None or self.project_max_bytes is not None:
+            for pwd in pwds:
+                self._evict_project(pwd)
+        while self._over_limits():
+            excess = 1
+            if self.max_notifications is not None:
+                excess = max(self._count - self.max_notifications, 1)
+            rows = self._conn.execute(SQL_EVICT, (excess,)).fetchall()
+            if not rows:
+                break
+            self._removed(row[0] for row in rows)
+            self._written()
+
+    def _evict_project(self, pwd: tp.Optional[str]):
+        conn = self._conn
+        while True:
+            count, total_bytes = conn.execute(SQL_PROJECT_TOTALS, (pwd,)).fetchone()
+            if not self._exceeds(
+                count, total_bytes, self.project_max_count, self.project_max_bytes
+            ):
+                return
+            excess = 1
+            if self.project_max_count is not None:
+                excess = max(count - self.project_max_count, 1)
+            rows = conn.execute(SQL_EVICT_PWD, (pwd, excess)).fetchall()
+            if not rows:
+                return
+            self._removed(row[0] for row in rows)
+            self._written()
+
+    def _delete(self, notification_id: str) -> bool:
+        rows = self._conn.execute(SQL_DELETE_ID, (notification_id,)).fetchall()
+        if not rows:
+            return False
+        self._removed(row[0] for row in rows)
+        self._written()
+        return True
+
+    def _delete_matching(self, ids, pwd, tag, start_us, end_us) -> tp.List[str]:
+        filters, params = _filters(pwd, tag)
+        if start_us is not None:
+            filters += " AND timestamp_us >= ?"
+            params.append(start_us)
+        if end_us is not None:
+            filters += " AND timestamp_us < ?"
+            params.append(end_us)
+
+        rows = []
+        if ids is None:
+            sql = SQL_DELETE_WHERE.format(filters=filters)
+            rows = self._conn.execute(sql, params).fetchall()
+        else:
+            ids = list(dict.fromkeys(ids))
+            for i in range(0, len(ids), DELETE_IDS_CHUNK):
+                chunk = ids[i : i + DELETE_IDS_CHUNK]
+                id_filter = f" AND id IN ({','.join('?' * len(chunk))})"
+                sql = SQL_DELETE_WHERE.format(filters=id_filter + filters)
+                rows += self._conn.execute(sql, chunk + params).fetchall()
+        if rows:
+            self._removed(row[1] for row in rows)
+            self._written()
+        return [row[0] for row in rows]
+
+    def _expire_due(self, now: int, limit: int) -> tp.List[str]:
+        rows = self._conn.execute(SQL_EXPIRE, (now, limit)).fetchall()
+        if rows:
+            self._removed(row[1] for row in rows)
+            self._written()
+        return [row[0] for row in rows]
+
+    def _clear(self):
+        self._conn.execute("DELETE FROM notifications")
+        self._count = 0
+        self.total_bytes = 0
+        self._written()
+
+    def restore(self, records):
+        """No-op: the database already holds everything it stored, so there
+        is no log to replay into it"""
+
+    def _written(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.batch_size:
+            self.commit()
+            return
+        if self._commit_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # No event loop to batch on (scripts, tests); commit now
+                self.commit()
+                return
+            self._commit_handle = loop.call_later(self.commit_interval, self.commit)
+
+    def commit(self):
+        """Commit the open write batch"""
+        if self._commit_handle is not None:
+            self._commit_handle.cancel()
+            self._commit_handle = None
+        if self._uncommitted:
+            try:
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to commit notifications to {self.path}: {e}")
+            self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self._conn.close()
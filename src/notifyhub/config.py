@@ -9,13 +9,103 @@ class NotifyHubBackendConfig(pdt.BaseModel):
 
     host: str = pdt.Field("0.0.0.0", description="Host to bind server to")
     port: int = pdt.Field(9080, description="Port to run server on")
+    compression_level: int = pdt.Field(
+        6,
+        ge=0,
+        le=9,
+        description="zlib level for gzip/deflate compression of /events and notification lists, negotiated via Accept-Encoding; 0 disables it",
+    )
     sse_heartbeat_interval: int = pdt.Field(
         30, description="SSE heartbeat interval in seconds"
     )
+    sse_buffer_size: int = pdt.Field(
+        4096,
+        description="Events kept in the shared broadcast ring; bounds memory however far an SSE client falls behind",
+    )
+    sse_slow_consumer_policy: tp.Literal["disconnect", "drop_oldest", "resync"] = (
+        pdt.Field(
+            "disconnect",
+            description="What to do with an SSE client more than sse_buffer_size events behind: disconnect it so it resumes from the change log, drop the oldest events it missed, or resync it with a fresh snapshot",
+        )
+    )
+    sse_batch_window_ms: int = pdt.Field(
+        20,
+        description="Window in milliseconds within which a burst of events is merged into one batch event, for SSE clients connecting with ?batch=1",
+    )
+    sse_retry_ms: int = pdt.Field(
+        1000,
+        description="Reconnection delay in milliseconds sent to SSE clients in retry: hints",
+    )
+    sse_retry_jitter_ms: int = pdt.Field(
+        4000,
+        description="Up to this many milliseconds added at random to each client's reconnection delay, so clients reconnecting after a restart arrive spread out",
+    )
+    sse_init_rate: float = pdt.Field(
+        20,
+        ge=0,
+        description="Snapshots built per second at most for connecting clients; clients served a snapshot already built for the same store version are not limited. 0 for unlimited",
+    )
+    sse_init_burst: int = pdt.Field(
+        10,
+        ge=1,
+        description="Snapshots built at once before sse_init_rate applies",
+    )
+    sse_change_log_size: int = pdt.Field(
+        10000,
+        description="Recent changes kept so reconnecting SSE clients can resume instead of reloading everything",
+    )
     notifications_max_count: tp.Optional[int] = pdt.Field(
         None,
         description="Maximum number of notifications to store (None for unlimited)",
     )
+    notifications_max_bytes: tp.Optional[int] = pdt.Field(
+        None,
+        description="Maximum total size in bytes of stored notification payloads; oldest are evicted first (None for unlimited)",
+    )
+    notifications_project_max_count: tp.Optional[int] = pdt.Field(
+        None,
+        description="Maximum number of notifications kept per project (pwd); a project over it evicts only its own oldest (None for unlimited)",
+    )
+    notifications_project_max_bytes: tp.Optional[int] = pdt.Field(
+        None,
+        description="Maximum total payload bytes kept per project (pwd) (None for unlimited)",
+    )
+    notifications_max_age: tp.Optional[float] = pdt.Field(
+        None,
+        description="Remove notifications older than this many seconds (None to keep forever)",
+    )
+    notifications_sweep_interval: float = pdt.Field(
+        1.0,
+        description="Seconds between sweeps for notifications past their age limit or TTL",
+    )
+    notifications_coalesce_window: float = pdt.Field(
+        0,
+        description="Seconds within which a repeat of the same message, pwd and tags only bumps the stored notification's count (0 to disable)",
+    )
+    notifications_storage: tp.Literal["memory", "sqlite"] = pdt.Field(
+        "memory",
+        description="Notification storage engine: in-memory or a local SQLite database",
+    )
+    notifications_db_path: str = pdt.Field(
+        "notifyhub.sqlite3",
+        description="SQLite database file used when notifications_storage is 'sqlite'",
+    )
+    notifications_log_dir: str = pdt.Field(
+        "",
+        description="Directory for the append-only notification log (empty = in-memory only)",
+    )
+    notifications_log_fsync_ms: int = pdt.Field(
+        20,
+        description="Group-commit window in milliseconds between notification log fsyncs",
+    )
+    notifications_log_segment_bytes: int = pdt.Field(
+        64 * 1024 * 1024,
+        description="Size in bytes at which the notification log rolls over to a new segment",
+    )
+    notifications_log_compact_segments: int = pdt.Field(
+        4,
+        description="Compact the notification log once this many sealed segments exist",
+    )
     telegram_chat_id: str = pdt.Field(
         "",
         description="Telegram chat ID to send notifications to (empty = disabled)",
@@ -26,7 +116,7 @@ class NotifyHubBackendConfig(pdt.BaseModel):
     )
     telegram_notify_tags: tp.List[str] = pdt.Field(
         default_factory=list,
-        description="Only send Telegram notifications for messages containing these tags (empty = send all)",
+        description="Only send Telegram notifications carrying one of these tags, written bare (opencode.question) or as markup ([#opencode.question]) (empty = send all)",
     )
     macos_notifications_enabled: bool = pdt.Field(
         True,
@@ -38,7 +128,7 @@ class NotifyHubBackendConfig(pdt.BaseModel):
     )
     bark_notify_tags: tp.List[str] = pdt.Field(
         default_factory=list,
-        description="Only send Bark notifications for messages containing these tags (empty = send all)",
+        description="Only send Bark notifications carrying one of these tags, written bare (opencode.question) or as markup ([#opencode.question]) (empty = send all)",
     )
 
 
@@ -49,19 +49,18 @@ function App() {
   // SSE connection
   const connectSSE = () => {
     setConnectionError(false);
-    const es = new EventSource('/events');
+    // Bursts arrive as one batch event instead of a frame (and render) each;
+    // the snapshot arrives in init_chunk pages ended by init_done
+    const es = new EventSource('/events?batch=1&init_page=500');
     setEventSource(es);
 
     es.onmessage = (event: MessageEvent) => {
       console.log('SSE message received:', event.data);
     };
 
-    es.addEventListener('init', (event: MessageEvent) => {
-      const initData = JSON.parse(event.data) as Array<{
-        id: string;
-        data: any;
-        timestamp: string;
-      }>;
+    let initChunks: any[] = [];
+
+    const applyInit = (initData: Array<{ id: string; data: any; timestamp: string }>) => {
       // Create Notification instances and filter duplicates
       const uniqueNotifications: Notification[] = initData
         .map(raw => {
@@ -70,6 +69,7 @@ function App() {
               id: raw.id,
               message: raw.data.message,
               pwd: raw.data.pwd,
+              count: raw.data.count,
               timestamp: raw.timestamp,
             });
           } catch (error) {
@@ -81,6 +81,19 @@ function App() {
         .filter((n, index, arr) => arr.findIndex(x => x.id === n.id) === index);
       setNotifications(uniqueNotifications);
       setConnectionError(false);
+    };
+
+    es.addEventListener('init', (event: MessageEvent) => {
+      applyInit(JSON.parse(event.data));
+    });
+
+    es.addEventListener('init_chunk', (event: MessageEvent) => {
+      initChunks = initChunks.concat(JSON.parse(event.data));
+    });
+
+    es.addEventListener('init_done', () => {
+      applyInit(initChunks);
+      initChunks = [];
     });
 
     es.addEventListener('notification', (event: MessageEvent) => {
@@ -94,6 +107,7 @@ function App() {
           id: rawNotification.id,
           message: rawNotification.data.message,
           pwd: rawNotification.data.pwd,
+          count: rawNotification.data.count,
           timestamp: rawNotification.timestamp,
         });
         setNotifications(prev => {
@@ -117,14 +131,64 @@ function App() {
       }
     });
 
+    es.addEventListener('batch', (event: MessageEvent) => {
+      // Several notifications stored at once, newest first
+      const batchData = JSON.parse(event.data) as Array<{
+        id: string;
+        data: any;
+        timestamp: string;
+      }>;
+      const added: Notification[] = batchData
+        .map(raw => {
+          try {
+            return new Notification({
+              id: raw.id,
+              message: raw.data.message,
+              pwd: raw.data.pwd,
+              count: raw.data.count,
+              timestamp: raw.timestamp,
+            });
+          } catch (error) {
+            console.error('Invalid notification data in batch:', error);
+            return null;
+          }
+        })
+        .filter((n): n is Notification => n !== null);
+      setNotifications(prev => {
+        const existing = new Set(prev.map(n => n.id));
+        return [...added.filter(n => !existing.has(n.id)), ...prev];
+      });
+      if (added.length && audioRef.current) {
+        audioRef.current.currentTime = 0;
+        audioRef.current.play().catch(e => {
+          console.log('Audio play failed:', e);
+          setAudioBlocked(true);
+        });
+      }
+      setConnectionError(false);
+    });
+
+    es.addEventListener('update', (event: MessageEvent) => {
+      // A repeat coalesced into an existing notification
+      const updateData = JSON.parse(event.data) as { id: string; count: number };
+      setNotifications(prev =>
+        prev.map(n =>
+          n.id === updateData.id ? new Notification({ ...n, count: updateData.count }) : n
+        )
+      );
+      setConnectionError(false);
+    });
+
     es.addEventListener('clear', (event: MessageEvent) => {
       setNotifications([]);
       setConnectionError(false);
     });
 
     es.addEventListener('delete', (event: MessageEvent) => {
-      const deleteData = JSON.parse(event.data) as { id: string };
-      setNotifications(prev => prev.filter(n => n.id !== deleteData.id));
+      // A single delete carries `id`; batched deletes (expiry) carry `ids`
+      const deleteData = JSON.parse(event.data) as { id?: string; ids?: string[] };
+      const ids = new Set(deleteData.ids ?? (deleteData.id ? [deleteData.id] : []));
+      setNotifications(prev => prev.filter(n => !ids.has(n.id)));
       setConnectionError(false);
     });
 
@@ -139,6 +203,8 @@ function App() {
 
     es.onopen = () => {
       console.log('SSE connection opened');
+      // A reconnect starts its snapshot over
+      initChunks = [];
       setConnectionError(false);
     };
   };
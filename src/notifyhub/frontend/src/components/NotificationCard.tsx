@@ -191,7 +191,10 @@ function NotificationCard({ notification, index, total }: NotificationCardProps)
           <div className="notification-title-time">
             <div className="notification-title-and">
               <Text className="notification-text1 subheadline-emphasized">{notiTitle}</Text>
-              <Text className="notification-text-time">{formatTimestamp(notification.timestamp)}</Text>
+              <Text className="notification-text-time">
+                {formatTimestamp(notification.timestamp)}
+                {notification.count > 1 && ` ×${notification.count}`}
+              </Text>
             </div>
 
             <Text className="notification-text2 subheadline-regular">{notification.pwd || "Notification details"}</Text>
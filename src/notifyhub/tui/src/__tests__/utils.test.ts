@@ -163,6 +163,15 @@ describe("parseSSEStream", () => {
     expect(remainder).toBe("data: partial")
   })
 
+  it("reports the retry delay", () => {
+    const events: Array<[string, string]> = []
+    const delays: number[] = []
+    const onEvent: SSEEventHandler = (event, data) => events.push([event, data])
+    parseSSEStream("retry: 2500\nevent: heartbeat\ndata: {}\n\n", onEvent, (d) => delays.push(d))
+    expect(delays).toEqual([2500])
+    expect(events).toEqual([["heartbeat", "{}"]])
+  })
+
   it("handles CRLF line endings", () => {
     const events: Array<[string, string]> = []
     const onEvent: SSEEventHandler = (event, data) => events.push([event, data])
@@ -222,6 +231,13 @@ describe("parseSSEStream", () => {
     expect(events).toEqual([["msg", "line1\nline2"]])
     expect(remainder).toBe("")
   })
+
+  it("passes the event id when present", () => {
+    const events: Array<[string, string, string | undefined]> = []
+    const onEvent: SSEEventHandler = (event, data, id) => events.push([event, data, id])
+    parseSSEStream("id: abc-3\r\nevent: a\r\ndata: 1\r\n\r\nevent: b\r\ndata: 2\r\n\r\n", onEvent)
+    expect(events).toEqual([["a", "1", "abc-3"], ["b", "2", undefined]])
+  })
 })
 
 describe("safeParse", () => {
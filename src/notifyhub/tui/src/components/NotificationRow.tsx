@@ -94,6 +94,8 @@ export function NotificationRow({ item, selected }: Props) {
   const cardBg = selected ? theme.surfaceSelected : theme.background
   const borderColor = selected ? theme.borderSelected : theme.border
   const time = formatTime(item.timestamp)
+  // Repeats folded into this notification by the server's coalescing window
+  const count = typeof item.data?.count === "number" ? item.data.count : 1
   const messageLines = msg.split("\n")
   const contentWidth = Math.max(40, termWidth - 4)
   const wrappedEstimate = messageLines.reduce(
@@ -117,6 +119,7 @@ export function NotificationRow({ item, selected }: Props) {
           <span bg={avatarColor} fg="#ffffff"> {avatarInitial} </span>
           <span fg={theme.text} attributes={TextAttributes.BOLD}> {title}</span>
           <span fg={theme.dim}>  {time}</span>
+          {count > 1 && <span fg={theme.accent}>  ×{count}</span>}
         </text>
         <text fg={theme.pwdText}>{truncate(pwd, 80)}</text>
         {messageLines.map((line, lineIdx) => {
@@ -1,7 +1,7 @@
 import { useEffect, useState, useCallback } from "react"
 import type { NotificationItem, ServerInfo } from "../types"
 import {
-  fetchNotifications,
+  fetchNotificationsIfChanged,
   connectSSE,
   deleteNotification,
   checkServerStatus,
@@ -29,24 +29,37 @@ export function useNotifications() {
     const info = await checkServerStatus()
     setServerInfo((prev) => ({ ...prev, ...info }))
     if (info.connected) {
-      const notes = await fetchNotifications()
-      setNotifications(notes)
+      const notes = await fetchNotificationsIfChanged()
+      if (notes) setNotifications(notes)
     }
   }, [])
 
   useEffect(() => {
+    // The snapshot's init_chunk pages, held until init_done
+    let initItems: NotificationItem[] = []
+    const applyInit = (items: NotificationItem[]) => {
+      setNotifications(items)
+      setServerInfo((prev) => ({
+        ...prev,
+        connected: true,
+        streaming: true,
+        notificationsCount: items.length,
+      }))
+    }
     const disconnect = connectSSE(
       (event, data) => {
         switch (event) {
           case "init": {
-            const items = safeParse<NotificationItem[]>(data, [])
-            setNotifications(items)
-            setServerInfo((prev) => ({
-              ...prev,
-              connected: true,
-              streaming: true,
-              notificationsCount: items.length,
-            }))
+            applyInit(safeParse<NotificationItem[]>(data, []))
+            break
+          }
+          case "init_chunk": {
+            initItems = initItems.concat(safeParse<NotificationItem[]>(data, []))
+            break
+          }
+          case "init_done": {
+            applyInit(initItems)
+            initItems = []
             break
           }
           case "notification": {
@@ -62,13 +75,41 @@ export function useNotifications() {
             }
             break
           }
+          case "batch": {
+            // Several notifications stored at once, newest first
+            const items = safeParse<NotificationItem[]>(data, [])
+            if (items.length) {
+              const ids = new Set(items.map((n) => n.id))
+              setNotifications((prev) => [...items, ...prev.filter((n) => !ids.has(n.id))])
+              setServerInfo((prev) => ({
+                ...prev,
+                connected: true,
+                streaming: true,
+                notificationsCount: prev.notificationsCount + items.length,
+              }))
+            }
+            break
+          }
+          case "update": {
+            // A repeat coalesced into an existing notification
+            const parsed = safeParse<{ id?: string; count?: number }>(data, {})
+            if (parsed.id && typeof parsed.count === "number") {
+              const count = parsed.count
+              setNotifications((prev) =>
+                prev.map((n) => (n.id === parsed.id ? { ...n, data: { ...n.data, count } } : n)),
+              )
+            }
+            break
+          }
           case "delete": {
-            const parsed = safeParse<{ id: string }>(data, { id: "" })
-            if (parsed.id) {
-              setNotifications((prev) => prev.filter((n) => n.id !== parsed.id))
+            // A single delete carries `id`; batched deletes (expiry) carry `ids`
+            const parsed = safeParse<{ id?: string; ids?: string[] }>(data, {})
+            const ids = new Set(parsed.ids ?? (parsed.id ? [parsed.id] : []))
+            if (ids.size) {
+              setNotifications((prev) => prev.filter((n) => !ids.has(n.id)))
               setServerInfo((prev) => ({
                 ...prev,
-                notificationsCount: Math.max(0, prev.notificationsCount - 1),
+                notificationsCount: Math.max(0, prev.notificationsCount - ids.size),
               }))
             }
             break
@@ -87,6 +128,8 @@ export function useNotifications() {
         }
       },
       (streaming) => {
+        // A new connection starts its snapshot over
+        if (streaming) initItems = []
         setServerInfo((prev) => ({ ...prev, streaming }))
       },
     )
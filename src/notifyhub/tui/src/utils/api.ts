@@ -6,6 +6,7 @@ const MAX_RECONNECT_DELAY = 30_000
 
 let _host = DEFAULT_HOST
 let _port = DEFAULT_PORT
+let _notificationsEtag: string | null = null
 
 export function configureApi(host: string, port: number) {
   _host = host
@@ -22,6 +23,17 @@ export async function fetchNotifications(): Promise<NotificationItem[]> {
   return res.json()
 }
 
+// Conditional fetch: resolves to null when the server answers 304 Not Modified
+export async function fetchNotificationsIfChanged(): Promise<NotificationItem[] | null> {
+  const headers: Record<string, string> = {}
+  if (_notificationsEtag) headers["If-None-Match"] = _notificationsEtag
+  const res = await fetch(`${getApiBase()}/api/notifications`, { headers })
+  if (res.status === 304) return null
+  if (!res.ok) throw new Error(`Failed to fetch notifications: ${res.status}`)
+  _notificationsEtag = res.headers.get("ETag")
+  return res.json()
+}
+
 export async function deleteNotification(id: string): Promise<void> {
   const res = await fetch(`${getApiBase()}/api/notifications?id=${encodeURIComponent(id)}`, {
     method: "DELETE",
@@ -31,11 +43,13 @@ export async function deleteNotification(id: string): Promise<void> {
 
 export async function checkServerStatus(): Promise<ServerInfo> {
   try {
-    const notes = await fetchNotifications()
+    // HEAD only carries the count/version headers, no list to download
+    const res = await fetch(`${getApiBase()}/api/notifications`, { method: "HEAD" })
+    if (!res.ok) throw new Error(`Status check failed: ${res.status}`)
     return {
       connected: true,
       streaming: false,
-      notificationsCount: notes.length,
+      notificationsCount: Number(res.headers.get("X-Notifications-Count") ?? 0) || 0,
       port: _port,
       host: _host,
     }
@@ -44,25 +58,36 @@ export async function checkServerStatus(): Promise<ServerInfo> {
   }
 }
 
-export type SSEEventHandler = (event: string, data: string) => void
+export type SSEEventHandler = (event: string, data: string, id?: string) => void
 
-export function parseSSEStream(buffer: string, onEvent: SSEEventHandler): string {
+export function parseSSEStream(
+  buffer: string,
+  onEvent: SSEEventHandler,
+  onRetry?: (delay: number) => void,
+): string {
   const lines = buffer.split("\n")
   const remainder = lines.pop() ?? ""
 
   let currentEvent = ""
   let currentData = ""
+  let currentId = ""
 
   for (const raw of lines) {
     const line = raw.trimEnd()
-    if (line.startsWith("event: ")) {
+    if (line.startsWith("id: ")) {
+      currentId = line.slice(4)
+    } else if (line.startsWith("retry: ")) {
+      const delay = Number(line.slice(7))
+      if (Number.isInteger(delay)) onRetry?.(delay)
+    } else if (line.startsWith("event: ")) {
       currentEvent = line.slice(7)
     } else if (line.startsWith("data: ")) {
       currentData += (currentData ? "\n" : "") + line.slice(6)
     } else if (line.length === 0 && currentEvent && currentData) {
-      onEvent(currentEvent, currentData)
+      onEvent(currentEvent, currentData, currentId || undefined)
       currentEvent = ""
       currentData = ""
+      currentId = ""
     }
   }
 
@@ -72,9 +97,22 @@ export function parseSSEStream(buffer: string, onEvent: SSEEventHandler): string
 export function connectSSE(onEvent: SSEEventHandler, onStatusChange?: (streaming: boolean) => void): () => void {
   let cancelled = false
   let reconnectDelay = 1_000
+  // Sent back on reconnect so the server replays only the missed changes
+  let lastEventId = ""
+  // The server's retry: delay, jittered per client so a restart's
+  // reconnects spread out; used for the first attempt after a disconnect
+  let retryDelay: number | undefined
+
+  const trackEvent: SSEEventHandler = (event, data, id) => {
+    if (id) lastEventId = id
+    onEvent(event, data, id)
+  }
 
   async function connect(): Promise<void> {
-    const res = await fetch(`${getApiBase()}/events`)
+    const headers: Record<string, string> = lastEventId ? { "Last-Event-ID": lastEventId } : {}
+    // Bursts arrive as one batch event instead of a frame (and render) each;
+    // the snapshot arrives in init_chunk pages ended by init_done
+    const res = await fetch(`${getApiBase()}/events?batch=1&init_page=500`, { headers })
     if (!res.ok || !res.body) {
       throw new Error(`SSE connection failed: ${res.status}`)
     }
@@ -91,7 +129,7 @@ export function connectSSE(onEvent: SSEEventHandler, onStatusChange?: (streaming
         if (done) break
 
         buffer += decoder.decode(value, { stream: true })
-        buffer = parseSSEStream(buffer, onEvent)
+        buffer = parseSSEStream(buffer, trackEvent, (delay) => { retryDelay = delay })
       }
     } finally {
       reader.releaseLock()
@@ -108,7 +146,9 @@ export function connectSSE(onEvent: SSEEventHandler, onStatusChange?: (streaming
         onStatusChange?.(false)
       }
       if (!cancelled) {
-        await new Promise((r) => setTimeout(r, reconnectDelay))
+        const delay = retryDelay ?? reconnectDelay
+        retryDelay = undefined
+        await new Promise((r) => setTimeout(r, delay))
         reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY)
       }
     }
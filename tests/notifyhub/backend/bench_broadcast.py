@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Benchmark fanning SSE frames out to many subscribers: the per-client
+``asyncio.Queue`` the SSEManager used to keep against the shared ring buffer
+``Broadcaster``. Events are published in bursts (as a batch ingest does)
+between yields to the loop. Reports the publisher's cost per event and the
+time per event until every subscriber task has received them.
+
+    python tests/notifyhub/backend/bench_broadcast.py --count 200 --burst 10 --subscribers 1000 10000
+"""
+
+import argparse
+import asyncio
+import time
+
+from notifyhub.backend.broadcast import Broadcaster
+
+FRAME = b'event: notification\ndata: {"id": "x", "data": {"message": "Done"}}\n\n'
+
+
+async def bench_queues(subscribers: int, count: int, burst: int):
+    queues = [asyncio.Queue(maxsize=count) for _ in range(subscribers)]
+    remaining = subscribers
+    done = asyncio.Event()
+
+    async def consume(queue):
+        nonlocal remaining
+        for _ in range(count):
+            await queue.get()
+        remaining -= 1
+        if not remaining:
+            done.set()
+
+    tasks = [asyncio.create_task(consume(q)) for q in queues]
+    await asyncio.sleep(0)
+    publish = 0.0
+    t0 = time.perf_counter()
+    for i in range(count):
+        p0 = time.perf_counter()
+        for queue in queues:
+            queue.put_nowait(FRAME)
+        publish += time.perf_counter() - p0
+        if (i + 1) % burst == 0:
+            await asyncio.sleep(0)
+    await done.wait()
+    total = time.perf_counter() - t0
+    await asyncio.gather(*tasks)
+    return publish / count, total / count
+
+
+async def bench_broadcaster(subscribers: int, count: int, burst: int):
+    broadcaster = Broadcaster(capacity=max(count, 1))
+    remaining = subscribers
+    done = asyncio.Event()
+
+    async def consume(subscription):
+        nonlocal remaining
+        received = 0
+        while received < count:
+            received += len(await subscription.next())
+        remaining -= 1
+        if not remaining:
+            done.set()
+
+    tasks = [
+        asyncio.create_task(consume(broadcaster.subscribe())) for _ in range(subscribers)
+    ]
+    await asyncio.sleep(0)
+    publish = 0.0
+    t0 = time.perf_counter()
+    for i in range(count):
+        p0 = time.perf_counter()
+        broadcaster.publish(FRAME)
+        publish += time.perf_counter() - p0
+        if (i + 1) % burst == 0:
+            await asyncio.sleep(0)
+    await done.wait()
+    total = time.perf_counter() - t0
+    await asyncio.gather(*tasks)
+    return publish / count, total / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1_000, 10_000])
+    args = parser.parse_args()
+
+    for subscribers in args.subscribers:
+        for name, bench in (("queues", bench_queues), ("ring", bench_broadcaster)):
+            publish, fanout = asyncio.run(bench(subscribers, args.count, args.burst))
+            print(
+                f"{subscribers:>6,} subscribers, {name:<6}"
+                f" publish {publish * 1e6:>10,.1f} us/event"
+                f"  fan-out {fanout * 1e3:>8,.2f} ms/event"
+            )
+
+
+if __name__ == "__main__":
+    main()
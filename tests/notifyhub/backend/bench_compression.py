@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Measure what gzip costs and saves on the SSE stream: bytes on the wire
+and CPU time for the ``init`` snapshot at several store sizes, and per
+incremental event with a fresh compressor per event against one context
+reused for the connection.
+
+    python tests/notifyhub/backend/bench_compression.py --counts 1000 10000 50000
+"""
+
+import argparse
+import time
+import zlib
+
+from notifyhub.backend.backend import _json_array, sse_frame
+from notifyhub.backend.compression import StreamCompressor, compress
+from notifyhub.backend.models import Notification, NotificationStore
+
+MESSAGES = [
+    "Task {i} finished [#opencode.done]",
+    "Build #{i} failed: 3 tests in tests/test_api.py [#ci]",
+    "Agent needs input on step {i} [#opencode.question]",
+    "Deployed revision {i:x} to staging",
+]
+
+
+def make_store(count: int) -> NotificationStore:
+    store = NotificationStore(max_count=count)
+    for i in range(count):
+        store.add(
+            Notification(
+                message=MESSAGES[i % len(MESSAGES)].format(i=i),
+                pwd=f"/home/user/projects/repo-{i % 20}",
+            )
+        )
+    return store
+
+
+def bench_snapshot(count: int, level: int):
+    store = make_store(count)
+    frame = sse_frame("init", _json_array(store.iter_items_json()), store.etag)
+    t0 = time.process_time()
+    compressed = compress(frame, "gzip", level)
+    cpu = time.process_time() - t0
+    assert zlib.decompress(compressed, 16 + zlib.MAX_WBITS) == frame
+    return len(frame), len(compressed), cpu
+
+
+def bench_events(count: int, level: int):
+    store = make_store(count)
+    frames = [
+        sse_frame("notification", item, store.change_id(i))
+        for i, item in enumerate(store.iter_items_json())
+    ]
+    raw = sum(map(len, frames))
+
+    t0 = time.process_time()
+    fresh = sum(len(compress(frame, "gzip", level)) for frame in frames)
+    fresh_cpu = time.process_time() - t0
+
+    compressor = StreamCompressor("gzip", level)
+    t0 = time.process_time()
+    reused = sum(len(compressor.compress(frame, flush=True)) for frame in frames)
+    reused_cpu = time.process_time() - t0
+    return (
+        raw / count,
+        (fresh / count, fresh_cpu / count),
+        (reused / count, reused_cpu / count),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--events", type=int, default=2_000)
+    parser.add_argument("--level", type=int, default=6)
+    args = parser.parse_args()
+
+    for count in args.counts:
+        raw, compressed, cpu = bench_snapshot(count, args.level)
+        print(
+            f"init, {count:>7,} notifications: {raw / 1e6:>7.2f} MB -> "
+            f"{compressed / 1e6:>6.2f} MB ({compressed / raw:>5.1%}), {cpu * 1e3:>7.1f} ms CPU"
+        )
+
+    raw, fresh, reused = bench_events(args.events, args.level)
+    print(f"events, uncompressed:        {raw:>6.0f} B/event")
+    for name, (size, cpu) in (("gzip per event", fresh), ("gzip per connection", reused)):
+        print(f"events, {name + ':':<20} {size:>6.0f} B/event, {cpu * 1e6:>6.1f} us/event CPU")
+
+
+if __name__ == "__main__":
+    main()
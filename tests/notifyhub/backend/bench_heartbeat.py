@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Measure the CPU an idle server spends keeping SSE connections alive: each
+stream polling ``asyncio.wait_for(queue.get(), timeout=1.0)`` to count
+towards its heartbeat, as the events generator used to, against streams
+blocked on the broadcaster with one shared heartbeat task.
+
+    python tests/notifyhub/backend/bench_heartbeat.py --connections 5000 --seconds 10
+"""
+
+import argparse
+import asyncio
+import time
+
+from notifyhub.backend.backend import SSEManager
+
+
+async def idle_polling(connections: int, seconds: float, interval: int):
+    async def stream(queue):
+        heartbeat_count = 0
+        while True:
+            try:
+                await asyncio.wait_for(queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                # A heartbeat went out every ``interval`` timeouts
+                heartbeat_count += 1
+
+    return await measure(
+        [stream(asyncio.Queue()) for _ in range(connections)], seconds
+    )
+
+
+async def idle_shared(connections: int, seconds: float, interval: int):
+    manager = SSEManager(heartbeat_interval=interval)
+
+    async def stream(subscription):
+        while True:
+            await subscription.next()
+
+    streams = [stream(await manager.connect()) for _ in range(connections)]
+    return await measure(streams + [manager.run_heartbeats()], seconds)
+
+
+async def measure(coroutines, seconds: float) -> float:
+    """CPU seconds used per wall second while ``coroutines`` run"""
+    tasks = [asyncio.create_task(c) for c in coroutines]
+    # Let every stream reach its first wait before measuring
+    await asyncio.sleep(0.5)
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    await asyncio.sleep(seconds)
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return cpu / wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connections", type=int, default=5_000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--heartbeat-interval", type=int, default=30)
+    args = parser.parse_args()
+
+    for name, bench in (("1s polling", idle_polling), ("shared", idle_shared)):
+        load = asyncio.run(bench(args.connections, args.seconds, args.heartbeat_interval))
+        print(f"{args.connections:,} idle connections, {name:<10} {load:>7.1%} CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Measure memory per stored notification: the pydantic ``Notification``
+the store used to keep (ISO timestamp, per-request pwd string, cached item
+JSON) against the compact ``StoredNotification`` record, and the whole
+NotificationStore including its indexes.
+
+    python tests/notifyhub/backend/bench_memory.py --count 1000000
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from datetime import datetime, timezone
+
+from notifyhub.backend.models import (
+    Notification,
+    NotificationStore,
+    StoredNotification,
+    get_time_uid,
+)
+
+
+def pwd_for(i: int) -> str:
+    # A fresh string per notification, as parsed from each request body
+    return "".join(["/home/user/projects/repo-", str(i % 50)])
+
+
+def measure(build, count: int) -> float:
+    """Bytes allocated per notification by whatever ``build`` returns"""
+    gc.collect()
+    tracemalloc.start()
+    kept = build(count)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size / count
+
+
+def build_pydantic(count: int):
+    notifications = []
+    for i in range(count):
+        n = Notification(
+            id=get_time_uid(),
+            message=f"Task {i} finished [#opencode.done]",
+            pwd=pwd_for(i),
+            timestamp=datetime.now(timezone.utc).isoformat(),
+        )
+        item = {
+            "id": n.id,
+            "data": n.model_dump(exclude={"id", "timestamp"}),
+            "timestamp": n.timestamp,
+        }
+        item_json = json.dumps(item, ensure_ascii=False).encode("utf-8")
+        notifications.append((n, item_json))
+    return notifications
+
+
+def build_records(count: int, encode: bool = False):
+    records = []
+    for i in range(count):
+        record = StoredNotification.from_notification(
+            Notification(message=f"Task {i} finished [#opencode.done]", pwd=pwd_for(i))
+        )
+        if encode:
+            record.item_json()
+        records.append(record)
+    return records
+
+
+def build_store(count: int, encode: bool = False):
+    store = NotificationStore(max_count=count)
+    for i in range(count):
+        store.add(
+            Notification(message=f"Task {i} finished [#opencode.done]", pwd=pwd_for(i))
+        )
+    if not encode:
+        # add() encodes for the broadcast; measure the record without it
+        for _, record in store._index.iter_newest():
+            record._item_json = None
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rows = [
+        ("pydantic Notification + item JSON", lambda n: build_pydantic(n)),
+        ("StoredNotification", lambda n: build_records(n)),
+        ("StoredNotification + item JSON", lambda n: build_records(n, encode=True)),
+        ("NotificationStore (record + indexes)", lambda n: build_store(n)),
+        ("NotificationStore + item JSON", lambda n: build_store(n, encode=True)),
+    ]
+    print(f"{args.count:,} notifications")
+    for name, build in rows:
+        print(f"{name:<38} {measure(build, args.count):>8,.0f} bytes/notification")
+
+
+if __name__ == "__main__":
+    main()
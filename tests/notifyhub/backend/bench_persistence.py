@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Benchmark NotificationStore ingest with and without the append-only log,
+and how long replaying the log takes on startup.
+
+    python tests/notifyhub/backend/bench_persistence.py --count 1000000
+"""
+
+import argparse
+import tempfile
+import time
+
+from notifyhub.backend.models import Notification, NotificationStore
+from notifyhub.backend.persistence import NotificationLog
+
+
+def make_notifications(count: int):
+    return [
+        Notification(message=f"Task {i} finished [#opencode.done]", pwd=f"/repo/{i % 50}")
+        for i in range(count)
+    ]
+
+
+def bench_ingest(count: int, log_dir=None) -> float:
+    notifications = make_notifications(count)
+    log = NotificationLog(log_dir) if log_dir else None
+    if log:
+        log.open()
+    store = NotificationStore(max_count=count, log=log)
+
+    t0 = time.perf_counter()
+    for n in notifications:
+        store.add(n)
+    elapsed = time.perf_counter() - t0
+    if log:
+        # Include draining the writer so the figure reflects durable throughput
+        log.close()
+        elapsed = time.perf_counter() - t0
+    return elapsed
+
+
+def bench_replay(count: int, log_dir: str) -> float:
+    t0 = time.perf_counter()
+    log = NotificationLog(log_dir)
+    store = NotificationStore(max_count=count)
+    store.restore(log.replay())
+    elapsed = time.perf_counter() - t0
+    assert len(store) == count
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=200_000)
+    args = parser.parse_args()
+
+    off = bench_ingest(args.count)
+    print(f"ingest, persistence off: {args.count / off:>12,.0f} notifications/s")
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        on = bench_ingest(args.count, log_dir)
+        print(f"ingest, persistence on:  {args.count / on:>12,.0f} notifications/s")
+
+        replay = bench_replay(args.count, log_dir)
+        print(f"replay {args.count:,} notifications: {replay:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
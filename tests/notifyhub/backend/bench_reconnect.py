@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Simulate every client reconnecting at once after a restart, optionally
+while notifications keep arriving, and report time-to-init percentiles and
+the snapshots built: each client building its own snapshot against shared,
+rate-limited snapshot builds.
+
+    python tests/notifyhub/backend/bench_reconnect.py --clients 2000 --notifications 10000 --write-interval-ms 5
+"""
+
+import argparse
+import asyncio
+import time
+
+from starlette.requests import Request
+
+import notifyhub.backend.backend as backend
+from notifyhub.backend.backend import SSEManager
+from notifyhub.backend.events import SnapshotCache
+from notifyhub.backend.models import Notification, NotificationStore
+
+# Browsers and TUIs page the snapshot; older clients take it whole
+QUERIES = [b"batch=1&init_page=500", b"", b"batch=1&init_page=500&pwd=/p/1"]
+
+
+async def storm(
+    clients: int, notifications: int, write_interval: float, shared: bool
+):
+    manager = SSEManager(init_rate=20 if shared else 0, init_burst=10)
+    if not shared:
+        manager.snapshots = SnapshotCache(max_entries=0)
+    backend.sse_manager = manager
+    backend.store = NotificationStore(sse_manager=manager, max_count=notifications)
+    for i in range(notifications):
+        backend.store.add(Notification(message=f"Task {i} finished", pwd=f"/p/{i % 20}"))
+
+    async def write():
+        i = 0
+        while True:
+            await asyncio.sleep(write_interval)
+            backend.store.add(Notification(message=f"Live {i}"))
+            i += 1
+
+    async def reconnect(query: bytes) -> float:
+        request = Request({"type": "http", "headers": [], "query_string": query})
+        stream = (await backend.events(request)).body_iterator
+        while True:
+            head = (await stream.__anext__())[:64]
+            if b"event: init\r\n" in head or b"event: init_done\r\n" in head:
+                break
+        # From when the storm began, queueing behind other clients included
+        elapsed = time.perf_counter() - t0
+        await stream.aclose()
+        return elapsed
+
+    writer = asyncio.create_task(write()) if write_interval else None
+    t0 = time.perf_counter()
+    times = sorted(
+        await asyncio.gather(
+            *(reconnect(QUERIES[i % len(QUERIES)]) for i in range(clients))
+        )
+    )
+    if writer is not None:
+        writer.cancel()
+    return (
+        times[len(times) // 2],
+        times[int(len(times) * 0.99)],
+        times[-1],
+        manager.snapshots.built,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=2_000)
+    parser.add_argument("--notifications", type=int, default=10_000)
+    parser.add_argument("--write-interval-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    for name, shared in (("per client", False), ("shared", True)):
+        p50, p99, worst, built = asyncio.run(
+            storm(args.clients, args.notifications, args.write_interval_ms / 1000, shared)
+        )
+        print(
+            f"{args.clients:,} reconnects, {name:<10} time-to-init"
+            f" p50 {p50 * 1e3:>8,.1f} ms  p99 {p99 * 1e3:>8,.1f} ms"
+            f"  max {worst * 1e3:>8,.1f} ms  {built:>5,} snapshots built"
+        )
+
+
+if __name__ == "__main__":
+    main()
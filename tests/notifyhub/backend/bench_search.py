@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Benchmark building the in-memory search index and query latency.
+
+    python tests/notifyhub/backend/bench_search.py --count 500000
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from notifyhub.backend.models import Notification, NotificationStore
+
+WORDS = (
+    "build test deploy lint release merge review failed passed finished "
+    "started timeout error warning migration backup server client cache"
+).split()
+
+
+def make_notifications(count: int, rng: random.Random):
+    return [
+        Notification(
+            message=" ".join(rng.choices(WORDS, k=6)) + f" task{i}",
+            pwd=f"/repo/{i % 50}",
+        )
+        for i in range(count)
+    ]
+
+
+def bench_queries(store: NotificationStore, queries, pwd=None):
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        store.search(query, pwd=pwd)
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    return (
+        statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    notifications = make_notifications(args.count, rng)
+    store = NotificationStore(max_count=args.count)
+    t0 = time.perf_counter()
+    for n in notifications:
+        store.add(n)
+    elapsed = time.perf_counter() - t0
+    print(f"ingest with index: {args.count / elapsed:>12,.0f} notifications/s")
+
+    cases = {
+        "one word": [rng.choice(WORDS) for _ in range(args.queries)],
+        "two words": [" ".join(rng.sample(WORDS, 2)) for _ in range(args.queries)],
+        "prefix": [rng.choice(WORDS)[:3] for _ in range(args.queries)],
+        "rare": [f"task{rng.randrange(args.count)}" for _ in range(args.queries)],
+    }
+    for name, queries in cases.items():
+        p50, p99 = bench_queries(store, queries)
+        print(f"{name:<10} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+    p50, p99 = bench_queries(store, cases["two words"], pwd="/repo/7")
+    print(f"{'with pwd':<10} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Compare the ``/events`` SSE stream with the ``/ws`` WebSocket in JSON and
+msgpack: connect clients straight to the ASGI app, publish notifications in
+bursts and report messages delivered per second of CPU time until every
+client has received them all.
+
+    python tests/notifyhub/backend/bench_websocket.py --clients 100 1000 --count 200
+"""
+
+import argparse
+import asyncio
+import time
+
+import notifyhub.backend.backend as backend
+from notifyhub.backend.backend import SSEManager
+from notifyhub.backend.events import msgpack
+from notifyhub.backend.models import Notification, NotificationStore
+
+
+def make_scope(transport: str, port: int) -> dict:
+    if transport == "sse":
+        scope_type, path, query = "http", "/events", b""
+    else:
+        scope_type, path, query = "websocket", "/ws", b"encoding=" + transport.encode()
+    return {
+        "type": scope_type,
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http" if scope_type == "http" else "ws",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query,
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", port),
+        "server": ("localhost", 8000),
+    }
+
+
+async def bench(transport: str, clients: int, count: int, burst: int):
+    manager = SSEManager(buffer_size=count * 2)
+    backend.sse_manager = manager
+    backend.store = NotificationStore(sse_manager=manager)
+    remaining = clients
+    done = asyncio.Event()
+    never = asyncio.get_running_loop().create_future()
+
+    async def client(port: int):
+        received = 0
+        opened = False
+
+        async def receive():
+            nonlocal opened
+            if not opened:
+                opened = True
+                return {"type": "websocket.connect" if transport != "sse" else "http.request"}
+            await never
+
+        async def send(message):
+            nonlocal received, remaining
+            body = message.get("body") or message.get("bytes") or message.get("text") or b""
+            if isinstance(body, str):
+                body = body.encode()
+            if b"notification" in body:
+                received += 1
+                if received == count:
+                    remaining -= 1
+                    if not remaining:
+                        done.set()
+
+        await backend.app(make_scope(transport, port), receive, send)
+
+    tasks = [asyncio.create_task(client(port)) for port in range(clients)]
+    while len(manager.active_connections) < clients:
+        await asyncio.sleep(0.01)
+    # Let every client send its init before measuring
+    await asyncio.sleep(0.1)
+
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    for i in range(count):
+        backend.store.add(Notification(message=f"Task {i} finished [#bench]"))
+        if (i + 1) % burst == 0:
+            await asyncio.sleep(0)
+    await done.wait()
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return clients * count / cpu, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1_000])
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=10)
+    args = parser.parse_args()
+
+    transports = ["sse", "json"] + (["msgpack"] if msgpack else [])
+    for clients in args.clients:
+        for transport in transports:
+            rate, wall = asyncio.run(bench(transport, clients, args.count, args.burst))
+            print(
+                f"{clients:>6,} clients, {transport:<8}"
+                f" {rate:>12,.0f} messages/s per core  ({wall:>6.2f} s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
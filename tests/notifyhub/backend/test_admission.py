@@ -0,0 +1,48 @@
+import asyncio
+import time
+import pytest
+from notifyhub.backend.admission import TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_burst_then_rate():
+    bucket = TokenBucket(rate=50, burst=3)
+    admitted = []
+
+    async def caller(i):
+        await bucket.acquire()
+        admitted.append((i, time.monotonic()))
+
+    t0 = time.monotonic()
+    await asyncio.gather(*(caller(i) for i in range(6)))
+
+    # In arrival order: three at once, then one per 20 ms
+    assert [i for i, _ in admitted] == list(range(6))
+    delays = [t - t0 for _, t in admitted]
+    assert max(delays[:3]) < 0.01
+    assert delays[5] == pytest.approx(0.06, abs=0.03)
+    assert bucket.waited == 3
+
+
+@pytest.mark.asyncio
+async def test_unlimited():
+    bucket = TokenBucket(rate=0)
+    for _ in range(100):
+        await bucket.acquire()
+    assert bucket.waited == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_gives_its_turn_back():
+    bucket = TokenBucket(rate=10, burst=1)
+    await bucket.acquire()
+    waiting = asyncio.create_task(bucket.acquire())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    # Next in line waits one interval, not two
+    t0 = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - t0 < 0.15
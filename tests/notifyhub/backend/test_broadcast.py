@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from notifyhub.backend.broadcast import Broadcaster, SubscriberOverrun
+
+
+class TestBroadcaster:
+
+    def test_frames_in_order_across_wraparound(self):
+        broadcaster = Broadcaster(capacity=4)
+        subscription = broadcaster.subscribe()
+
+        for i in range(3):
+            broadcaster.publish(b"%d" % i)
+        assert subscription.pending() == [b"0", b"1", b"2"]
+        assert subscription.pending() == []
+        for i in range(3, 7):
+            broadcaster.publish(b"%d" % i)
+        assert subscription.pending() == [b"3", b"4", b"5", b"6"]
+
+    def test_late_subscriber_starts_at_head(self):
+        broadcaster = Broadcaster()
+        broadcaster.publish(b"before")
+        subscription = broadcaster.subscribe()
+        broadcaster.publish(b"after")
+
+        assert subscription.pending() == [b"after"]
+
+    def test_overrun(self):
+        broadcaster = Broadcaster(capacity=2)
+        subscription = broadcaster.subscribe()
+        for i in range(3):
+            broadcaster.publish(b"x")
+
+        with pytest.raises(SubscriberOverrun):
+            subscription.pending()
+
+    def test_lag_and_skip(self):
+        broadcaster = Broadcaster(capacity=2)
+        subscription = broadcaster.subscribe("a")
+        for i in range(5):
+            broadcaster.publish(b"%d" % i)
+
+        assert subscription.lag == 5
+        subscription.skip(broadcaster.oldest)
+        assert subscription.pending() == [b"3", b"4"]
+        assert (subscription.lag, subscription.dropped, subscription.overruns) == (0, 3, 1)
+
+    def test_select_drops_and_rewrites_frames(self):
+        broadcaster = Broadcaster(capacity=4)
+
+        def select(frame, subject):
+            if subject == "skip":
+                return None
+            return frame.upper() if subject == "shout" else frame
+
+        subscription = broadcaster.subscribe(select=select)
+        unfiltered = broadcaster.subscribe()
+        for frame, subject in ((b"a", None), (b"b", "skip"), (b"c", "shout")):
+            broadcaster.publish(frame, subject)
+
+        assert subscription.pending() == [b"a", b"C"]
+        assert subscription.lag == 0
+        assert unfiltered.pending() == [b"a", b"b", b"c"]
+
+    def test_close(self):
+        broadcaster = Broadcaster()
+        subscription = broadcaster.subscribe()
+        subscription.close()
+        subscription.close()
+
+        assert broadcaster.subscriptions == set()
+
+    @pytest.mark.asyncio
+    async def test_one_publish_wakes_every_waiter(self):
+        broadcaster = Broadcaster()
+        subscriptions = [broadcaster.subscribe() for _ in range(3)]
+        waiters = [asyncio.create_task(s.next()) for s in subscriptions]
+        await asyncio.sleep(0)
+
+        broadcaster.publish(b"a")
+        broadcaster.publish(b"b")
+        results = await asyncio.wait_for(asyncio.gather(*waiters), timeout=1)
+
+        assert results == [[b"a", b"b"]] * 3
+        assert broadcaster._wakeup is None
@@ -0,0 +1,66 @@
+import zlib
+import pytest
+from notifyhub.backend.compression import (
+    ENCODINGS,
+    StreamCompressor,
+    compress,
+    compress_chunks,
+    compress_events,
+    negotiate,
+)
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate, br") == "gzip"
+    assert negotiate("deflate;q=1, gzip;q=0.5") == "deflate"
+    assert negotiate("gzip;q=0, deflate") == "deflate"
+    assert negotiate("*") == "gzip"
+    assert negotiate("*, gzip;q=0") == "deflate"
+    assert negotiate("br, identity") is None
+    assert negotiate("gzip;q=abc") is None
+    assert negotiate(None) is None
+
+
+@pytest.mark.parametrize("encoding", list(ENCODINGS))
+def test_each_flushed_event_decodes_on_arrival(encoding):
+    compressor = StreamCompressor(encoding)
+    decoder = zlib.decompressobj(ENCODINGS[encoding])
+    frames = [b"event: notification\r\ndata: {\"n\": %d}\r\n\r\n" % i for i in range(20)]
+
+    sizes = []
+    for frame in frames:
+        chunk = compressor.compress(frame, flush=True)
+        sizes.append(len(chunk))
+        assert decoder.decompress(chunk) == frame
+    decoder.decompress(compressor.finish())
+    assert decoder.eof
+    # Later events reuse the context's window
+    assert sizes[-1] < sizes[0]
+    assert sizes[-1] < len(frames[-1]) / 2
+
+
+@pytest.mark.parametrize("encoding", list(ENCODINGS))
+def test_whole_bodies(encoding):
+    body = b"[" + b",".join(b'{"message": "Build %d done"}' % i for i in range(500)) + b"]"
+
+    assert zlib.decompress(compress(body, encoding), ENCODINGS[encoding]) == body
+    streamed = b"".join(compress_chunks([body[:100], body[100:]], encoding))
+    assert zlib.decompress(streamed, ENCODINGS[encoding]) == body
+
+
+@pytest.mark.asyncio
+async def test_compress_events_closes_the_source():
+    closed = []
+
+    async def events():
+        try:
+            yield b"a"
+            yield b"b"
+        finally:
+            closed.append(True)
+
+    stream = compress_events(events(), "gzip")
+    decoder = zlib.decompressobj(ENCODINGS["gzip"])
+    assert decoder.decompress(await stream.__anext__()) == b"a"
+    await stream.aclose()
+    assert closed == [True]
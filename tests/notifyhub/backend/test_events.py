@@ -0,0 +1,53 @@
+import json
+from notifyhub.backend.events import Event, SnapshotCache, msgpack, sse_frame
+
+
+def test_sse_frame_retry():
+    assert sse_frame("x", "{}", "1", retry=2500) == (
+        b"id: 1\r\nretry: 2500\r\nevent: x\r\ndata: {}\r\n\r\n"
+    )
+
+
+def test_encode_is_cached_per_encoding():
+    event = Event("clear", '{"message": "x"}', "e-1")
+    encoded = event.encode("json")
+    assert json.loads(encoded) == {"event": "clear", "id": "e-1", "data": {"message": "x"}}
+    assert event.encode("json") is encoded
+    if msgpack is not None:
+        assert msgpack.unpackb(event.encode("msgpack"))["data"] == {"message": "x"}
+
+
+def chunks(count, built):
+    for i in range(count):
+        built.append(i)
+        yield Event("init_chunk", f"[{i}]")
+
+
+def test_snapshot_cache_builds_once_per_version():
+    cache = SnapshotCache()
+    built = []
+    first = cache.get("v1", "all", lambda: chunks(3, built))
+    assert ("v1", "all") in cache
+    # A second client gets ahead of the first: both read one build
+    second = cache.get("v1", "all", lambda: chunks(3, built))
+    assert [e.data for e in second] == [b"[0]", b"[1]", b"[2]"]
+    assert [e.data for e in first] == [b"[0]", b"[1]", b"[2]"]
+    assert built == [0, 1, 2]
+    assert (cache.built, cache.reused) == (1, 1)
+
+    # Another key, or the store changing, builds again
+    list(cache.get("v1", "filtered", lambda: chunks(1, built)))
+    list(cache.get("v2", "all", lambda: chunks(1, built)))
+    assert ("v1", "all") not in cache
+    assert cache.built == 3
+
+
+def test_snapshot_cache_expires_and_can_be_disabled():
+    cache = SnapshotCache(ttl=0)
+    list(cache.get("v1", "all", lambda: chunks(1, [])))
+    assert ("v1", "all") not in cache
+
+    disabled = SnapshotCache(max_entries=0)
+    list(disabled.get("v1", "all", lambda: chunks(1, [])))
+    list(disabled.get("v1", "all", lambda: chunks(1, [])))
+    assert (disabled.built, disabled.reused) == (2, 0)
@@ -1,6 +1,16 @@
 import pytest
-from datetime import datetime
-from notifyhub.backend.models import Notification, NotificationStore
+import json
+from datetime import datetime, timezone
+from notifyhub.backend.models import (
+    Notification,
+    NotificationFilter,
+    NotificationStore,
+    StoredNotification,
+    normalize_tag,
+    now_us,
+    parse_tags,
+    to_epoch_us,
+)
 
 
 class TestNotificationStore:
@@ -111,3 +121,590 @@ class TestNotificationStore:
         result = store.delete_by_id("any-id")
         assert result is False
         assert len(store.notifications) == 0
+
+    def test_get_by_id(self):
+        store = NotificationStore()
+        notification_id = store.add(Notification(message="Lookup"))
+
+        assert store.get(notification_id).message == "Lookup"
+        assert store.get("missing") is None
+
+    def test_add_existing_custom_id_replaces_and_moves_to_front(self):
+        store = NotificationStore()
+        store.add(Notification(message="Old"), custom_id="same")
+        store.add(Notification(message="Other"))
+        store.add(Notification(message="New"), custom_id="same")
+
+        assert len(store.notifications) == 2
+        assert store.notifications[0].message == "New"
+        assert store.notifications[1].message == "Other"
+
+    def test_notifications_view_indexing(self):
+        store = NotificationStore()
+        for i in range(5):
+            store.add(Notification(message=f"Message {i}"))
+
+        view = store.notifications
+        assert [n.message for n in view] == [f"Message {i}" for i in range(4, -1, -1)]
+        assert view[-1].message == "Message 0"
+        assert view[3].message == "Message 1"
+        assert [n.message for n in view[1:3]] == ["Message 3", "Message 2"]
+        with pytest.raises(IndexError):
+            view[5]
+
+    def test_eviction_after_delete_keeps_newest(self):
+        store = NotificationStore(max_count=3)
+        ids = [store.add(Notification(message=f"Message {i}")) for i in range(3)]
+        store.delete_by_id(ids[1])
+        store.add(Notification(message="Message 3"))
+        store.add(Notification(message="Message 4"))
+
+        assert [n.message for n in store.notifications] == [
+            "Message 4",
+            "Message 3",
+            "Message 2",
+        ]
+
+
+class TestStoredNotification:
+
+    def test_timestamps_are_epoch_microseconds(self):
+        record = StoredNotification.from_notification(
+            Notification(message="x", timestamp="2024-05-01T12:00:00.123456+02:00")
+        )
+        naive = StoredNotification.from_notification(
+            Notification(message="x", timestamp="2024-05-01T10:00:00.123456")
+        )
+
+        assert isinstance(record.timestamp_us, int)
+        assert record.timestamp_us == naive.timestamp_us
+        assert record.timestamp == "2024-05-01T10:00:00.123456+00:00"
+
+    def test_missing_or_invalid_timestamp_is_now(self):
+        before = datetime.now(timezone.utc)
+        for timestamp in (None, "not a date"):
+            record = StoredNotification.from_notification(
+                Notification(message="x", timestamp=timestamp)
+            )
+            assert datetime.fromisoformat(record.timestamp) >= before
+
+    def test_pwd_is_interned(self):
+        first = StoredNotification.from_notification(
+            Notification(message="a", pwd="".join(["/repo/", "project"]))
+        )
+        second = StoredNotification.from_notification(
+            Notification(message="b", pwd="".join(["/repo/", "project"]))
+        )
+
+        assert first.pwd is second.pwd
+
+    def test_round_trips_api_shape(self):
+        store = NotificationStore()
+        notification_id = store.add(
+            Notification(message="Hi", pwd="/a", extra_field={"k": 1})
+        )
+        record = store._get_record(notification_id)
+
+        assert record.extra == {"extra_field": {"k": 1}}
+        assert json.loads(record.item_json()) == {
+            "id": notification_id,
+            "data": {"message": "Hi", "pwd": "/a", "extra_field": {"k": 1}},
+            "timestamp": record.timestamp,
+        }
+        assert StoredNotification.from_dict(record.to_dict()).to_item() == record.to_item()
+        assert store.get(notification_id).extra_field == {"k": 1}
+        assert StoredNotification.from_notification(Notification(message="x")).extra is None
+
+
+class TestTags:
+
+    def messages(self, items):
+        return [json.loads(item)["data"]["message"] for item in items]
+
+    def test_parsed_at_ingest(self):
+        notification = Notification(
+            message="[#opencode.question] Ask [#tag:@USER] [#truncated:12 lines]",
+            tags=["extra", "@USER"],
+        )
+
+        assert notification.tags == ["opencode.question", "@USER", "extra"]
+        assert Notification(message="No tags").tags is None
+        assert parse_tags("[#a][#a] [#tag:b c]") == ["a", "b c"]
+        assert [normalize_tag(t) for t in ("[#x.y]", "#x.y", "x.y", "[#tag:@U]")] == [
+            "x.y",
+            "x.y",
+            "x.y",
+            "@U",
+        ]
+
+    def test_structured_field_round_trips(self):
+        record = StoredNotification.from_notification(Notification(message="Hi [#a]"))
+
+        assert record.tags == ("a",)
+        assert record.data()["tags"] == ["a"]
+        assert StoredNotification.from_dict(record.to_dict()).tags == ("a",)
+        # Records logged before tags were parsed
+        legacy = StoredNotification.from_dict({"id": "x", "message": "Old [#b]"})
+        assert legacy.tags == ("b",)
+        assert legacy.extra is None
+        # A string ``tags`` from before it was a typed field stays a plain
+        # field, through later log round trips too
+        legacy = StoredNotification.from_dict({"id": "x", "message": "Old", "tags": "ab"})
+        assert (legacy.tags, legacy.extra) == ((), {"tags": "ab"})
+        relogged = StoredNotification.from_dict(legacy.to_log_dict())
+        assert (relogged.tags, relogged.extra) == ((), {"tags": "ab"})
+        assert parse_tags("Old [#b]", "ab") == ["b"]
+
+    def test_tag_index_reads_and_cleanup(self):
+        store = NotificationStore(max_count=4)
+        store.add(Notification(message="Q1 [#question]", pwd="/a"))
+        store.add(Notification(message="Done [#done]", pwd="/a"))
+        store.add(Notification(message="Q2 [#question]", pwd="/b"))
+        q3 = store.add(Notification(message="Q3", tags=["question"], pwd="/a"))
+
+        assert self.messages(store.iter_items_json(tag="question")) == ["Q3", "Q2 [#question]", "Q1 [#question]"]
+        assert self.messages(store.iter_items_json(pwd="/a", tag="question")) == ["Q3", "Q1 [#question]"]
+        assert store.count(tag="question") == 3
+        assert store.count(pwd="/b", tag="question") == 1
+        page = store.page(limit=1, tag="question")
+        assert self.messages(page.items) == ["Q3"]
+        assert self.messages(store.page(limit=5, before=page.older, tag="question").items) == [
+            "Q2 [#question]",
+            "Q1 [#question]",
+        ]
+
+        store.add(Notification(message="Evicts Q1"))
+        store.delete_by_id(q3)
+        assert self.messages(store.iter_items_json(tag="question")) == ["Q2 [#question]"]
+        store.clear_all()
+        assert store._tags == {}
+
+
+class TestNotificationFilter:
+
+    def test_matches(self):
+        match = NotificationFilter("/work/app", ["ci", "deploy"], min_priority=2)
+
+        assert match.matches("/work/app", ("ci",), 2)
+        assert match.matches("/work/app/sub", ("ci",), 5)
+        assert not match.matches("/home/app", ("ci",), 5)
+        assert not match.matches(None, ("ci",), 5)
+        assert not match.matches("/work/app", ("other",), 5)
+        assert not match.matches("/work/app", ("deploy",), 1)
+        # Whole path components only
+        assert not match.matches("/work/application", ("ci",), 5)
+        assert NotificationFilter("/work/").matches("/work/app", ())
+        assert NotificationFilter("/").matches("/work", ())
+        assert not NotificationFilter()
+        assert NotificationFilter(min_priority=0)
+
+    def test_priority_field(self):
+        def priority(**fields):
+            return StoredNotification.from_notification(
+                Notification(message="x", **fields)
+            ).priority
+
+        assert priority(priority=3) == 3
+        assert priority(priority="high") == 0
+        assert priority(priority=True) == 0
+        assert priority() == 0
+
+    def test_iter_items_json_where(self):
+        store = NotificationStore()
+        store.add(Notification(message="A1 [#ci]", pwd="/work/a", priority=1))
+        store.add(Notification(message="B [#ci]", pwd="/home/b", priority=5))
+        store.add(Notification(message="A2 [#ci]", pwd="/work/a2", priority=5))
+        store.add(Notification(message="A3", pwd="/work/a", priority=5))
+
+        def messages(match):
+            items = store.iter_items_json_where(match)
+            return [json.loads(item)["data"]["message"] for item in items]
+
+        assert messages(NotificationFilter("/work")) == ["A3", "A2 [#ci]", "A1 [#ci]"]
+        assert messages(NotificationFilter("/work", ["ci"], 2)) == ["A2 [#ci]"]
+        assert messages(NotificationFilter("/work/a")) == ["A3", "A1 [#ci]"]
+        assert messages(NotificationFilter("/wo")) == []
+        assert messages(NotificationFilter(tags=["ci"])) == [
+            "A2 [#ci]",
+            "B [#ci]",
+            "A1 [#ci]",
+        ]
+
+    def test_snapshot(self):
+        store = NotificationStore()
+        for i in range(5):
+            store.add(Notification(message=f"M{i}", pwd="/work/a" if i % 2 else "/b"))
+
+        def messages(snapshot):
+            return [json.loads(item)["data"]["message"] for _, item in snapshot]
+
+        seqs = [seq for seq, _ in store.snapshot()]
+        assert seqs == sorted(seqs, reverse=True)
+        assert messages(store.snapshot(limit=2)) == ["M4", "M3"]
+        assert messages(store.snapshot(after=seqs[2])) == ["M4", "M3"]
+        assert messages(store.snapshot(NotificationFilter("/work/a"), limit=1)) == ["M3"]
+
+        # Fixed when taken: later writes are not in it
+        snapshot = store.snapshot(limit=3)
+        store.add(Notification(message="Later"))
+        store.clear_all()
+        assert messages(snapshot) == ["M4", "M3", "M2"]
+
+    def test_changes_carry_their_records(self):
+        store = NotificationStore()
+        store.add(Notification(message="One"))
+        store.add_many([(Notification(message=f"M{i}"), None, None) for i in range(2)])
+        store.clear_all()
+
+        one, batch, clear = store.changes_since(0)
+        assert [r.message for r in one.records] == ["One"]
+        assert [r.message for r in batch.records] == ["M1", "M0"]
+        assert clear.records is None
+
+
+class TestAddMany:
+
+    def test_one_change_with_items_newest_first(self):
+        store = NotificationStore()
+        version = store.version
+        ids = store.add_many(
+            [
+                (Notification(message="First"), None, None),
+                (Notification(message="Second"), "custom", None),
+            ]
+        )
+
+        assert ids[1] == "custom"
+        assert [n.message for n in store.notifications] == ["Second", "First"]
+        (change,) = store.changes_since(version)
+        assert change.event == "batch"
+        assert [item["id"] for item in json.loads(change.data)] == ids[::-1]
+
+    def test_repeated_ids_and_evictions(self):
+        store = NotificationStore(max_count=2)
+        ids = store.add_many(
+            [
+                (Notification(message="Old copy"), "same", None),
+                (Notification(message="A"), None, None),
+                (Notification(message="B"), None, None),
+                (Notification(message="New copy"), "same", None),
+            ]
+        )
+
+        assert len(ids) == 4
+        assert [n.message for n in store.notifications] == ["New copy", "B"]
+        items = json.loads(store.changes_since(store.version - 1)[0].data)
+        assert [item["data"]["message"] for item in items] == ["New copy", "B"]
+
+    def test_batch_event_skips_records_evicted_by_project_limits(self):
+        store = NotificationStore(project_max_count=2)
+        for i in range(5):
+            store.add(Notification(message=f"B{i}", pwd="/b"))
+        store.add_many(
+            [(Notification(message=f"A{i}", pwd="/a"), None, None) for i in range(5)]
+        )
+
+        assert [n.message for n in store.notifications] == ["A4", "A3", "B4", "B3"]
+        (change,) = store.changes_since(store.version - 1)
+        assert [item["data"]["message"] for item in json.loads(change.data)] == [
+            "A4",
+            "A3",
+        ]
+        assert [r.message for r in change.records] == ["A4", "A3"]
+
+    def test_empty_batch_is_not_a_change(self):
+        store = NotificationStore()
+        assert store.add_many([]) == []
+        assert store.version == 0
+
+
+class TestCoalescing:
+
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        clock = {"now": 1_000_000_000}
+        monkeypatch.setattr(
+            "notifyhub.backend.models.now_us", lambda: clock["now"]
+        )
+        return clock
+
+    def test_disabled_by_default(self):
+        store = NotificationStore()
+        store.add(Notification(message="Loop"))
+        store.add(Notification(message="Loop"))
+        assert len(store) == 2
+
+    def test_repeats_bump_count_and_send_update(self, clock):
+        store = NotificationStore(coalesce_window=5)
+        first = store.add(Notification(message="Loop", pwd="/a"))
+        version = store.version
+        clock["now"] += 4_000_000
+        assert store.add(Notification(message="Loop", pwd="/a")) == first
+        clock["now"] += 4_000_000
+        assert store.ingest([(Notification(message="Loop", pwd="/a"), None, None)]) == [
+            (first, False)
+        ]
+
+        assert len(store) == 1
+        assert store.get(first).count == 3
+        assert json.loads(store._get_record(first).item_json())["data"]["count"] == 3
+        changes = store.changes_since(version)
+        assert [c.event for c in changes] == ["update", "update"]
+        assert json.loads(changes[-1].data) == {"id": first, "count": 3}
+
+    def test_what_is_not_a_repeat(self, clock):
+        store = NotificationStore(coalesce_window=5)
+        first = store.add(Notification(message="Loop", pwd="/a"))
+        store.add(Notification(message="Loop", pwd="/b"))
+        store.add(Notification(message="Loop", pwd="/a", tags=["x"]))
+        assert store.add(Notification(message="Loop", pwd="/a", tags=["x"])) != first
+        store.add(Notification(message="Loop", pwd="/a"), custom_id="explicit")
+        assert len(store) == 4
+
+        clock["now"] += 6_000_000
+        second = store.add(Notification(message="Loop", pwd="/a"))
+        assert second != first
+        store.delete_by_id(second)
+        assert store.add(Notification(message="Loop", pwd="/a")) != second
+
+    def test_repeats_within_one_batch(self, clock):
+        store = NotificationStore(coalesce_window=5)
+        results = store.ingest(
+            [(Notification(message="Loop"), None, None)] * 3
+            + [(Notification(message="Other"), None, None)]
+        )
+
+        assert [is_new for _, is_new in results] == [True, False, False, True]
+        assert results[1][0] == results[0][0]
+        (change,) = store.changes_since(0)
+        items = json.loads(change.data)
+        assert [i["data"].get("count") for i in items] == [None, 3]
+
+
+class TestRetention:
+
+    def test_max_bytes_evicts_oldest_but_keeps_newest(self):
+        store = NotificationStore(max_count=None)
+        store.add(Notification(message="x" * 100))
+        size = store.total_bytes
+        store.max_bytes = 2 * size
+        store.add(Notification(message="y" * 100))
+        store.add(Notification(message="z" * 100))
+
+        assert [n.message[0] for n in store.notifications] == ["z", "y"]
+        assert store.total_bytes == 2 * size
+
+        store.add(Notification(message="huge" * 1000))
+        assert [n.message[:4] for n in store.notifications] == ["huge"]
+
+    def test_total_bytes_follows_replace_delete_and_clear(self):
+        store = NotificationStore()
+        store.add(Notification(message="a"), custom_id="same")
+        store.add(Notification(message="bbbb"), custom_id="same")
+        assert store.total_bytes == len(store._get_record("same").item_json())
+
+        store.delete_by_id("same")
+        assert store.total_bytes == 0
+        store.add(Notification(message="c"))
+        store.clear_all()
+        assert store.total_bytes == 0
+
+    def test_ttl_and_max_age_expire_in_one_change(self):
+        store = NotificationStore(max_age=60)
+        old = store.add(
+            Notification(message="Old", timestamp="2020-01-01T00:00:00+00:00")
+        )
+        short = store.add(Notification(message="Short"), ttl=5)
+        kept = store.add(Notification(message="Kept"))
+        version = store.version
+
+        assert store.expire(now=to_epoch_us("2020-01-01T00:00:30+00:00")) == []
+        assert store.expire() == [old]
+        assert store.expire(now=now_us() + 10_000_000) == [short]
+        assert [n.id for n in store.notifications] == [kept]
+
+        changes = store.changes_since(version)
+        assert [c.event for c in changes] == ["delete", "delete"]
+        assert json.loads(changes[0].data)["ids"] == [old]
+
+    def test_expire_batches_and_skips_removed(self):
+        store = NotificationStore()
+        ids = [store.add(Notification(message=f"M{i}"), ttl=1) for i in range(5)]
+        store.delete_by_id(ids[0])
+        store.add(Notification(message="Replaced"), custom_id=ids[1])
+        later = now_us() + 2_000_000
+
+        assert store.expire(now=later, limit=2) == ids[2:4]
+        assert store.expire(now=later) == [ids[4]]
+        assert [n.message for n in store.notifications] == ["Replaced"]
+        assert store.expire(now=later) == []
+
+
+class TestPartitions:
+
+    def add(self, store, message, pwd):
+        return store.add(Notification(message=message, pwd=pwd))
+
+    def messages(self, page):
+        return [json.loads(item)["data"]["message"] for item in page.items]
+
+    def test_merged_view_interleaves_projects(self):
+        store = NotificationStore(max_count=None)
+        for i in range(6):
+            self.add(store, f"M{i}", "/a" if i % 3 else "/b")
+
+        assert [n.message for n in store.notifications] == [
+            f"M{i}" for i in range(5, -1, -1)
+        ]
+        assert [n.message for n in reversed(store.notifications)][:2] == ["M0", "M1"]
+        assert [json.loads(i)["data"]["message"] for i in store.iter_items_json("/b")] == [
+            "M3",
+            "M0",
+        ]
+        assert store.count("/a") == 4
+        assert store.count("/missing") == 0
+        assert list(store.iter_items_json("/missing")) == []
+
+    def test_project_cap_evicts_only_that_project(self):
+        store = NotificationStore(max_count=None, project_max_count=2)
+        quiet = self.add(store, "Quiet", "/quiet")
+        for i in range(10):
+            self.add(store, f"Noisy {i}", "/noisy")
+
+        assert store.get(quiet) is not None
+        assert [n.message for n in store.notifications] == [
+            "Noisy 9",
+            "Noisy 8",
+            "Quiet",
+        ]
+
+    def test_global_cap_evicts_oldest_across_projects(self):
+        store = NotificationStore(max_count=2)
+        self.add(store, "A1", "/a")
+        self.add(store, "B1", "/b")
+        self.add(store, "A2", "/a")
+
+        assert [n.message for n in store.notifications] == ["A2", "B1"]
+        assert [p.pwd for p in store.projects()] == ["/a", "/b"]
+
+    def test_projects_and_empty_partitions(self):
+        store = NotificationStore()
+        first = self.add(store, "Old", "/a")
+        self.add(store, "Newer", "/b")
+        self.add(store, "No pwd", None)
+
+        projects = store.projects()
+        assert [(p.pwd, p.count) for p in projects] == [(None, 1), ("/b", 1), ("/a", 1)]
+        assert projects[-1].latest == store.get(first).timestamp
+
+        store.delete_by_id(first)
+        assert "/a" not in store._index.partitions
+        assert [p.pwd for p in store.projects()] == [None, "/b"]
+
+    def test_page_within_project(self):
+        store = NotificationStore(max_count=None)
+        for i in range(6):
+            self.add(store, f"M{i}", "/a" if i % 2 else "/b")
+
+        first = store.page(limit=2, pwd="/a")
+        second = store.page(limit=2, before=first.older, pwd="/a")
+        assert self.messages(first) == ["M5", "M3"]
+        assert self.messages(second) == ["M1"]
+        assert second.older is None
+        assert self.messages(store.page(limit=5, after=second.newer, pwd="/a")) == ["M5", "M3"]
+
+
+class TestDeleteWhere:
+
+    def test_filters_combine_and_send_one_change(self):
+        store = NotificationStore(max_count=None)
+        for i in range(6):
+            store.add(
+                Notification(
+                    message=f"M{i} [#tag:{'ci' if i % 2 else 'docs'}]",
+                    pwd="/a" if i < 4 else "/b",
+                    timestamp=f"2020-01-0{i + 1}T00:00:00+00:00",
+                )
+            )
+        by_message = {n.message[:2]: n.id for n in store.notifications}
+        version = store.version
+
+        assert store.delete_where(pwd="/a", tag="ci") == [by_message["M1"], by_message["M3"]]
+        assert store.delete_where(
+            start_us=to_epoch_us("2020-01-05T00:00:00+00:00"),
+            end_us=to_epoch_us("2020-01-06T00:00:00+00:00"),
+        ) == [by_message["M4"]]
+        assert store.delete_where(ids=[by_message["M5"], "missing"], pwd="/a") == []
+        assert store.delete_where(tag="nothing") == []
+
+        changes = store.changes_since(version)
+        assert [c.event for c in changes] == ["delete", "delete"]
+        assert json.loads(changes[0].data)["ids"] == [by_message["M1"], by_message["M3"]]
+        assert sorted(n.message[:2] for n in store.notifications) == ["M0", "M2", "M5"]
+
+    def test_tags_from_markup_and_extra_list(self):
+        store = NotificationStore()
+        store.add(Notification(message="Tagged [#tag:x]"), custom_id="inline")
+        store.add(Notification(message="Listed", tags=["x"]), custom_id="listed")
+        store.add(Notification(message="Mentions #tag:x"), custom_id="plain")
+
+        assert sorted(store.delete_where(tag="x")) == ["inline", "listed"]
+        assert len(store) == 1
+
+
+class TestNotificationStorePaging:
+
+    def make_store(self, count):
+        store = NotificationStore(max_count=None)
+        for i in range(count):
+            store.add(Notification(message=f"Message {i}"))
+        return store
+
+    @staticmethod
+    def messages(page):
+        return [json.loads(item)["data"]["message"] for item in page.items]
+
+    def test_first_page_and_next(self):
+        store = self.make_store(5)
+
+        first = store.page(limit=2)
+        assert self.messages(first) == ["Message 4", "Message 3"]
+        assert first.newer is None
+
+        second = store.page(limit=2, before=first.older)
+        assert self.messages(second) == ["Message 2", "Message 1"]
+
+        last = store.page(limit=2, before=second.older)
+        assert self.messages(last) == ["Message 0"]
+        assert last.older is None
+
+    def test_after_returns_adjacent_newer_items(self):
+        store = self.make_store(5)
+        last = store.page(limit=1, before=store.page(limit=3).older)
+
+        newer = store.page(limit=2, after=last.newer)
+        assert self.messages(newer) == ["Message 3", "Message 2"]
+        assert newer.newer is not None
+
+    def test_cursor_stable_across_inserts_and_deletes(self):
+        store = self.make_store(5)
+        first = store.page(limit=2)
+
+        store.add(Notification(message="Message 5"))
+        store.delete_by_id(store.notifications[2].id)  # "Message 3"
+        next_page = store.page(limit=2, before=first.older)
+
+        assert self.messages(next_page) == ["Message 2", "Message 1"]
+
+    def test_seq_index_compacts_tombstones(self):
+        store = self.make_store(300)
+        for n in list(store.notifications)[::2]:
+            store.delete_by_id(n.id)
+        for n in list(store.notifications)[::2]:
+            store.delete_by_id(n.id)
+
+        assert len(store._index.partitions[None]._seqs) < 300
+        assert [n.message for n in store.notifications][:2] == [
+            "Message 296",
+            "Message 292",
+        ]
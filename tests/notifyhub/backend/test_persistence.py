@@ -0,0 +1,290 @@
+import os
+import json
+import pytest
+from fastapi.testclient import TestClient
+from notifyhub.backend.backend import app
+from notifyhub.backend.models import Notification, NotificationStore, now_us
+from notifyhub.backend.persistence import NotificationLog
+import notifyhub.backend.backend as backend
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return str(tmp_path / "log")
+
+
+def replayed_messages(log):
+    return [json.loads(record)["fields"]["message"] for record in log.replay()]
+
+
+def reopen(log_dir):
+    log = NotificationLog(log_dir, fsync_interval_ms=1)
+    store = NotificationStore(log=log)
+    store.restore(log.replay())
+    log.open()
+    return store
+
+
+class TestNotificationLog:
+
+    def test_replay_restores_adds_deletes_and_order(self, log_dir):
+        store = reopen(log_dir)
+        id1 = store.add(Notification(message="First", pwd="/a"))
+        id2 = store.add(Notification(message="Second"))
+        store.add(Notification(message="Third", extra_field="kept"), "tab\tid")
+        store.delete_by_id(id2)
+        store.log.close()
+
+        restored = reopen(log_dir)
+        assert [n.message for n in restored.notifications] == ["Third", "First"]
+        assert restored.get(id1).timestamp == store.get(id1).timestamp
+        assert restored.get(id1).pwd == "/a"
+        assert restored.notifications[0].extra_field == "kept"
+        assert restored.notifications[0].id == "tab\tid"
+        restored.log.close()
+
+    def test_replay_after_clear(self, log_dir):
+        store = reopen(log_dir)
+        store.add(Notification(message="Gone"))
+        store.clear_all()
+        store.add(Notification(message="Kept"))
+        store.log.close()
+
+        restored = reopen(log_dir)
+        assert [n.message for n in restored.notifications] == ["Kept"]
+        restored.log.close()
+
+    def test_posted_expiry_keys_do_not_expire(self, log_dir, monkeypatch):
+        monkeypatch.setattr(backend, "store", reopen(log_dir))
+        client = TestClient(app)
+        for expires in ("soon", 0):
+            client.post(
+                "/api/notify", json={"data": {"message": "hi", "_expires_us": expires}}
+            )
+        backend.store.log.close()
+
+        restored = reopen(log_dir)
+        assert [n.model_extra for n in restored.notifications] == [
+            {"_expires_us": 0},
+            {"_expires_us": "soon"},
+        ]
+        assert restored.expire(now=now_us() + 2_000_000) == []
+        restored.log.close()
+
+    def test_malformed_expiry_state_is_ignored(self, log_dir):
+        log = NotificationLog(log_dir, fsync_interval_ms=1)
+        log.open()
+        for notification_id, expires in (("a", "soon"), ("b", 0), ("c", True)):
+            record = {"id": notification_id, "expires_us": expires, "repeats": "x"}
+            record["fields"] = {"message": notification_id}
+            log.append_add(notification_id, json.dumps(record))
+        log.close()
+
+        restored = reopen(log_dir)
+        assert [n.message for n in restored.notifications] == ["c", "b", "a"]
+        assert restored.expire(now=now_us() + 2_000_000) == []
+        assert restored._get_record("a").count == 1
+        restored.log.close()
+
+    def test_evictions_are_logged(self, log_dir):
+        log = NotificationLog(log_dir, fsync_interval_ms=1)
+        log.open()
+        store = NotificationStore(log=log, max_count=2)
+        for i in range(4):
+            store.add(Notification(message=f"Message {i}"))
+        log.close()
+
+        assert replayed_messages(NotificationLog(log_dir)) == ["Message 2", "Message 3"]
+
+    def test_evictions_on_restore_are_logged(self, log_dir):
+        store = reopen(log_dir)
+        for i in range(4):
+            store.add(Notification(message=f"Message {i}", pwd=f"/{i % 2}"))
+        store.log.close()
+
+        log = NotificationLog(log_dir, fsync_interval_ms=1)
+        store = NotificationStore(log=log, max_count=1, project_max_count=1)
+        store.restore(log.replay())
+        log.open()
+        log.close()
+
+        assert replayed_messages(NotificationLog(log_dir)) == ["Message 3"]
+
+    def test_expiry_survives_restart(self, log_dir):
+        store = reopen(log_dir)
+        expiring = store.add(Notification(message="Expiring"), ttl=1)
+        store.add(Notification(message="Kept"))
+        store.log.close()
+
+        restored = reopen(log_dir)
+        assert restored.get(expiring).model_extra == {}
+        assert restored.expire(now=now_us() + 2_000_000) == [expiring]
+        assert [n.message for n in restored.notifications] == ["Kept"]
+        restored.log.close()
+
+    def test_posted_expiry_keys_do_not_expire(self, log_dir, monkeypatch):
+        monkeypatch.setattr(backend, "store", reopen(log_dir))
+        client = TestClient(app)
+        for expires in ("soon", 0):
+            client.post(
+                "/api/notify", json={"data": {"message": "hi", "_expires_us": expires}}
+            )
+        backend.store.log.close()
+
+        restored = reopen(log_dir)
+        assert [n.model_extra for n in restored.notifications] == [
+            {"_expires_us": 0},
+            {"_expires_us": "soon"},
+        ]
+        assert restored.expire(now=now_us() + 2_000_000) == []
+        restored.log.close()
+
+    def test_malformed_expiry_state_is_ignored(self, log_dir):
+        log = NotificationLog(log_dir, fsync_interval_ms=1)
+        log.open()
+        for notification_id, expires in (("a", "soon"), ("b", 0), ("c", True)):
+            record = {"id": notification_id, "expires_us": expires, "repeats": "x"}
+            record["fields"] = {"message": notification_id}
+            log.append_add(notification_id, json.dumps(record))
+        log.close()
+
+        restored = reopen(log_dir)
+        assert [n.message for n in restored.notifications] == ["c", "b", "a"]
+        assert restored.expire(now=now_us() + 2_000_000) == []
+        assert restored._get_record("a").count == 1
+        restored.log.close()
+
+    def test_coalesced_count_survives_restart_in_place(self, log_dir):
+        store = reopen(log_dir)
+        store.coalesce_window = 60
+        first = store.add(Notification(message="Loop"))
+        store.add(Notification(message="Other"))
+        store.add(Notification(message="Loop"))
+        store.log.close()
+
+        restored = reopen(log_dir)
+        assert [n.message for n in restored.notifications] == ["Other", "Loop"]
+        assert restored.get(first).count == 2
+        restored.log.close()
+
+    def test_user_count_field_survives_restart(self, log_dir):
+        store = reopen(log_dir)
+        store.coalesce_window = 60
+        kept = store.add(Notification(message="Mine", count="five"))
+        looped = store.add(Notification(message="Loop", count="six"))
+        store.add(Notification(message="Loop", count="six"))
+        store.log.close()
+
+        restored = reopen(log_dir)
+        assert restored.get(kept).count == "five"
+        assert restored.get(looped).count == 2
+        assert restored._get_record(looped).extra == {"count": "six"}
+        restored.log.close()
+
+    def test_posted_state_keys_survive_restart(self, log_dir, monkeypatch):
+        monkeypatch.setattr(backend, "store", reopen(log_dir))
+        response = TestClient(app).post(
+            "/api/notify", json={"data": {"message": "hi", "_repeats": "abc"}}
+        )
+        notification_id = response.json()["id"]
+        backend.store.log.close()
+
+        restored = reopen(log_dir)
+        assert restored._get_record(notification_id).count == 1
+        assert restored._get_record(notification_id).to_item()["data"] == {
+            "message": "hi",
+            "pwd": None,
+            "_repeats": "abc",
+        }
+        restored.log.close()
+
+    def test_indexes_after_restore(self, log_dir):
+        store = reopen(log_dir)
+        for i in range(3):
+            store.add(Notification(message=f"Build {i} [#ci]", pwd="/a"))
+        store.add(Notification(message="Deploy [#cd]", pwd="/b"))
+        store.log.close()
+
+        log = NotificationLog(log_dir)
+        restored = NotificationStore(project_max_count=2)
+        restored.restore(log.replay())
+        assert restored.count(tag="ci") == 2
+        assert [n.message for n in restored.notifications] == [
+            "Deploy [#cd]",
+            "Build 2 [#ci]",
+            "Build 1 [#ci]",
+        ]
+        restored.add(Notification(message="Build 3 [#ci]", pwd="/a"))
+        total, items = restored.search("build")
+        assert total == 2
+        assert [json.loads(i)["data"]["message"] for i in items] == [
+            "Build 3 [#ci]",
+            "Build 2 [#ci]",
+        ]
+        assert restored.count(tag="ci") == 2
+
+    def test_sizes_match_ingest_after_restore(self, log_dir):
+        store = reopen(log_dir)
+        store.coalesce_window = 60
+        store.add(Notification(message="Sized [#a]", pwd="/a", extra="x" * 50), ttl=60)
+        store.add(Notification(message="Loop"))
+        store.add(Notification(message="Loop"))
+        store.log.close()
+
+        restored = reopen(log_dir)
+        assert restored.total_bytes == store.total_bytes
+        assert [n.size for n in restored._by_id.values()] == [
+            n.size for n in store._by_id.values()
+        ]
+        # Sizes are read from the log rather than by encoding each item
+        assert all(n._item_json is None for n in restored._by_id.values())
+        restored.log.close()
+
+    def test_torn_last_line_is_skipped(self, log_dir):
+        store = reopen(log_dir)
+        store.add(Notification(message="Durable"))
+        store.log.close()
+
+        log = NotificationLog(log_dir)
+        with open(log._path(log.segments()[-1]), "ab") as f:
+            f.write(b'+"half"\t{"id": "half", "mess')
+
+        assert replayed_messages(log) == ["Durable"]
+
+    def test_rotation_and_compaction(self, log_dir):
+        log = NotificationLog(
+            log_dir, fsync_interval_ms=0, segment_max_bytes=1, compact_after_segments=3
+        )
+        log.open()
+        store = NotificationStore(log=log)
+        ids = []
+        for i in range(6):
+            ids.append(store.add(Notification(message=f"Message {i}")))
+            # One batch per add so every add rolls a segment
+            log.close()
+            log.open()
+        store.delete_by_id(ids[0])
+        log.close()
+
+        assert len(log.segments()) < 7
+        assert replayed_messages(log) == [f"Message {i}" for i in range(1, 6)]
+
+    def test_compacted_segment_supersedes_leftovers(self, log_dir):
+        log = NotificationLog(log_dir, fsync_interval_ms=0, segment_max_bytes=1)
+        log.open()
+        store = NotificationStore(log=log)
+        first = store.add(Notification(message="Deleted later"))
+        log.close()
+        log.open()
+        store.delete_by_id(first)
+        store.add(Notification(message="Live"))
+        log.close()
+
+        sealed = log.segments()
+        # Simulate a crash before the older segments were removed
+        log.compact(sealed)
+        with open(log._path(sealed[0]), "wb") as f:
+            f.write(b'+"x"\t{"id": "x", "message": "stale"}\n')
+
+        assert replayed_messages(log) == ["Live"]
+        assert os.path.exists(log._path(sealed[-1]))
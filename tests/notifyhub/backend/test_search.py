@@ -0,0 +1,95 @@
+import json
+from notifyhub.backend.models import Notification, NotificationStore
+from notifyhub.backend.search import SearchIndex, tokenize
+
+
+def messages(items):
+    return [json.loads(item)["data"]["message"] for item in items]
+
+
+class TestSearchIndex:
+
+    def test_tokenize(self):
+        assert tokenize("Build FAILED: test_api.py (exit 1)") == [
+            "build",
+            "failed",
+            "test_api",
+            "py",
+            "exit",
+            "1",
+        ]
+
+    def test_all_terms_must_match_as_prefixes(self):
+        index = SearchIndex()
+        index.add(1, "Build failed on main")
+        index.add(2, "Build passed on main")
+        index.add(3, "Deploy failed")
+
+        assert index.search("fail") == (2, [3, 1])
+        assert index.search("build fail") == (1, [1])
+        assert index.search("missing") == (0, [])
+        assert index.search("   ") == (0, [])
+
+    def test_whole_tokens_rank_first_then_newest(self):
+        index = SearchIndex()
+        index.add(1, "test passed")
+        index.add(2, "tests passed")
+        index.add(3, "test failed")
+
+        assert index.search("test") == (3, [3, 1, 2])
+        assert index.search("test", limit=1, offset=1) == (3, [1])
+
+    def test_pwd_filter_and_remove(self):
+        index = SearchIndex()
+        index.add(1, "done", pwd="/a")
+        index.add(2, "done", pwd="/b")
+
+        assert index.search("done", pwd="/a") == (1, [1])
+        index.remove(1)
+        index.remove(1)
+        assert index.search("done") == (1, [2])
+        assert index.search("done", pwd="/a") == (0, [])
+        assert len(index) == 1
+
+    def test_readded_token_is_not_double_counted(self):
+        index = SearchIndex()
+        index.add(1, "alpha")
+        assert index.search("alp") == (1, [1])
+        index.remove(1)
+        index.add(2, "alpha beta")
+
+        assert index.search("alp") == (1, [2])
+        assert index.search("alpha beta") == (1, [2])
+
+
+class TestNotificationStoreSearch:
+
+    def test_tracks_adds_replaces_deletes_and_evictions(self):
+        store = NotificationStore(max_count=3)
+        first = store.add(Notification(message="Build failed"))
+        store.add(Notification(message="Old message"), custom_id="same")
+        store.add(Notification(message="Build passed"), custom_id="same")
+
+        assert messages(store.search("old")[1]) == []
+        assert messages(store.search("build")[1]) == ["Build passed", "Build failed"]
+
+        store.delete_by_id(first)
+        assert store.search("failed") == (0, [])
+
+        for i in range(3):
+            store.add(Notification(message=f"Deploy {i}"))
+        assert store.search("build") == (0, [])
+        assert store.search("deploy")[0] == 3
+
+        store.clear_all()
+        assert store.search("deploy") == (0, [])
+
+    def test_restore_is_indexed(self):
+        store = NotificationStore()
+        store.restore(
+            [json.dumps({"id": "a", "message": "Restored entry", "pwd": "/x"}).encode()]
+        )
+
+        total, items = store.search("restored", pwd="/x")
+        assert total == 1
+        assert json.loads(items[0])["id"] == "a"
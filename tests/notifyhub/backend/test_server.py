@@ -1,14 +1,31 @@
+import asyncio
+import json
+import signal
+import time
+import zlib
 import pytest
+from unittest.mock import ANY
+from fastapi import HTTPException, Request
 from fastapi.testclient import TestClient
-from notifyhub.backend.backend import app
-from notifyhub.backend.models import NotificationStore
+from sse_starlette.sse import AppStatus
+from starlette.websockets import WebSocketDisconnect
+from uvicorn import Config
+from notifyhub.backend.backend import app, SSEManager
+from notifyhub.backend.models import Notification, NotificationStore, now_us
+from notifyhub.backend.events import Event
 import notifyhub.backend.backend as backend
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 
 @pytest.fixture(autouse=True)
 def reset_store():
     # Reset the global store before each test
     backend.store = NotificationStore()
+    backend.sse_manager = SSEManager()
 
 
 @pytest.fixture
@@ -172,6 +189,78 @@ class TestDeleteNotificationsAPI:
         assert "First" in remaining_messages
         assert "Third" in remaining_messages
 
+    @pytest.mark.asyncio
+    async def test_delete_by_filter_sends_one_event(self, client):
+        backend.store = NotificationStore(
+            sse_manager=backend.sse_manager, max_count=None
+        )
+        for i in range(5):
+            client.post(
+                "/api/notify",
+                json={"data": {"message": f"Build {i} [#tag:ci]", "pwd": "/a"}},
+            )
+        kept = client.post(
+            "/api/notify", json={"data": {"message": "Other", "pwd": "/b"}}
+        ).json()["id"]
+        subscription = await backend.sse_manager.connect()
+
+        response = client.delete("/api/notifications?pwd=/a&tag=ci")
+        assert response.json()["message"] == "5 notifications deleted"
+        assert [n.id for n in backend.store.notifications] == [kept]
+
+        [frame] = subscription.pending()
+        event, data = parse_frame(frame)
+        assert event == "delete"
+        assert data["ids"] == response.json()["ids"]
+
+    def test_delete_by_id_list_and_time_range(self, client):
+        ids = [
+            client.post(
+                "/api/notify",
+                json={
+                    "data": {
+                        "message": f"M{i}",
+                        "timestamp": f"2020-01-0{i + 1}T00:00:00+00:00",
+                    }
+                },
+            ).json()["id"]
+            for i in range(4)
+        ]
+
+        response = client.request(
+            "DELETE", "/api/notifications", json={"ids": [ids[0], ids[1], "gone"]}
+        )
+        assert response.json()["ids"] == ids[:2]
+
+        response = client.delete(
+            "/api/notifications?start=2020-01-04T00:00:00Z&end=2020-02-01T00:00:00Z"
+        )
+        assert response.json()["ids"] == [ids[3]]
+        assert [n.id for n in backend.store.notifications] == [ids[2]]
+        assert client.delete("/api/notifications?start=bad").status_code == 422
+
+    def test_body_with_unknown_key_is_rejected(self, client):
+        notification_id = client.post(
+            "/api/notify", json={"data": {"message": "Keep"}}
+        ).json()["id"]
+        response = client.request(
+            "DELETE", "/api/notifications", json={"id": notification_id}
+        )
+        assert response.status_code == 422
+        assert len(backend.store) == 1
+
+    def test_body_without_filter_is_rejected(self, client):
+        client.post("/api/notify", json={"data": {"message": "Keep"}})
+        response = client.request("DELETE", "/api/notifications", json={})
+        assert response.status_code == 400
+        assert len(backend.store) == 1
+
+    def test_body_with_all_clears(self, client):
+        client.post("/api/notify", json={"data": {"message": "Gone"}})
+        response = client.request("DELETE", "/api/notifications", json={"all": True})
+        assert response.json()["message"] == "All notifications cleared"
+        assert len(backend.store) == 0
+
 
 class TestRootEndpoint:
 
@@ -188,3 +277,1039 @@ class TestRootEndpoint:
         # Should contain the React app mounting point
         assert '<div id="root"></div>' in response.text
         assert '<script type="module" src="/static/app.js"></script>' in response.text
+
+
+class TestNotificationsPagination:
+
+    def test_paginates_with_cursor_headers(self, client):
+        for i in range(5):
+            client.post("/api/notify", json={"data": {"message": f"Message {i}"}})
+
+        first = client.get("/api/notifications?limit=2")
+        assert [n["data"]["message"] for n in first.json()] == ["Message 4", "Message 3"]
+        assert "x-prev-cursor" not in first.headers
+
+        second = client.get(
+            f"/api/notifications?limit=2&before={first.headers['x-next-cursor']}"
+        )
+        assert [n["data"]["message"] for n in second.json()] == ["Message 2", "Message 1"]
+
+        back = client.get(
+            f"/api/notifications?limit=2&after={second.headers['x-prev-cursor']}"
+        )
+        assert [n["data"]["message"] for n in back.json()] == ["Message 4", "Message 3"]
+
+    def test_invalid_cursor(self, client):
+        response = client.get("/api/notifications?before=not-a-cursor")
+
+        assert response.status_code == 400
+
+    def test_before_and_after_are_exclusive(self, client):
+        response = client.get("/api/notifications?before=MQ&after=MQ")
+
+        assert response.status_code == 400
+
+
+def parse_frame(frame: bytes):
+    lines = frame.decode().strip().split("\r\n")
+    lines = [line for line in lines if not line.startswith(("id: ", "retry: "))]
+    event = lines[0].removeprefix("event: ")
+    data = "\n".join(line.removeprefix("data: ") for line in lines[1:])
+    return event, json.loads(data)
+
+
+def frame_id(frame: bytes):
+    first = frame.decode().split("\r\n")[0]
+    return first.removeprefix("id: ") if first.startswith("id: ") else None
+
+
+def frame_event(frame: bytes):
+    # Only the header lines, as snapshot frames can be large
+    for line in frame[:128].split(b"\r\n")[:3]:
+        if line.startswith(b"event: "):
+            return line.removeprefix(b"event: ").decode()
+
+
+def frame_retry(frame: bytes):
+    for line in frame.decode().split("\r\n"):
+        if line.startswith("retry: "):
+            return int(line.removeprefix("retry: "))
+    return None
+
+
+def make_request(headers=None, query=""):
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request(
+        {"type": "http", "headers": raw_headers, "query_string": query.encode()}
+    )
+
+
+async def open_events(headers=None, query=""):
+    response = await backend.events(make_request(headers, query))
+    return response.body_iterator
+
+
+class TestEventsStream:
+
+    def test_sse_frame_splits_multiline_data(self):
+        assert backend.sse_frame("x", "a\nb") == b"event: x\r\ndata: a\r\ndata: b\r\n\r\n"
+
+    @pytest.mark.asyncio
+    async def test_init_snapshot_uses_cached_item_json(self):
+        notification_id = backend.store.add(Notification(message="Cached"))
+        record = backend.store._get_record(notification_id)
+
+        stream = await open_events()
+        event, items = parse_frame(await stream.__anext__())
+
+        assert event == "init"
+        assert items == [json.loads(record.item_json())]
+        assert record.item_json() is record.item_json()
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_chunked_init(self):
+        for i in range(5):
+            backend.store.add(Notification(message=f"M{i}"))
+        etag = backend.store.etag
+
+        stream = await open_events(query="init_page=2")
+        chunks = [parse_frame(await stream.__anext__()) for _ in range(3)]
+        assert [event for event, _ in chunks] == ["init_chunk"] * 3
+        assert [[i["data"]["message"] for i in items] for _, items in chunks] == [
+            ["M4", "M3"],
+            ["M2", "M1"],
+            ["M0"],
+        ]
+        # Added while the snapshot is streamed: comes after it, as an event
+        backend.store.sse_manager = backend.sse_manager
+        backend.store.add(Notification(message="Later"))
+        done = await stream.__anext__()
+        assert parse_frame(done) == ("init_done", {"count": 5, "older": None, "newer": ANY})
+        assert frame_id(done) == etag
+        assert parse_frame(await stream.__anext__())[0] == "heartbeat"
+        event, data = parse_frame(await stream.__anext__())
+        assert (event, data["data"]["message"]) == ("notification", "Later")
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_limited_init(self, client):
+        for i in range(5):
+            backend.store.add(Notification(message=f"M{i}"))
+
+        stream = await open_events(query="init_limit=3&init_page=2")
+        frames = [parse_frame(await stream.__anext__()) for _ in range(3)]
+        await stream.aclose()
+        assert [len(items) for _, items in frames[:2]] == [2, 1]
+        event, done = frames[2]
+        assert event == "init_done" and done["count"] == 3
+
+        # The cursors continue where the snapshot stopped
+        older = client.get(f"/api/notifications?limit=10&before={done['older']}").json()
+        assert [i["data"]["message"] for i in older] == ["M1", "M0"]
+        backend.store.add(Notification(message="M5"))
+        stream = await open_events(query=f"init_after={done['newer']}")
+        event, items = parse_frame(await stream.__anext__())
+        await stream.aclose()
+        assert (event, [i["data"]["message"] for i in items]) == ("init", ["M5"])
+
+    @pytest.mark.asyncio
+    async def test_invalid_init_limit(self):
+        with pytest.raises(HTTPException) as e:
+            await open_events(query="init_limit=0")
+        assert e.value.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_broadcast_encodes_frame_once(self):
+        manager = SSEManager()
+        first, second = await manager.connect(), await manager.connect()
+
+        await manager.broadcast({"event": "clear", "data": '{"message": "x"}'})
+
+        [frame] = first.pending()
+        assert frame is second.pending()[0]
+        assert parse_frame(frame) == ("clear", {"message": "x"})
+
+    @pytest.mark.asyncio
+    async def test_shutdown_ends_streams(self):
+        stream = await open_events()
+        await stream.__anext__()  # init
+        await stream.__anext__()  # heartbeat
+
+        backend.sse_manager.shutdown()
+        frame = await stream.__anext__()
+        assert parse_frame(frame)[0] == "shutdown"
+        assert frame_retry(frame) >= backend.sse_manager.retry_ms
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        assert not backend.sse_manager.active_connections
+
+    @pytest.mark.asyncio
+    async def test_exit_signal_sends_shutdown_before_draining(self, monkeypatch):
+        monkeypatch.setattr(AppStatus, "should_exit", False)
+        stream = await open_events()
+        await stream.__anext__()  # init
+        await stream.__anext__()  # heartbeat
+
+        server = backend.NotifyHubServer(Config(app))
+        server._loop = asyncio.get_running_loop()
+        server.handle_exit(signal.SIGTERM, None)
+        assert server.should_exit
+        frame = await stream.__anext__()
+        assert parse_frame(frame)[0] == "shutdown"
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+
+    @pytest.mark.asyncio
+    async def test_retry_hints_are_jittered(self):
+        manager = backend.sse_manager
+        hints = []
+        for _ in range(20):
+            stream = await open_events()
+            await stream.__anext__()  # init
+            hints.append(frame_retry(await stream.__anext__()))
+            await stream.aclose()
+        assert all(
+            manager.retry_ms <= hint <= manager.retry_ms + manager.retry_jitter_ms
+            for hint in hints
+        )
+        assert len(set(hints)) > 1
+
+    @pytest.mark.asyncio
+    async def test_reconnect_storm(self, record_property):
+        backend.sse_manager = SSEManager(init_rate=20, init_burst=2)
+        backend.store = NotificationStore(sse_manager=backend.sse_manager, max_count=2000)
+        for i in range(2000):
+            backend.store.add(Notification(message=f"M{i}", pwd=f"/p/{i % 10}"))
+
+        async def reconnect(query):
+            stream = await open_events(query=query)
+            while frame_event(await stream.__anext__()) not in ("init", "init_done"):
+                pass
+            # From when all of them reconnected, queueing included
+            elapsed = time.perf_counter() - t0
+            await stream.aclose()
+            return elapsed
+
+        # Browsers, TUIs and filtered wall displays, 2,000 at once
+        queries = ["init_page=500", "", "pwd=/p/1&init_page=100"]
+        t0 = time.perf_counter()
+        times = sorted(
+            await asyncio.gather(*(reconnect(queries[i % 3]) for i in range(2000)))
+        )
+        p99 = times[int(len(times) * 0.99)]
+        record_property("p99_time_to_init", p99)
+
+        stats = backend.sse_manager.stats()
+        assert stats["snapshots_built"] == len(queries)
+        assert stats["snapshots_reused"] == 2000 - len(queries)
+        # Building every snapshot admitted at the configured rate would take
+        # 2000 / 20 s; shared, they're all out within a fraction of a second
+        assert p99 < 2.0, f"p99 time-to-init {p99:.3f} s"
+
+    @pytest.mark.asyncio
+    async def test_client_that_falls_behind_is_closed(self):
+        backend.sse_manager = SSEManager(buffer_size=2)
+        backend.store = NotificationStore(sse_manager=backend.sse_manager)
+        stream = await open_events()
+        await stream.__anext__()  # init
+        await stream.__anext__()  # heartbeat
+
+        for i in range(3):
+            backend.store.add(Notification(message=f"M{i}"))
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        assert not backend.sse_manager.active_connections
+        assert backend.sse_manager.slow_disconnects == 1
+
+    async def overrun_stream(self, policy):
+        backend.sse_manager = SSEManager(buffer_size=2, slow_consumer_policy=policy)
+        backend.store = NotificationStore(sse_manager=backend.sse_manager)
+        stream = await open_events()
+        await stream.__anext__()  # init
+        await stream.__anext__()  # heartbeat
+        for i in range(5):
+            backend.store.add(Notification(message=f"M{i}"))
+        return stream
+
+    @pytest.mark.asyncio
+    async def test_drop_oldest_policy(self):
+        stream = await self.overrun_stream("drop_oldest")
+
+        received = [parse_frame(await stream.__anext__()) for _ in range(2)]
+        assert [data["data"]["message"] for _, data in received] == ["M3", "M4"]
+        [client] = backend.sse_manager.stats()["clients"]
+        assert (client["lag"], client["dropped"], client["overruns"]) == (0, 3, 1)
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_resync_policy(self):
+        stream = await self.overrun_stream("resync")
+
+        event, items = parse_frame(await stream.__anext__())
+        assert event == "init"
+        assert [i["data"]["message"] for i in items] == [f"M{i}" for i in range(4, -1, -1)]
+        backend.store.add(Notification(message="After"))
+        event, data = parse_frame(await stream.__anext__())
+        assert (event, data["data"]["message"]) == ("notification", "After")
+        assert backend.sse_manager.stats()["clients"][0]["dropped"] == 5
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_heartbeats_are_published_to_idle_streams(self):
+        backend.sse_manager = SSEManager(heartbeat_interval=0.01)
+        stream = await open_events()
+        await stream.__anext__()  # init
+        await stream.__anext__()  # heartbeat on connect
+
+        heartbeats = asyncio.create_task(backend.sse_manager.run_heartbeats())
+        event, data = parse_frame(await asyncio.wait_for(stream.__anext__(), timeout=1))
+        heartbeats.cancel()
+        assert event == "heartbeat"
+        assert "timestamp" in data
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_batch_mode_merges_bursts(self):
+        backend.sse_manager = SSEManager(batch_window=0.05)
+        backend.store = NotificationStore(sse_manager=backend.sse_manager)
+        stream = await open_events(query="batch=1")
+        plain = await backend.sse_manager.connect()
+        await stream.__anext__()  # init
+        await stream.__anext__()  # heartbeat
+
+        backend.store.add(Notification(message="Lone"))
+        event, data = parse_frame(await stream.__anext__())
+        assert (event, data["data"]["message"]) == ("notification", "Lone")
+
+        ids = [backend.store.add(Notification(message=f"M{i}")) for i in range(3)]
+        backend.store.delete_by_id(ids[0])
+        backend.store.add(Notification(message="After delete"))
+        frames = [await stream.__anext__() for _ in range(3)]
+        event, items = parse_frame(frames[0])
+        assert event == "batch"
+        assert [i["data"]["message"] for i in items] == ["M2", "M1", "M0"]
+        assert parse_frame(frames[1])[0] == "delete"
+        assert parse_frame(frames[2])[0] == "notification"
+        assert frame_id(frames[2]) == backend.store.etag
+        assert len(plain.pending()) == 6
+
+        await asyncio.sleep(0.12)
+        backend.store.add(Notification(message="Quiet again"))
+        event, data = parse_frame(await asyncio.wait_for(stream.__anext__(), 0.04))
+        assert data["data"]["message"] == "Quiet again"
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_batch_client_joining_mid_window_gets_no_duplicates(self):
+        backend.sse_manager = SSEManager(batch_window=0.05)
+        backend.store = NotificationStore(sse_manager=backend.sse_manager)
+        first = await backend.sse_manager.connect(batch=True)
+        backend.store.add(Notification(message="Opens window"))
+        backend.store.add(Notification(message="Held"))
+
+        stream = await open_events(query="batch=1")
+        event, items = parse_frame(await stream.__anext__())
+        assert (event, [i["data"]["message"] for i in items]) == (
+            "init",
+            ["Held", "Opens window"],
+        )
+        assert parse_frame(await stream.__anext__())[0] == "heartbeat"
+        backend.store.add(Notification(message="Later"))
+        event, data = parse_frame(await asyncio.wait_for(stream.__anext__(), 0.2))
+        assert (event, data["data"]["message"]) == ("notification", "Later")
+        await stream.aclose()
+
+        # The client already connected still got the held event
+        assert [parse_frame(f)[0] for f in first.pending()] == [
+            "notification",
+            "notification",
+            "notification",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_batch_resync_does_not_repeat_held_events(self):
+        backend.sse_manager = SSEManager(
+            buffer_size=2, slow_consumer_policy="resync", batch_window=0.05
+        )
+        backend.store = NotificationStore(sse_manager=backend.sse_manager)
+        stream = await open_events(query="batch=1")
+        await stream.__anext__()  # init
+        await stream.__anext__()  # heartbeat
+
+        backend.store.add(Notification(message="Opens window"))
+        backend.store.add(Notification(message="Held"))
+        for _ in range(2):
+            event = backend.heartbeat_event()
+            backend.sse_manager.batched.publish(event.frame, event)
+        event, items = parse_frame(await stream.__anext__())
+        assert (event, [i["data"]["message"] for i in items]) == (
+            "init",
+            ["Held", "Opens window"],
+        )
+
+        await asyncio.sleep(0.1)
+        backend.store.add(Notification(message="Later"))
+        event, data = parse_frame(await asyncio.wait_for(stream.__anext__(), 0.2))
+        assert (event, data["data"]["message"]) == ("notification", "Later")
+        await stream.aclose()
+
+    def test_merge_burst(self):
+        store = NotificationStore()
+        store.add(Notification(message="A"), "a")
+        store.add_many([(Notification(message=m), m, None) for m in ("b", "c")])
+        store.add(Notification(message="A again"), "a")
+        events = [
+            Event(c.event, c.data, store.change_id(c.version), c.records)
+            for c in store.changes_since(0)
+        ]
+
+        [merged] = backend.merge_burst(events)
+        event, items = parse_frame(merged.frame)
+        assert event == "batch"
+        assert [i["id"] for i in items] == ["a", "c", "b"]
+        assert [r.id for r in merged.records] == ["a", "c", "b"]
+        assert merged.id == frame_id(merged.frame) == store.etag
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            SSEManager(slow_consumer_policy="ignore")
+
+    def test_clients_endpoint(self, client):
+        subscription = asyncio.run(backend.sse_manager.connect("10.0.0.1:5000"))
+        backend.store.sse_manager = backend.sse_manager
+        backend.store.add(Notification(message="Unread"))
+
+        stats = client.get("/api/sse/clients").json()
+        assert stats["policy"] == "disconnect"
+        assert stats["clients"] == [
+            {
+                "client": "10.0.0.1:5000",
+                "batched": False,
+                "acked": None,
+                "lag": 1,
+                "dropped": 0,
+                "overruns": 0,
+            }
+        ]
+        subscription.close()
+
+
+class TestWebSocket:
+
+    @pytest.fixture
+    def ws_client(self):
+        backend.store.sse_manager = backend.sse_manager
+        with TestClient(app) as client:
+            yield client
+
+    def receive(self, ws, encoding="json"):
+        if encoding == "json":
+            return json.loads(ws.receive_text())
+        return msgpack.unpackb(ws.receive_bytes())
+
+    def test_init_then_notifications(self, ws_client):
+        ws_client.post("/api/notify", json={"data": {"message": "Before"}})
+        with ws_client.websocket_connect("/ws?encoding=json") as ws:
+            init = self.receive(ws)
+            assert init["event"] == "init"
+            assert init["id"] == backend.store.etag
+            assert [i["data"]["message"] for i in init["data"]] == ["Before"]
+            assert self.receive(ws)["event"] == "heartbeat"
+
+            ws_client.post("/api/notify", json={"data": {"message": "After"}})
+            message = self.receive(ws)
+            assert message["event"] == "notification"
+            assert message["data"]["data"]["message"] == "After"
+            assert message["id"] == backend.store.etag
+
+    def test_msgpack(self, ws_client):
+        pytest.importorskip("msgpack")
+        with ws_client.websocket_connect("/ws?encoding=msgpack") as ws:
+            assert self.receive(ws, "msgpack") == {
+                "event": "init",
+                "id": backend.store.etag,
+                "data": [],
+            }
+            assert self.receive(ws, "msgpack")["event"] == "heartbeat"
+            ws.send_bytes(msgpack.packb({"op": "ack", "id": "0-0", "ref": 1}))
+            assert self.receive(ws, "msgpack") == {
+                "event": "reply",
+                "id": None,
+                "data": {"ref": 1, "ok": True},
+            }
+            stats = ws_client.get("/api/sse/clients").json()
+            assert stats["clients"][0]["acked"] == "0-0"
+
+    def test_delete_op(self, ws_client):
+        ws_client.post("/api/notify", json={"data": {"message": "Gone"}})
+        [item] = ws_client.get("/api/notifications").json()
+        with ws_client.websocket_connect("/ws?encoding=json") as ws:
+            self.receive(ws), self.receive(ws)
+            ws.send_text(json.dumps({"op": "delete", "ids": [item["id"], "missing"], "ref": "d"}))
+            messages = {m["event"]: m["data"] for m in (self.receive(ws), self.receive(ws))}
+            assert messages["delete"]["ids"] == [item["id"]]
+            assert messages["reply"] == {"ref": "d", "ok": True, "deleted": [item["id"]]}
+        assert len(backend.store) == 0
+
+    def test_unknown_op(self, ws_client):
+        with ws_client.websocket_connect("/ws?encoding=json") as ws:
+            self.receive(ws), self.receive(ws)
+            ws.send_text(json.dumps({"op": "launch"}))
+            reply = self.receive(ws)["data"]
+            assert reply["ok"] is False
+            assert "launch" in reply["error"]
+
+    def test_filters_and_subscribe_op(self, ws_client):
+        for message, pwd in (("Alpha", "/work/alpha"), ("Beta", "/work/beta")):
+            ws_client.post("/api/notify", json={"data": {"message": message, "pwd": pwd}})
+        with ws_client.websocket_connect("/ws?encoding=json&pwd=/work/alpha") as ws:
+            init = self.receive(ws)
+            assert [i["data"]["message"] for i in init["data"]] == ["Alpha"]
+            self.receive(ws)
+
+            ws.send_text(json.dumps({"op": "subscribe", "pwd": "/work/beta", "ref": 2}))
+            init = self.receive(ws)
+            assert init["event"] == "init"
+            assert [i["data"]["message"] for i in init["data"]] == ["Beta"]
+            assert self.receive(ws)["data"] == {"ref": 2, "ok": True}
+
+            ws_client.post("/api/notify", json={"data": {"message": "A2", "pwd": "/work/alpha"}})
+            ws_client.post("/api/notify", json={"data": {"message": "B2", "pwd": "/work/beta"}})
+            message = self.receive(ws)
+            assert message["data"]["data"]["message"] == "B2"
+
+    def test_subscribe_does_not_repeat_held_events(self, ws_client):
+        backend.sse_manager = SSEManager(batch_window=0.2)
+        backend.store.sse_manager = backend.sse_manager
+        with ws_client.websocket_connect("/ws?encoding=json&batch=1") as ws:
+            self.receive(ws)
+            self.receive(ws)
+            ws_client.post("/api/notify", json={"data": {"message": "Opens window"}})
+            assert self.receive(ws)["event"] == "notification"
+            ws_client.post("/api/notify", json={"data": {"message": "Held"}})
+
+            ws.send_text(json.dumps({"op": "subscribe", "ref": 1}))
+            init = self.receive(ws)
+            assert [i["data"]["message"] for i in init["data"]] == ["Held", "Opens window"]
+            assert self.receive(ws)["data"] == {"ref": 1, "ok": True}
+
+            ws_client.post("/api/notify", json={"data": {"message": "Later"}})
+            message = self.receive(ws)
+            assert (message["event"], message["data"]["data"]["message"]) == (
+                "notification",
+                "Later",
+            )
+
+    def test_unsupported_encoding(self, ws_client):
+        with pytest.raises(WebSocketDisconnect) as e:
+            with ws_client.websocket_connect("/ws?encoding=xml"):
+                pass
+        assert e.value.code == 1008
+
+
+class TestConditionalGet:
+
+    def test_etag_and_not_modified(self, client):
+        client.post("/api/notify", json={"data": {"message": "First"}})
+
+        first = client.get("/api/notifications")
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+        assert first.headers["x-notifications-count"] == "1"
+
+        unchanged = client.get("/api/notifications", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+        assert unchanged.content == b""
+        assert "Accept-Encoding" in unchanged.headers["vary"]
+        gzipped = client.get(
+            "/api/notifications",
+            headers={"If-None-Match": etag, "Accept-Encoding": "gzip"},
+        )
+        assert gzipped.status_code == 304
+
+        client.post("/api/notify", json={"data": {"message": "Second"}})
+        changed = client.get("/api/notifications", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert len(changed.json()) == 2
+
+    def test_version_changes_on_delete_and_clear(self, client):
+        notification_id = client.post(
+            "/api/notify", json={"data": {"message": "First"}}
+        ).json()["id"]
+        versions = [client.head("/api/notifications").headers["x-notifications-version"]]
+
+        client.delete(f"/api/notifications?id={notification_id}")
+        versions.append(client.head("/api/notifications").headers["x-notifications-version"])
+        client.delete("/api/notifications")
+        versions.append(client.head("/api/notifications").headers["x-notifications-version"])
+
+        assert len(set(versions)) == 3
+
+    def test_head_has_no_body(self, client):
+        client.post("/api/notify", json={"data": {"message": "First"}})
+
+        response = client.head("/api/notifications")
+        assert response.status_code == 200
+        assert response.content == b""
+        assert response.headers["x-notifications-count"] == "1"
+
+
+class TestCompression:
+
+    @pytest.fixture(autouse=True)
+    def notifications(self):
+        backend.store.sse_manager = backend.sse_manager
+        for i in range(50):
+            backend.store.add(Notification(message=f"Build {i} finished", pwd="/repo"))
+
+    def test_full_list_is_gzipped(self, client):
+        response = client.get("/api/notifications", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert len(response.json()) == 50
+
+    def test_pages_deflate_and_small_bodies_stay_plain(self, client):
+        deflated = client.get(
+            "/api/notifications?limit=40", headers={"Accept-Encoding": "deflate"}
+        )
+        small = client.get("/api/notifications?limit=1", headers={"Accept-Encoding": "gzip"})
+        plain = client.get("/api/notifications?limit=40", headers={"Accept-Encoding": "identity"})
+
+        assert deflated.headers["content-encoding"] == "deflate"
+        assert deflated.json() == plain.json()
+        assert "content-encoding" not in small.headers
+        assert "content-encoding" not in plain.headers
+
+    def test_disabled(self, client, monkeypatch):
+        monkeypatch.setattr(backend, "_compression_level", 0)
+        response = client.get("/api/notifications", headers={"Accept-Encoding": "gzip"})
+
+        assert "content-encoding" not in response.headers
+
+    @pytest.mark.asyncio
+    async def test_events_stream_flushes_each_event(self):
+        response = await backend.events(make_request({"Accept-Encoding": "gzip"}))
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.ping_interval == 0
+        stream = response.body_iterator
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        event, items = parse_frame(decoder.decompress(await stream.__anext__()))
+        assert (event, len(items)) == ("init", 50)
+        decoder.decompress(await stream.__anext__())  # heartbeat
+        backend.store.add(Notification(message="Live", pwd="/repo"))
+        chunk = await stream.__anext__()
+        event, data = parse_frame(decoder.decompress(chunk))
+        assert (event, data["data"]["message"]) == ("notification", "Live")
+        await stream.aclose()
+        assert not backend.sse_manager.active_connections
+
+
+class TestChangeFeed:
+
+    @pytest.fixture(autouse=True)
+    def broadcasting_store(self):
+        backend.store = NotificationStore(sse_manager=backend.sse_manager)
+
+    @pytest.mark.asyncio
+    async def test_live_events_carry_ids(self):
+        stream = await open_events()
+        init = await stream.__anext__()
+        backend.store.add(Notification(message="Live"))
+        await stream.__anext__()  # heartbeat
+        frame = await stream.__anext__()
+
+        assert frame_id(init) == backend.store.change_id(0)
+        assert frame_id(frame) == backend.store.etag
+        assert parse_frame(frame)[0] == "notification"
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_resume_with_last_event_id_sends_only_missed(self):
+        backend.store.add(Notification(message="Seen"))
+        last_seen = backend.store.etag
+        missed_id = backend.store.add(Notification(message="Missed"))
+        backend.store.delete_by_id(missed_id)
+
+        stream = await open_events({"Last-Event-ID": last_seen})
+        events = [parse_frame(await stream.__anext__()) for _ in range(2)]
+
+        assert events[0][0] == "notification"
+        assert events[0][1]["data"]["message"] == "Missed"
+        assert events[1] == (
+            "delete",
+            {"id": missed_id, "message": f"Notification {missed_id} deleted"},
+        )
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_resume_falls_back_to_snapshot(self):
+        backend.store.change_log_size = 1
+        backend.store.add(Notification(message="First"))
+        too_old = backend.store.change_id(0)
+        backend.store.add(Notification(message="Second"))
+
+        for last_event_id in (too_old, "other-run-5"):
+            stream = await open_events({"Last-Event-ID": last_event_id})
+            event, items = parse_frame(await stream.__anext__())
+            assert event == "init"
+            assert len(items) == 2
+            await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_filtered_stream(self):
+        backend.store.add(Notification(message="Mine [#ci]", pwd="/work/a"))
+        backend.store.add(Notification(message="Elsewhere [#ci]", pwd="/home"))
+        backend.store.add(Notification(message="Untagged", pwd="/work/a"))
+        backend.store.add(Notification(message="Sibling [#ci]", pwd="/workshop"))
+
+        stream = await open_events(query="pwd=/work&tag=%23ci")
+        event, items = parse_frame(await stream.__anext__())
+        assert event == "init"
+        assert [i["data"]["message"] for i in items] == ["Mine [#ci]"]
+        await stream.__anext__()  # heartbeat
+
+        backend.store.add(Notification(message="Skipped", pwd="/home"))
+        backend.store.add_many(
+            [
+                (Notification(message="In [#ci]", pwd="/work/b"), None, None),
+                (Notification(message="Out [#ci]", pwd="/workshop"), None, None),
+            ]
+        )
+        event, items = parse_frame(await stream.__anext__())
+        assert event == "batch"
+        assert [i["data"]["message"] for i in items] == ["In [#ci]"]
+        assert items == [
+            json.loads(backend.store._get_record(items[0]["id"]).item_json())
+        ]
+
+        backend.store.clear_all()
+        assert parse_frame(await stream.__anext__())[0] == "clear"
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_filtered_resume_and_priority(self):
+        last_seen = backend.store.etag
+        backend.store.add(Notification(message="Low", priority=1))
+        backend.store.add(Notification(message="High", priority=5))
+
+        stream = await open_events({"Last-Event-ID": last_seen}, "min_priority=3")
+        event, data = parse_frame(await stream.__anext__())
+        assert (event, data["data"]["message"]) == ("notification", "High")
+        assert parse_frame(await stream.__anext__())[0] == "heartbeat"
+        await stream.aclose()
+
+    def test_invalid_filter(self, client):
+        response = client.get("/events?min_priority=high")
+        assert response.status_code == 400
+
+    def test_changes_endpoint(self, client):
+        since = backend.store.etag
+        first_id = client.post("/api/notify", json={"data": {"message": "First"}}).json()["id"]
+        client.delete(f"/api/notifications?id={first_id}")
+
+        data = client.get(f"/api/notifications/changes?since={since}").json()
+        assert data["reset"] is False
+        assert data["version"] == backend.store.etag
+        assert [c["event"] for c in data["changes"]] == ["notification", "delete"]
+        assert data["changes"][0]["data"]["data"]["message"] == "First"
+
+        caught_up = client.get(f"/api/notifications/changes?since={data['version']}").json()
+        assert caught_up["changes"] == []
+
+    def test_changes_endpoint_reset(self, client):
+        client.post("/api/notify", json={"data": {"message": "First"}})
+
+        data = client.get("/api/notifications/changes?since=other-run-1").json()
+        assert data["reset"] is True
+        assert [n["data"]["message"] for n in data["notifications"]] == ["First"]
+
+        assert client.get("/api/notifications/changes?since=garbage").status_code == 400
+
+
+class TestSearchAPI:
+
+    def test_search(self, client):
+        client.post("/api/notify", json={"data": {"message": "Build failed", "pwd": "/a"}})
+        client.post("/api/notify", json={"data": {"message": "Build passed", "pwd": "/b"}})
+
+        data = client.get("/api/search?q=build").json()
+        assert data["total"] == 2
+        assert [r["data"]["message"] for r in data["results"]] == [
+            "Build passed",
+            "Build failed",
+        ]
+
+        data = client.get("/api/search?q=bui&pwd=/a&limit=1").json()
+        assert data["total"] == 1
+        assert data["results"][0]["data"]["pwd"] == "/a"
+
+        assert client.get("/api/search?q=nothing").json() == {"total": 0, "results": []}
+        assert client.get("/api/search?q=x&limit=0").status_code == 400
+
+
+class TestProjectsAPI:
+
+    def test_projects_and_filtered_list(self, client):
+        for message, pwd in [("A1", "/a"), ("B1", "/b"), ("A2", "/a")]:
+            client.post("/api/notify", json={"data": {"message": message, "pwd": pwd}})
+
+        projects = client.get("/api/projects").json()
+        assert [(p["pwd"], p["count"]) for p in projects] == [("/a", 2), ("/b", 1)]
+        assert set(projects[0]) == {"pwd", "count", "latest"}
+
+        response = client.get("/api/notifications?pwd=/a")
+        assert [n["data"]["message"] for n in response.json()] == ["A2", "A1"]
+        assert response.headers["X-Notifications-Count"] == "2"
+
+        response = client.get("/api/notifications?pwd=/a&limit=1")
+        assert [n["data"]["message"] for n in response.json()] == ["A2"]
+        older = response.headers["X-Next-Cursor"]
+        response = client.get(f"/api/notifications?pwd=/a&limit=1&before={older}")
+        assert [n["data"]["message"] for n in response.json()] == ["A1"]
+        assert client.get("/api/notifications?pwd=/none").json() == []
+
+
+    def test_filtered_by_tag(self, client):
+        client.post("/api/notify", json={"data": {"message": "[#q] One", "pwd": "/a"}})
+        client.post("/api/notify", json={"data": {"message": "Untagged", "pwd": "/a"}})
+        client.post("/api/notify", json={"data": {"message": "[#q] Two", "pwd": "/b"}})
+
+        response = client.get("/api/notifications?tag=q")
+        assert [n["data"]["message"] for n in response.json()] == ["[#q] Two", "[#q] One"]
+        assert response.json()[0]["data"]["tags"] == ["q"]
+        response = client.get("/api/notifications?tag=q&pwd=/a&limit=5")
+        assert [n["data"]["message"] for n in response.json()] == ["[#q] One"]
+        assert response.headers["X-Notifications-Count"] == "1"
+
+
+class TestRetentionAPI:
+
+    def test_notify_with_ttl(self, client):
+        response = client.post(
+            "/api/notify", json={"data": {"message": "Brief"}, "ttl": 0.5}
+        )
+        notification_id = response.json()["id"]
+
+        assert backend.store.expire(now=now_us() + 1_000_000) == [notification_id]
+        assert client.post(
+            "/api/notify", json={"data": {"message": "Bad"}, "ttl": 0}
+        ).status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_sweeper_sends_one_event_per_sweep(self):
+        backend.store = NotificationStore(sse_manager=backend.sse_manager)
+        for i in range(3):
+            backend.store.add(Notification(message=f"M{i}"), ttl=0.01)
+        subscription = await backend.sse_manager.connect()
+
+        sweeper = asyncio.create_task(backend.sweep_expired(0.05))
+        await asyncio.sleep(0.2)
+        sweeper.cancel()
+
+        [frame] = subscription.pending()
+        event, data = parse_frame(frame)
+        assert event == "delete"
+        assert len(data["ids"]) == 3
+        assert len(backend.store) == 0
+
+
+class TestBatchAPI:
+
+    @pytest.fixture
+    def sent(self, monkeypatch):
+        sent = {"telegram": [], "macos": [], "bark": []}
+
+        async def fake_telegram(token, chat_id, text):
+            sent["telegram"].append(text)
+
+        async def fake_bark(device_key, title, body, icon_url, aes_key):
+            sent["bark"].append((title, body))
+
+        monkeypatch.setattr(backend, "_telegram_bot_token", "token")
+        monkeypatch.setattr(backend, "_telegram_chat_id", "chat")
+        monkeypatch.setattr(backend, "_bark_device_key", "device")
+        monkeypatch.setattr(backend, "_bark_aes_key", "key")
+        monkeypatch.setattr(backend, "async_send_telegram_message", fake_telegram)
+        monkeypatch.setattr(backend, "async_send_bark_notification", fake_bark)
+        monkeypatch.setattr(
+            backend,
+            "send_macos_notification",
+            lambda text, pwd: sent["macos"].append((text, pwd)),
+        )
+        return sent
+
+    def test_per_item_ids_and_errors(self, client):
+        response = client.post(
+            "/api/notify/batch",
+            json=[
+                {"data": {"message": "First"}},
+                {"data": {"pwd": "/x"}},
+                "not an object",
+                {"id": "custom", "data": {"message": "Second"}},
+            ],
+        )
+        body = response.json()
+
+        assert response.status_code == 200
+        assert body["success"] is False
+        assert body["accepted"] == 2
+        assert [r["success"] for r in body["results"]] == [True, False, False, True]
+        assert "message" in body["results"][1]["error"]
+        assert body["results"][3]["id"] == "custom"
+        assert [n.message for n in backend.store.notifications] == ["Second", "First"]
+
+    def test_single_batch_event(self, client):
+        subscription = asyncio.run(backend.sse_manager.connect())
+        backend.store.sse_manager = backend.sse_manager
+
+        client.post(
+            "/api/notify/batch",
+            json=[{"data": {"message": f"M{i}"}} for i in range(3)],
+        )
+
+        [frame] = subscription.pending()
+        event, items = parse_frame(frame)
+        assert event == "batch"
+        assert [i["data"]["message"] for i in items] == ["M2", "M1", "M0"]
+
+    def test_too_many_items(self, client, monkeypatch):
+        monkeypatch.setattr(backend, "MAX_BATCH_ITEMS", 2)
+        response = client.post(
+            "/api/notify/batch", json=[{"data": {"message": "x"}}] * 3
+        )
+        assert response.status_code == 413
+
+    def test_fan_out_is_grouped(self, client, sent):
+        client.post(
+            "/api/notify/batch",
+            json=[
+                {"data": {"message": f"Job {i}", "pwd": f"/repo/{i % 2}"}}
+                for i in range(5)
+            ],
+        )
+
+        assert len(sent["telegram"]) == 1
+        assert sent["telegram"][0].count("Job") == 5
+        assert len(sent["macos"]) == 1
+        assert sent["macos"][0][1] is None
+        assert sorted(title for title, _ in sent["bark"]) == ["0", "1"]
+
+    def test_single_notify_fan_out_unchanged(self, client, sent):
+        client.post("/api/notify", json={"data": {"message": "Hi", "pwd": "/a/b"}})
+
+        assert sent["telegram"] == ["/a/b\nHi"]
+        assert sent["macos"] == [("Hi", "/a/b")]
+        assert sent["bark"] == [("b", "Hi")]
+
+    def test_routing_by_parsed_tags(self, client, sent, monkeypatch):
+        monkeypatch.setattr(
+            backend, "_telegram_notify_tags", frozenset({"opencode.question"})
+        )
+        monkeypatch.setattr(backend, "_bark_notify_tags", frozenset({"@USER"}))
+        client.post(
+            "/api/notify/batch",
+            json=[
+                {"data": {"message": "[#opencode.question] Ask"}},
+                {"data": {"message": "Mentions opencode.question"}},
+                {"data": {"message": "Ping", "tags": ["@USER"]}},
+            ],
+        )
+
+        assert sent["telegram"] == ["[#opencode.question] Ask"]
+        assert sent["bark"] == [("NotifyHub", "Ping")]
+
+    def test_coalesced_repeats_are_not_forwarded(self, client, sent):
+        backend.store.coalesce_window = 60
+        for _ in range(3):
+            client.post("/api/notify", json={"data": {"message": "Loop"}})
+        client.post(
+            "/api/notify/batch",
+            json=[{"data": {"message": "Loop"}}, {"data": {"message": "New"}}],
+        )
+
+        assert len(backend.store) == 2
+        assert sent["telegram"] == ["Loop", "New"]
+
+    def test_split_text(self):
+        assert backend._split_text("aaa\nbb\ncccc", 6) == ["aaa\nbb", "cccc"]
+        assert backend._split_text("x" * 7, 3) == ["xxx", "xxx", "x"]
+
+
+class ChunkedRequest:
+    """Stands in for a Request whose body arrives in the given chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+async def ingest_chunks(chunks):
+    return [
+        json.loads(ack) async for ack in backend._ingest_ndjson(ChunkedRequest(chunks))
+    ]
+
+
+class TestStreamIngestAPI:
+
+    def test_endpoint(self, client):
+        response = client.post(
+            "/api/notify/stream",
+            content=b'{"data": {"message": "First"}}\nnot json\n{"data": {"message": "Last"}}',
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        acks = [json.loads(line) for line in response.text.splitlines()]
+
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert acks[-1]["done"] is True
+        assert (acks[-1]["ack"], acks[-1]["accepted"], acks[-1]["rejected"]) == (3, 2, 1)
+        assert [e["line"] for a in acks for e in a["errors"]] == [2]
+        assert [n.message for n in backend.store.notifications] == ["Last", "First"]
+
+    @pytest.mark.asyncio
+    async def test_lines_split_across_chunks(self):
+        acks = await ingest_chunks(
+            [
+                b'{"data": {"message": "First"}}\n{"data": {"mes',
+                b'sage": "Second"}, "id": "custom"}\n\n',
+                b'{"data": {"message": "Last"}}',
+            ]
+        )
+
+        assert acks[-1]["accepted"] == 3
+        assert [n.message for n in backend.store.notifications] == [
+            "Last",
+            "Second",
+            "First",
+        ]
+        assert backend.store.get("custom").message == "Second"
+
+    @pytest.mark.asyncio
+    async def test_periodic_acks(self, monkeypatch):
+        monkeypatch.setattr(backend, "STREAM_ACK_LINES", 2)
+        acks = await ingest_chunks([b'{"data": {"message": "M"}}\n' for _ in range(5)])
+
+        assert [a["ack"] for a in acks] == [2, 4, 5]
+        assert backend.store.version == 5
+
+    @pytest.mark.asyncio
+    async def test_overlong_line_is_skipped(self, monkeypatch):
+        monkeypatch.setattr(backend, "MAX_STREAM_LINE_BYTES", 40)
+        acks = await ingest_chunks(
+            [
+                b'{"data": {"message": "' + b"x" * 30,
+                b"x" * 30,
+                b'"}}\n{"data": {"message": "Kept"}}\n',
+            ]
+        )
+
+        done = acks[-1]
+        assert (done["ack"], done["accepted"], done["rejected"]) == (2, 1, 1)
+        assert "longer than" in done["errors"][0]["error"]
+        assert [n.message for n in backend.store.notifications] == ["Kept"]
@@ -0,0 +1,356 @@
+import json
+import sqlite3
+import pytest
+from fastapi.testclient import TestClient
+from notifyhub.backend.backend import app
+from notifyhub.backend.models import (
+    Notification,
+    NotificationFilter,
+    now_us,
+    to_epoch_us,
+)
+from notifyhub.backend.sqlite_store import SQLiteNotificationStore
+import notifyhub.backend.backend as backend
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "notifications.sqlite3")
+
+
+@pytest.fixture
+def store(db_path):
+    store = SQLiteNotificationStore(db_path)
+    yield store
+    store.close()
+
+
+class TestSQLiteNotificationStore:
+
+    def test_wal_mode_and_indexes(self, store):
+        mode = store._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        indexes = {
+            row[1] for row in store._conn.execute("PRAGMA index_list(notifications)")
+        }
+
+        assert mode == "wal"
+        assert {
+            "idx_notifications_id",
+            "idx_notifications_timestamp",
+            "idx_notifications_pwd",
+        } <= indexes
+
+    def test_add_and_order(self, store):
+        id1 = store.add(Notification(message="First", pwd="/a"))
+        store.add(Notification(message="Second", extra_field=1))
+
+        assert len(store) == 2
+        assert [n.message for n in store.notifications] == ["Second", "First"]
+        assert store.notifications[0].extra_field == 1
+        assert store.notifications[-1].id == id1
+        assert store.get(id1).pwd == "/a"
+        assert store.get("missing") is None
+
+    def test_unlimited_by_default_and_eviction(self, db_path):
+        store = SQLiteNotificationStore(db_path, max_count=2)
+        for i in range(4):
+            store.add(Notification(message=f"Message {i}"))
+
+        assert len(store) == 2
+        assert [n.message for n in store.notifications] == ["Message 3", "Message 2"]
+        store.close()
+        assert SQLiteNotificationStore(db_path).max_notifications is None
+
+    def test_delete_replace_and_clear(self, store):
+        id1 = store.add(Notification(message="First"))
+        store.add(Notification(message="Old"), custom_id="same")
+        store.add(Notification(message="New"), custom_id="same")
+
+        assert [n.message for n in store.notifications] == ["New", "First"]
+        assert store.delete_by_id(id1) is True
+        assert store.delete_by_id(id1) is False
+        assert len(store) == 1
+
+        store.clear_all()
+        assert len(store) == 0
+        assert list(store.notifications) == []
+
+    def test_persists_across_reopen(self, db_path):
+        store = SQLiteNotificationStore(db_path)
+        notification_id = store.add(Notification(message="Durable"))
+        store.close()
+
+        reopened = SQLiteNotificationStore(db_path)
+        assert len(reopened) == 1
+        assert reopened.get(notification_id).message == "Durable"
+        reopened.close()
+
+    def test_iter_items_json_pages_newest_first(self, store, monkeypatch):
+        monkeypatch.setattr("notifyhub.backend.sqlite_store.PAGE_SIZE", 2)
+        for i in range(5):
+            store.add(Notification(message=f"Message {i}"))
+
+        items = [json.loads(item) for item in store.iter_items_json()]
+        assert [item["data"]["message"] for item in items] == [
+            f"Message {i}" for i in range(4, -1, -1)
+        ]
+        assert set(items[0]) == {"id", "data", "timestamp"}
+
+    def test_page_cursors(self, store):
+        for i in range(5):
+            store.add(Notification(message=f"Message {i}"))
+
+        first = store.page(limit=2)
+        second = store.page(limit=2, before=first.older)
+        back = store.page(limit=2, after=second.newer)
+
+        assert [json.loads(i)["data"]["message"] for i in second.items] == [
+            "Message 2",
+            "Message 1",
+        ]
+        assert back.items == first.items
+        assert first.newer is None
+
+    def test_retention_by_bytes_and_expiry(self, db_path):
+        store = SQLiteNotificationStore(db_path)
+        store.add(Notification(message="x" * 100))
+        size = store.total_bytes
+        store.max_bytes = 2 * size
+        store.add(Notification(message="y" * 100))
+        expiring = store.add(Notification(message="z" * 100), ttl=1)
+
+        assert [n.message[0] for n in store.notifications] == ["z", "y"]
+        assert store.total_bytes == 2 * size
+        assert store.expire(now=now_us() + 2_000_000) == [expiring]
+        assert len(store) == 1
+        store.close()
+
+        reopened = SQLiteNotificationStore(db_path, max_age=60)
+        remaining = reopened.notifications[0].id
+        assert reopened.total_bytes == size
+        assert reopened.expire() == []
+        assert reopened.expire(now=now_us() + 61_000_000) == [remaining]
+        reopened.close()
+
+    def test_migrates_database_without_retention_columns(self, db_path):
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "CREATE TABLE notifications (seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " id TEXT NOT NULL, timestamp TEXT NOT NULL, pwd TEXT, data TEXT NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO notifications (id, timestamp, pwd, data) VALUES (?, ?, ?, ?)",
+            ("old", "2020-01-01T00:00:00+00:00", None, '{"message":"Old","pwd":null}'),
+        )
+        conn.commit()
+        conn.close()
+
+        store = SQLiteNotificationStore(db_path, max_age=60)
+        assert store.total_bytes > 0
+        assert store.delete_where(start_us=to_epoch_us("2020-01-01T00:00:00.000001+00:00")) == []
+        assert store.expire() == ["old"]
+        store.close()
+
+    def test_delete_where_timestamps_are_exact_to_the_microsecond(self, store):
+        first = store.add(Notification(message="A", timestamp="2020-01-01T00:00:00.000001+00:00"))
+        second = store.add(Notification(message="B", timestamp="2020-01-01T00:00:00.000002+00:00"))
+        boundary = to_epoch_us("2020-01-01T00:00:00.000002+00:00")
+
+        assert store.delete_where(end_us=boundary) == [first]
+        assert store.delete_where(start_us=boundary) == [second]
+
+    def test_projects(self, db_path):
+        store = SQLiteNotificationStore(db_path, project_max_count=2)
+        quiet = store.add(Notification(message="Quiet", pwd="/quiet"))
+        for i in range(5):
+            store.add(Notification(message=f"Noisy {i}", pwd="/noisy"))
+
+        assert len(store) == 3
+        assert store.get(quiet) is not None
+        assert [(p.pwd, p.count) for p in store.projects()] == [
+            ("/noisy", 2),
+            ("/quiet", 1),
+        ]
+        assert store.count("/noisy") == 2
+        page = store.page(limit=1, pwd="/noisy")
+        assert [json.loads(i)["data"]["message"] for i in page.items] == ["Noisy 4"]
+        rest = store.page(limit=5, before=page.older, pwd="/noisy")
+        assert [json.loads(i)["data"]["message"] for i in rest.items] == ["Noisy 3"]
+        assert rest.older is None
+        assert len(list(store.iter_items_json("/quiet"))) == 1
+        store.close()
+
+    def test_delete_where(self, db_path, monkeypatch):
+        monkeypatch.setattr("notifyhub.backend.sqlite_store.DELETE_IDS_CHUNK", 2)
+        store = SQLiteNotificationStore(db_path)
+        ids = [
+            store.add(
+                Notification(
+                    message=f"M{i}" + (" [#tag:ci]" if i % 2 else ""),
+                    pwd="/a" if i < 4 else "/b",
+                    timestamp=f"2020-01-0{i + 1}T00:00:00+00:00",
+                )
+            )
+            for i in range(6)
+        ]
+        listed = store.add(Notification(message="Listed", tags=["ci"]))
+
+        assert sorted(store.delete_where(pwd="/a", tag="ci")) == sorted([ids[1], ids[3]])
+        assert sorted(store.delete_where(tag="ci")) == sorted([ids[5], listed])
+        assert store.delete_where(
+            start_us=to_epoch_us("2020-01-05T00:00:00+00:00"),
+            end_us=to_epoch_us("2020-01-06T00:00:00+00:00"),
+        ) == [ids[4]]
+        assert sorted(store.delete_where(ids=[ids[0], ids[2], ids[4], "x"])) == sorted(
+            [ids[0], ids[2]]
+        )
+        assert len(store) == 0
+        assert store.total_bytes == 0
+        store.close()
+
+    def test_tags(self, db_path):
+        store = SQLiteNotificationStore(db_path)
+        store.add(Notification(message="Q1 [#question]", pwd="/a"))
+        store.add(Notification(message="Done [#done]", pwd="/a"))
+        q2 = store.add(Notification(message="Q2", tags=["question"], pwd="/b"))
+
+        items = [json.loads(i) for i in store.iter_items_json(tag="question")]
+        assert [i["data"]["message"] for i in items] == ["Q2", "Q1 [#question]"]
+        assert store.count(tag="question") == 2
+        assert store.count(pwd="/a", tag="question") == 1
+        assert json.loads(store.page(limit=1, tag="question").items[0])["data"]["tags"] == [
+            "question"
+        ]
+        store.delete_by_id(q2)
+        assert store.count(tag="question") == 1
+
+        # Databases from before the tag index get it backfilled; a legacy
+        # string ``tags`` field is not a list of tags
+        legacy = store.add(Notification(message="Legacy"))
+        store._conn.execute(
+            "UPDATE notifications SET data = json_set(data, '$.tags', 'abc') WHERE id = ?",
+            (legacy,),
+        )
+        store._conn.execute("DROP TABLE notification_tags")
+        store._conn.commit()
+        store.close()
+        reopened = SQLiteNotificationStore(db_path)
+        assert reopened.count(tag="question") == 1
+        assert reopened.count(tag="a") == 0
+        assert [
+            json.loads(i)["data"]["message"]
+            for i in reopened.iter_items_json_where(NotificationFilter(tags=["a"]))
+        ] == []
+        assert reopened.delete_where(tag="done") != []
+        reopened.close()
+
+    def test_iter_items_json_where(self, store):
+        store.add(Notification(message="A1 [#ci]", pwd="/work/a", priority=1))
+        store.add(Notification(message="B [#ci]", pwd="/home/b", priority=5))
+        store.add(Notification(message="A2 [#ci]", pwd="/work/a2", priority=5))
+
+        def messages(match):
+            items = store.iter_items_json_where(match)
+            return [json.loads(item)["data"]["message"] for item in items]
+
+        assert messages(NotificationFilter("/work")) == ["A2 [#ci]", "A1 [#ci]"]
+        assert messages(NotificationFilter("/work/a")) == ["A1 [#ci]"]
+        assert messages(NotificationFilter(tags=["ci"], min_priority=2)) == [
+            "A2 [#ci]",
+            "B [#ci]",
+        ]
+
+    def test_snapshot(self, store):
+        for i in range(5):
+            store.add(Notification(message=f"M{i}", pwd="/work/a" if i % 2 else "/b"))
+
+        def messages(snapshot):
+            return [json.loads(item)["data"]["message"] for _, item in snapshot]
+
+        seqs = [seq for seq, _ in store.snapshot()]
+        assert messages(store.snapshot(limit=2)) == ["M4", "M3"]
+        assert messages(store.snapshot(after=seqs[2])) == ["M4", "M3"]
+        assert messages(store.snapshot(NotificationFilter("/work/a"), limit=1)) == ["M3"]
+
+        snapshot = store.snapshot()
+        store.add(Notification(message="Later"))
+        assert messages(snapshot)[0] == "M4"
+
+    def test_coalescing(self, db_path):
+        store = SQLiteNotificationStore(db_path, coalesce_window=60)
+        first = store.add(Notification(message="Loop", pwd="/a"))
+        assert store.add(Notification(message="Loop", pwd="/a")) == first
+        assert store.add(Notification(message="Loop", pwd="/a")) == first
+
+        assert len(store) == 1
+        assert store.get(first).count == 3
+        assert json.loads(next(store.iter_items_json()))["data"]["count"] == 3
+        store.close()
+
+    def test_coalescing_keeps_user_count_field(self, db_path):
+        store = SQLiteNotificationStore(db_path, coalesce_window=60)
+        kept = store.add(Notification(message="Mine", count="five"))
+        looped = store.add(Notification(message="Loop", count="six"))
+        assert store.add(Notification(message="Loop", count="six")) == looped
+        store.close()
+
+        store = SQLiteNotificationStore(db_path)
+        assert store.get(kept).count == "five"
+        assert store.get(looped).count == 2
+        store.close()
+
+    def test_search(self, store):
+        first = store.add(Notification(message="Build failed", pwd="/a"))
+        store.add(Notification(message="Build passed", pwd="/b"))
+        store.add(Notification(message="Deploy failed"))
+
+        total, items = store.search("build")
+        assert total == 2
+        assert {json.loads(i)["data"]["message"] for i in items} == {
+            "Build failed",
+            "Build passed",
+        }
+        assert store.search("fail bui")[0] == 1
+        assert store.search("build", pwd="/b")[0] == 1
+        assert store.search("!!!") == (0, [])
+
+        store.delete_by_id(first)
+        assert store.search("build")[0] == 1
+        store.clear_all()
+        assert store.search("failed") == (0, [])
+
+    def test_search_index_backfilled_on_open(self, db_path):
+        store = SQLiteNotificationStore(db_path)
+        store.add(Notification(message="Indexed later"))
+        store._conn.execute("DROP TABLE notifications_fts")
+        store.close()
+
+        reopened = SQLiteNotificationStore(db_path)
+        assert reopened.search("indexed")[0] == 1
+        reopened.close()
+
+
+class TestSQLiteBackedAPI:
+
+    @pytest.fixture(autouse=True)
+    def sqlite_backend(self, store):
+        backend.store = store
+
+    def test_notify_then_list(self):
+        client = TestClient(app)
+        client.post("/api/notify", json={"data": {"message": "First"}})
+        client.post("/api/notify", json={"data": {"message": "Second", "pwd": "/x"}})
+
+        data = client.get("/api/notifications").json()
+        assert [n["data"]["message"] for n in data] == ["Second", "First"]
+        assert data[0]["data"]["pwd"] == "/x"
+
+    def test_delete_by_id(self):
+        client = TestClient(app)
+        notification_id = client.post(
+            "/api/notify", json={"data": {"message": "Test"}}
+        ).json()["id"]
+
+        assert client.delete(f"/api/notifications?id={notification_id}").status_code == 200
+        assert client.get("/api/notifications").json() == []
+